@@ -12,13 +12,78 @@ class _BaseConfig:
     DEBUG = False
     TESTING = False
     SERVER_NAME = "localhost:5000"
+    # (the errors 404 of the API are about resources, not about misspelled URLs)
+    ERROR_404_HELP = False
     DATABASE_URI = "sqlite:///workrooms_booking.db"
+    DATABASE_POOL_SIZE = 5
+    DATABASE_POOL_MAX_OVERFLOW = 10
+    DATABASE_BUSY_TIMEOUT_IN_SECONDS = 5
+    # Duration after which the catalog of rooms (and its search index) is loaded again, to pick up their changes:
+    ROOM_CATALOG_TTL_IN_SECONDS = 300
+    # Endpoints serializing their responses from rows with precompiled serializers, instead of marshalling objects:
+    FAST_SERIALIZATION_ENDPOINTS = frozenset({
+        "list_bookings", "get_booking", "compute_availabilities", "search_free_slots", "list_rooms", "get_room",
+    })
+    # Number of computations of availabilities cached (none: no cache), until a booking changes them or they expire:
+    AVAILABILITY_CACHE_SIZE = 256
+    AVAILABILITY_CACHE_TTL_IN_SECONDS = 300
+    # Number of the latest changes of the bookings kept for the clients following them, the interval between the
+    # heartbeats of their streams, and the duration after which a stream ends (the client resuming it at once):
+    CHANGE_FEED_SIZE = 10000
+    CHANGE_FEED_HEARTBEAT_IN_SECONDS = 15
+    CHANGE_FEED_STREAM_DURATION_IN_SECONDS = 300
+    # Maximum number of streams per process: served by threads of their own, on top of the WORKER_THREADS serving the
+    # other requests, or by coroutines in the asynchronous serving mode (see asgi.py); and the interval between the
+    # reads of the changes journaled by the other processes (see SYNC_INDEXES_BETWEEN_PROCESSES):
+    CHANGE_FEED_MAX_STREAMS = 16
+    CHANGE_FEED_MAX_ASYNC_STREAMS = 1000
+    CHANGE_FEED_POLL_INTERVAL_IN_SECONDS = 1
+    # Measures of the phases of the requests, served at /metrics, and profiling of a sample of the slow requests:
+    INSTRUMENTATION_ENABLED = False
+    PROFILE_SAMPLE_RATE = 0.
+    PROFILE_SLOW_REQUESTS_IN_SECONDS = 0.5
+    PROFILE_DIR = "profiles"
+    # Number of processes serving the API (none: Flask's development server), each with threads serving requests:
+    WORKERS = 0
+    BIND = "localhost:5000"
+    WORKER_THREADS = 4
+    GRACEFUL_TIMEOUT_IN_SECONDS = 30
+    # Whether the writes are journaled for the other processes, and read from them before each lookup of the indexes:
+    SYNC_INDEXES_BETWEEN_PROCESSES = False
+    # Minimum interval between two reads of these changes (the lookups reading the index as it is meanwhile):
+    SYNC_INDEXES_INTERVAL_IN_SECONDS = 0.5
+    # Whether the bookings posted one by one are inserted by batches, in a single writer thread, along with the
+    # maximum size of a batch and the maximum time waited for the next bookings of a batch once it has one:
+    WRITE_QUEUE_ENABLED = False
+    WRITE_BATCH_MAX_SIZE = 64
+    WRITE_BATCH_MAX_WAIT_IN_SECONDS = 0.002
+    # Engine storing the bookings: "sqlite" (the database), or "memory" (for a single process, journaled and
+    # snapshotted in a directory, the rooms and buildings being still read from the database):
+    STORAGE_ENGINE = "sqlite"
+    MEMORY_STORAGE_DIR = "memory_storage"
+    MEMORY_SNAPSHOT_INTERVAL_IN_SECONDS = 300
+    MEMORY_JOURNAL_SYNC = True
 
 
 class _TestConfig(_BaseConfig):
     """Configuration used for integration tests."""
     TESTING = True
     DATABASE_URI = "sqlite:///workrooms_booking_test.db"
+    MEMORY_STORAGE_DIR = "memory_storage_test"
+
+
+class _BenchmarkConfig(_BaseConfig):
+    """Configuration used for benchmarks, on a database seeded with large volumes."""
+    DATABASE_URI = "sqlite:///workrooms_booking_bench.db"
+
+
+class _ProdConfig(_BaseConfig):
+    """Configuration used in production: a pre-forked process per core, sharing the same database."""
+    SERVER_NAME = None
+    BIND = os.environ.get("WORKROOMS_BIND", "0.0.0.0:8000")
+    DATABASE_URI = os.environ.get("WORKROOMS_DATABASE_URI", "sqlite:///workrooms_booking.db")
+    WORKERS = int(os.environ.get("WORKROOMS_WORKERS", os.cpu_count() or 1))
+    SYNC_INDEXES_BETWEEN_PROCESSES = True
 
 
 #
@@ -27,8 +92,9 @@ class _TestConfig(_BaseConfig):
 _configs = {
     "local": _BaseConfig,
     "test": _TestConfig,
+    "bench": _BenchmarkConfig,
     "dev": None,  # TODO
-    "prod": None,  # TODO
+    "prod": _ProdConfig,
 }
 env = os.environ["ENVIRONMENT"]
 if env not in _configs:
@@ -1,6 +1,7 @@
 import os
-from typing import BinaryIO, ClassVar, Optional
-from unittest import TestCase
+import shutil
+from typing import BinaryIO, ClassVar, Dict, List, Optional
+from unittest import TestCase, mock
 
 from flask import Flask
 from flask.testing import FlaskClient
@@ -10,6 +11,15 @@ from configs import config
 from manage_storage import empty_sqlite_db, init_sqlite_db
 
 from app import create_app
+from lib.catalog import room_catalog
+from lib.occupancy import occupancy_index
+from lib.sqlalchemy.session import dispose_engine, remove_current_session
+from lib.storage import close_storages
+
+
+def parse_server_sent_events(body: str) -> List[Dict[str, str]]:
+    """The events of a stream, as dicts of their fields."""
+    return [dict(line.split(": ", 1) for line in message.splitlines()) for message in body.split("\n\n") if message]
 
 
 class IntegrationTest(TestCase):
@@ -25,10 +35,17 @@ class IntegrationTest(TestCase):
 
     def setUp(self) -> None:
         init_sqlite_db()
+        room_catalog.invalidate()
+        occupancy_index.clear()
 
     def tearDown(self) -> None:
+        close_storages()
+        # Close the pooled connections first, so that the write-ahead log is merged and removed along with the file:
+        remove_current_session()
+        dispose_engine()
         empty_sqlite_db()
         os.remove(config.DATABASE_URI.replace("sqlite:///", ""))
+        shutil.rmtree(config.MEMORY_STORAGE_DIR, ignore_errors=True)
 
     def run(self, result=None):
         with self.app.test_client() as test_client:
@@ -44,13 +61,29 @@ class IntegrationTest(TestCase):
             return _namespace_root
 
     def bookings_api_get(self, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
-        return self.test_client.get(self._make_url("bookings", endpoint), follow_redirects=True, **kwargs)
+        return self.test_client.get(self._make_url("booking", endpoint), follow_redirects=True, **kwargs)
 
     def bookings_api_post(self, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
-        return self.test_client.post(self._make_url("bookings", endpoint), follow_redirects=True, **kwargs)
+        return self.test_client.post(self._make_url("booking", endpoint), follow_redirects=True, **kwargs)
 
     def bookings_api_delete(self, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
-        return self.test_client.delete(self._make_url("bookings", endpoint), follow_redirects=True, **kwargs)
+        return self.test_client.delete(self._make_url("booking", endpoint), follow_redirects=True, **kwargs)
 
     def rooms_api_get(self, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
         return self.test_client.get(self._make_url("rooms", endpoint), follow_redirects=True, **kwargs)
+
+    def analytics_api_get(self, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.test_client.get(self._make_url("analytics", endpoint), follow_redirects=True, **kwargs)
+
+    def follow_booking_events(self, **kwargs) -> List[Dict[str, str]]:
+        """The events of a stream of GET /booking/events lasting a fraction of a second, as dicts of their fields."""
+        with mock.patch.multiple(
+            config, CHANGE_FEED_HEARTBEAT_IN_SECONDS=0.05, CHANGE_FEED_STREAM_DURATION_IN_SECONDS=0.1
+        ):
+            response = self.bookings_api_get("/events", **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "text/event-stream")
+            body = response.get_data(as_text=True)
+            # (as the servers do once the stream ends)
+            response.close()
+        return parse_server_sent_events(body)
@@ -0,0 +1,132 @@
+from unittest import mock
+
+import requests
+
+from base import IntegrationTest
+from configs import config
+
+
+class TestApiAnalytics(IntegrationTest):
+    """Test the behaviour of the endpoints of the namespace /analytics."""
+
+    def _book(self, author: str, start_datetime: str, duration_in_hours: int, room_code: str = "room1"):
+        response = self.bookings_api_post(json={
+            "author": author,
+            "start_datetime": start_datetime,
+            "duration_in_hours": duration_in_hours,
+            "room_code": room_code,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json["id"]
+
+    def _utilization(self, **query_string) -> requests.Response:
+        return self.analytics_api_get("/utilization", query_string=query_string)
+
+    #
+    # Tests on the utilization of the rooms (/analytics/utilization):
+    #
+    def test_utilization_should_sum_up_the_booked_hours_per_group(self):
+        self._book("Ada Lovelace", "2020-08-04T10:00:00", 2)
+        self._book("Grace Hopper", "2020-08-04T22:00:00", 4, room_code="room2")
+        self._book("Ada Lovelace", "2020-08-05T09:00:00", 1, room_code="room4")
+
+        response = self._utilization(start_day="2020-08-04", end_day="2020-08-05", group_by="floor")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["floor"], item["rooms"], item["available_hours"], item["booked_hours"]) for item in response.json],
+            [(0, 1, 48, 0), (1, 3, 144, 6), (2, 3, 144, 1), (3, 3, 144, 0)],
+        )
+
+        # (the booking overflowing on the next day only counts its hours of the day)
+        response = self._utilization(start_day="2020-08-04", room_code="room2")
+        self.assertEqual(response.json, [{
+            "building_id": 1,
+            "floor": 1,
+            "room_code": "room2",
+            "rooms": 1,
+            "available_hours": 24,
+            "booked_hours": 2,
+            "utilization_rate": 2 / 24,
+        }])
+
+        response = self._utilization(start_day="2020-08-04", end_day="2020-08-05", group_by="building")
+        self.assertEqual(
+            [(item["building_id"], item["floor"], item["rooms"], item["booked_hours"]) for item in response.json],
+            [(1, None, 10, 7)],
+        )
+
+    def test_utilization_should_follow_the_deletions_and_the_recurring_bookings(self):
+        response = self.bookings_api_post("/recurring", json={
+            "author": "Alan Turing",
+            "start_datetime": "2020-08-03T09:00:00",
+            "duration_in_hours": 2,
+            "room_code": "room1",
+            "frequency": "weekly",
+            "until": "2020-08-31",
+        })
+        recurring_booking_id = response.json["id"]
+        booking_id = self._book("Ada Lovelace", "2020-08-04T10:00:00", 2)
+
+        def booked_hours() -> int:
+            response = self._utilization(start_day="2020-08-01", end_day="2020-08-31", room_code="room1")
+            return response.json[0]["booked_hours"]
+
+        self.assertEqual(booked_hours(), 5 * 2 + 2)
+        self.assertEqual(self.bookings_api_delete(f"/{booking_id}").status_code, 204)
+        self.assertEqual(booked_hours(), 5 * 2)
+        self.assertEqual(self.bookings_api_delete(f"/recurring/{recurring_booking_id}").status_code, 204)
+        self.assertEqual(booked_hours(), 0)
+
+    def test_analytics_should_check_their_inputs(self):
+        self.assertEqual(self._utilization(start_day="2020-08-04", end_day="2020-08-03").status_code, 422)
+        self.assertEqual(self._utilization(start_day="2020-08-04", room_code="nowhere").status_code, 404)
+        self.assertEqual(self._utilization(start_day="2020-08-04", group_by="desk").status_code, 400)
+        self.assertEqual(self._utilization(end_day="2020-08-04").status_code, 400)
+
+    #
+    # Tests on the peak hours (/analytics/peak_hours):
+    #
+    def test_peak_hours_should_count_the_local_hours_of_the_days(self):
+        # (on 2020-10-25, the offset of Paris moves backward: 02:00 happens twice)
+        self._book("Ada Lovelace", "2020-10-24T02:00:00", 1)
+        self._book("Grace Hopper", "2020-10-25T01:00:00", 3)
+
+        response = self.analytics_api_get(
+            "/peak_hours", query_string={"start_day": "2020-10-24", "end_day": "2020-10-25", "room_code": "room1"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 24)
+        self.assertEqual(response.json[:3], [
+            {"hour": 2, "available_hours": 3, "booked_hours": 3, "occupancy_rate": 1.},
+            {"hour": 1, "available_hours": 2, "booked_hours": 1, "occupancy_rate": .5},
+            {"hour": 0, "available_hours": 2, "booked_hours": 0, "occupancy_rate": 0.},
+        ])
+
+    #
+    # Tests on the top authors (/analytics/top_authors):
+    #
+    def test_top_authors_should_rank_the_authors_by_booked_hours(self):
+        self._book("Ada Lovelace", "2020-08-04T10:00:00", 2)
+        self._book("Grace Hopper", "2020-08-04T22:00:00", 4, room_code="room2")
+        self._book("Ada Lovelace", "2020-08-05T09:00:00", 1, room_code="room4")
+
+        response = self.analytics_api_get(
+            "/top_authors", query_string={"start_day": "2020-08-04", "end_day": "2020-08-05"}
+        )
+        self.assertEqual(response.json, [
+            {"author": "Grace Hopper", "bookings": 1, "booked_hours": 4},
+            {"author": "Ada Lovelace", "bookings": 2, "booked_hours": 3},
+        ])
+
+        response = self.analytics_api_get("/top_authors", query_string={"start_day": "2020-08-05", "floor": 1})
+        self.assertEqual(response.json, [{"author": "Grace Hopper", "bookings": 0, "booked_hours": 2}])
+
+
+class TestApiAnalyticsInMemory(TestApiAnalytics):
+    """Test the same endpoints, on the rollups of the in-memory storage engine."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        patcher = mock.patch.object(config, "STORAGE_ENGINE", "memory")
+        patcher.start()
+        self.addCleanup(patcher.stop)
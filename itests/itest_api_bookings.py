@@ -0,0 +1,483 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import json
+from typing import Dict, List
+from unittest import mock
+
+from base import IntegrationTest
+from configs import config
+from lib.availability_cache import availability_cache
+from lib.change_feed import BOOKING_CREATED, change_feed
+from lib.hours import to_epoch_hour
+from lib.occupancy import occupancy_index
+
+
+class TestApiBookings(IntegrationTest):
+    """Test the behaviour of the endpoints of the namespace /booking."""
+
+    def _book(self, start_datetime: str, duration_in_hours: int, room_code: str = "room1"):
+        return self.bookings_api_post(json={
+            "author": "Grace Hopper",
+            "start_datetime": start_datetime,
+            "duration_in_hours": duration_in_hours,
+            "room_code": room_code,
+        })
+
+    #
+    # Tests on booking a room (POST /booking):
+    #
+    def test_booking_a_free_room_should_succeed(self):
+        response = self._book("2020-08-04T09:00:00", 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json["room_code"], "room1")
+        self.assertEqual(response.json["duration_in_hours"], 2)
+        self.assertEqual(response.json["room"]["name"], "Salle Ada Lovelace")
+
+    def test_booking_an_overlapping_period_should_conflict(self):
+        self._book("2020-08-04T09:00:00", 2)
+
+        for start_datetime, duration in (("2020-08-04T10:00:00", 2), ("2020-08-04T08:00:00", 4)):
+            response = self._book(start_datetime, duration)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json["room_code"], "room1")
+
+    def test_booking_adjacent_periods_or_other_rooms_should_succeed(self):
+        self._book("2020-08-04T09:00:00", 2)
+
+        self.assertEqual(self._book("2020-08-04T11:00:00", 1).status_code, 201)
+        self.assertEqual(self._book("2020-08-04T07:00:00", 2).status_code, 201)
+        self.assertEqual(self._book("2020-08-04T09:00:00", 2, room_code="room2").status_code, 201)
+
+    def test_booking_overflowing_on_the_next_day_should_block_it(self):
+        self._book("2020-08-04T22:00:00", 4)
+
+        self.assertEqual(self._book("2020-08-05T01:00:00", 1).status_code, 409)
+        self.assertEqual(self._book("2020-08-05T02:00:00", 1).status_code, 201)
+
+    def test_booking_an_hour_unknown_to_the_index_should_still_conflict(self):
+        # E.g. when the hour was booked by another process:
+        self._book("2020-08-04T09:00:00", 2)
+        occupancy_index.remove("room1", to_epoch_hour(dt.datetime(2020, 8, 4, 7, tzinfo=dt.timezone.utc)), 2)
+
+        response = self._book("2020-08-04T10:00:00", 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json["free_slots"][0]["duration_in_hours"], 9)
+
+    @mock.patch.object(config, "WRITE_QUEUE_ENABLED", True)
+    def test_booking_through_the_write_queue_should_give_each_request_its_own_result(self):
+        def book(start_datetime: str):
+            with self.app.test_client() as test_client:
+                return test_client.post("/booking/", json={
+                    "author": "Grace Hopper",
+                    "start_datetime": start_datetime,
+                    "duration_in_hours": 1,
+                    "room_code": "room1",
+                })
+
+        start_datetimes = ["2020-08-04T09:00:00"] * 4 + [f"2020-08-04T{hour}:00:00" for hour in range(10, 14)]
+        with ThreadPoolExecutor(max_workers=len(start_datetimes)) as executor:
+            responses = list(executor.map(book, start_datetimes))
+
+        self.assertEqual(sorted(response.status_code for response in responses[:4]), [201, 409, 409, 409])
+        self.assertEqual([response.status_code for response in responses[4:]], [201] * 4)
+        self.assertEqual(
+            {response.json["room"]["name"] for response in responses if response.status_code == 201},
+            {"Salle Ada Lovelace"},
+        )
+        conflict = next(response for response in responses if response.status_code == 409)
+        self.assertEqual(conflict.json["free_slots"][0]["duration_in_hours"], 9)
+        self.assertEqual(len(self.bookings_api_get(query_string={"day": "2020-08-04"}).json), 5)
+
+    #
+    # Tests on booking many rooms at once (POST /booking/bulk):
+    #
+    def test_booking_in_bulk_should_report_the_status_of_each_booking(self):
+        self._book("2020-08-04T09:00:00", 2)
+
+        response = self.bookings_api_post("/bulk", json={"bookings": [
+            {"author": "A", "start_datetime": "2020-08-04T11:00:00", "duration_in_hours": 2, "room_code": "room1"},
+            {"author": "B", "start_datetime": "2020-08-04T10:00:00", "duration_in_hours": 1, "room_code": "room1"},
+            {"author": "C", "start_datetime": "2020-08-04T12:00:00", "duration_in_hours": 1, "room_code": "room1"},
+            {"author": "D", "start_datetime": "2020-08-04T12:00:00", "duration_in_hours": 1, "room_code": "room2"},
+            {"author": "E", "start_datetime": "2020-08-04T12:00:00", "duration_in_hours": 1, "room_code": "nowhere"},
+            {"author": "F", "start_datetime": "2020-08-04T12:30:00", "duration_in_hours": 1, "room_code": "room3"},
+            {"author": "G", "start_datetime": "2020-08-04T12:00:00", "room_code": "room3"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["status"] for item in response.json], [201, 409, 409, 201, 404, 422, 400])
+        self.assertEqual(response.json[3]["booking"]["author"], "D")
+        self.assertIsNone(response.json[1]["booking"])
+
+        response = self.bookings_api_get(query_string={"day": "2020-08-04"})
+        self.assertEqual(sorted(item["author"] for item in response.json), ["A", "D", "Grace Hopper"])
+
+    def test_booking_in_bulk_without_a_list_should_fail(self):
+        response = self.bookings_api_post("/bulk", json={"bookings": "room1"})
+        self.assertEqual(response.status_code, 400)
+
+    #
+    # Tests on recurring bookings (/booking/recurring):
+    #
+    def _book_weekly(self, start_datetime: str, duration_in_hours: int, until: str, room_code: str = "room1"):
+        return self.bookings_api_post("/recurring", json={
+            "author": "Alan Turing",
+            "start_datetime": start_datetime,
+            "duration_in_hours": duration_in_hours,
+            "room_code": room_code,
+            "frequency": "weekly",
+            "until": until,
+        })
+
+    def test_recurring_booking_should_block_its_occurrences_only(self):
+        response = self._book_weekly("2020-08-03T09:00:00", 2, until="2021-08-02")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json["frequency"], "weekly")
+
+        self.assertEqual(self._book("2021-03-01T10:00:00", 1).status_code, 409)
+        self.assertEqual(self._book("2021-03-02T10:00:00", 1).status_code, 201)
+        self.assertEqual(self._book("2021-08-09T10:00:00", 1).status_code, 201)
+
+        response = self.bookings_api_post(
+            "/compute-availabilities",
+            json={"target_day": "2020-08-10", "room_code": "room1"},
+        )
+        self.assertEqual([slot["duration_in_hours"] for slot in response.json[0]["free_slots"]], [9, 13])
+
+    def test_recurring_booking_overlapping_bookings_should_conflict(self):
+        self._book("2020-12-07T10:00:00", 1)
+
+        self.assertEqual(self._book_weekly("2020-08-03T09:00:00", 2, until="2021-08-02").status_code, 409)
+        self.assertEqual(self._book_weekly("2020-08-03T11:00:00", 2, until="2021-08-02").status_code, 201)
+        self.assertEqual(self._book_weekly("2020-08-10T12:00:00", 1, until="2020-09-01").status_code, 409)
+
+    def test_listing_bookings_should_include_the_occurrences_of_the_day(self):
+        recurring_booking_id = self._book_weekly("2020-08-03T09:00:00", 2, until="2021-08-02").json["id"]
+        self._book("2020-08-10T08:00:00", 1)
+
+        response = self.bookings_api_get(query_string={"day": "2020-08-10"})
+        self.assertEqual([item["recurring_booking_id"] for item in response.json], [None, recurring_booking_id])
+        self.assertEqual(response.json[1]["start_datetime"], "2020-08-10T09:00:00+02:00")
+
+        self.assertEqual(self.bookings_api_delete(f"/recurring/{recurring_booking_id}").status_code, 204)
+        self.assertEqual(len(self.bookings_api_get(query_string={"day": "2020-08-10"}).json), 1)
+        self.assertEqual(self._book("2020-08-17T09:00:00", 2).status_code, 201)
+
+    #
+    # Tests on listing bookings (GET /booking):
+    #
+    def test_listing_bookings_should_filter_them_by_day_and_author(self):
+        self._book("2020-08-03T23:00:00", 1)
+        self._book("2020-08-04T00:00:00", 1)
+        self._book("2020-08-04T23:00:00", 1)
+        self._book("2020-08-05T00:00:00", 1)
+
+        response = self.bookings_api_get(query_string={"day": "2020-08-04"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["start_datetime"] for item in response.json],
+            ["2020-08-04T00:00:00+02:00", "2020-08-04T23:00:00+02:00"],
+        )
+
+        response = self.bookings_api_get(query_string={"day": "2020-08-04", "author": "Ada Lovelace"})
+        self.assertEqual(response.json, [])
+
+    def test_listing_bookings_over_a_reversed_range_should_fail(self):
+        response = self.bookings_api_get(query_string={"day": "2020-08-05", "end_day": "2020-08-03"})
+        self.assertEqual(response.status_code, 422)
+
+    def test_listing_bookings_without_a_day_should_list_those_of_today(self):
+        today = dt.date.today().isoformat()
+        self._book(f"{today}T12:00:00", 1)
+
+        for query_string in ({}, {"room_code": "room1"}, {"format": "ndjson"}):
+            response = self.bookings_api_get(query_string=query_string)
+            self.assertEqual(response.status_code, 200, query_string)
+            self.assertIn(f"{today}T12:00:00", response.get_data(as_text=True), query_string)
+
+    def test_listing_bookings_page_by_page_should_follow_the_cursor(self):
+        recurring_booking_id = self._book_weekly("2020-08-03T12:00:00", 1, until="2020-08-31").json["id"]
+        for hour in (9, 10, 11, 13):
+            self._book(f"2020-08-04T{hour:02}:00:00", 1)
+            self._book(f"2020-08-04T{hour:02}:00:00", 1, room_code="room2")
+        query_string = {"day": "2020-08-03", "end_day": "2020-08-04", "limit": 4}
+
+        pages = []
+        response = self.bookings_api_get(query_string=query_string)
+        pages.append(response.json)
+        while "X-Next-Cursor" in response.headers:
+            response = self.bookings_api_get(query_string={**query_string, "cursor": response.headers["X-Next-Cursor"]})
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json)
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        items = [item for page in pages for item in page]
+        self.assertEqual(items[0]["recurring_booking_id"], recurring_booking_id)
+        self.assertEqual(
+            [item["start_datetime"][11:13] for item in items],
+            ["12", "09", "09", "10", "10", "11", "11", "13", "13"],
+        )
+
+        self.assertEqual(self.bookings_api_get(query_string={"cursor": "not-a-cursor"}).status_code, 400)
+        self.assertEqual(self.bookings_api_get(query_string={"limit": 1001}).status_code, 400)
+
+    def test_streaming_bookings_should_yield_one_json_object_per_line(self):
+        for hour in (9, 10, 11):
+            self._book(f"2020-08-04T{hour:02}:00:00", 1)
+
+        response = self.bookings_api_get(query_string={"day": "2020-08-04", "format": "ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(
+            [json.loads(line)["start_datetime"] for line in lines],
+            ["2020-08-04T09:00:00+02:00", "2020-08-04T10:00:00+02:00", "2020-08-04T11:00:00+02:00"],
+        )
+
+    #
+    # Tests on deleting a booking (DELETE /booking/<id>):
+    #
+    def test_deleting_a_booking_should_release_its_period(self):
+        booking_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+
+        response = self.bookings_api_delete(f"/{booking_id}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self._book("2020-08-04T10:00:00", 2).status_code, 201)
+
+    #
+    # Tests on computing availabilities (POST /booking/compute-availabilities):
+    #
+    def test_conflicting_booking_should_return_the_free_slots_of_the_day(self):
+        self._book("2020-08-04T09:00:00", 2)
+        self._book("2020-08-04T14:00:00", 1)
+
+        response = self._book("2020-08-04T10:00:00", 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json["free_slots"], [
+            {"start_datetime": "2020-08-04T00:00:00+02:00", "duration_in_hours": 9},
+            {"start_datetime": "2020-08-04T11:00:00+02:00", "duration_in_hours": 3},
+            {"start_datetime": "2020-08-04T15:00:00+02:00", "duration_in_hours": 9},
+        ])
+
+    def test_computing_availabilities_over_a_range_of_days_should_succeed(self):
+        self._book("2020-08-04T22:00:00", 4)
+
+        response = self.bookings_api_post(
+            "/compute-availabilities",
+            json={"start_day": "2020-08-03", "end_day": "2020-08-05", "floor": 1},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["room_code"] for item in response.json], ["room1", "room2", "room3"])
+        self.assertEqual(response.json[0]["free_slots"], [
+            {"start_datetime": "2020-08-03T00:00:00+02:00", "duration_in_hours": 24},
+            {"start_datetime": "2020-08-04T00:00:00+02:00", "duration_in_hours": 22},
+            {"start_datetime": "2020-08-05T02:00:00+02:00", "duration_in_hours": 22},
+        ])
+        self.assertEqual(len(response.json[1]["free_slots"]), 3)
+
+    def test_availabilities_read_before_bookings_and_deletions_should_be_kept_up_to_date(self):
+        def free_slots():
+            response = self.bookings_api_post(
+                "/compute-availabilities",
+                json={"start_day": "2020-08-04", "end_day": "2020-08-05", "room_code": "room1"},
+            )
+            return [(slot["start_datetime"][:13], slot["duration_in_hours"]) for slot in response.json[0]["free_slots"]]
+
+        self.assertEqual(free_slots(), [("2020-08-04T00", 24), ("2020-08-05T00", 24)])
+        first_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+        second_id = self._book("2020-08-04T22:00:00", 4).json["id"]
+        self.assertEqual(free_slots(), [
+            ("2020-08-04T00", 9), ("2020-08-04T11", 11), ("2020-08-05T02", 22),
+        ])
+        self._book("2020-08-04T11:00:00", 1)
+        self.bookings_api_delete(f"/{first_id}")
+        self.bookings_api_delete(f"/{second_id}")
+        self.assertEqual(free_slots(), [("2020-08-04T00", 11), ("2020-08-04T12", 12), ("2020-08-05T00", 24)])
+
+    def test_cached_availabilities_should_be_invalidated_by_the_bookings_of_their_rooms_and_days(self):
+        payload = {"start_day": "2020-08-04", "end_day": "2020-08-05", "floor": 1}
+        stats = availability_cache.stats()
+        first = self.bookings_api_post("/compute-availabilities", json=payload)
+        self.assertEqual(self.bookings_api_post("/compute-availabilities", json=payload).json, first.json)
+        self.assertEqual(availability_cache.stats()["hits"], stats["hits"] + 1)
+
+        # The client already has unchanged availabilities:
+        etag_headers = {"If-None-Match": first.headers["ETag"]}
+        response = self.bookings_api_post("/compute-availabilities", json=payload, headers=etag_headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+
+        # A booking of another floor, or another day, keeps them; a booking of one of the rooms changes them:
+        self._book("2020-08-04T09:00:00", 2, room_code="room4")
+        self._book("2020-08-06T09:00:00", 2, room_code="room1")
+        response = self.bookings_api_post("/compute-availabilities", json=payload, headers=etag_headers)
+        self.assertEqual(response.status_code, 304)
+        self._book("2020-08-05T09:00:00", 2, room_code="room2")
+        response = self.bookings_api_post("/compute-availabilities", json=payload, headers=etag_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(len(response.json[1]["free_slots"]), 3)
+
+    def test_computing_availabilities_on_days_changing_offset_should_count_their_actual_hours(self):
+        # (the 29th of March lasts 23 hours in Paris, and the 25th of October, 25 hours)
+        self._book("2020-10-25T01:00:00+02:00", 2)
+        self._book("2020-10-25T02:00:00+01:00", 1)
+
+        def free_slots(day: str) -> List[Dict]:
+            response = self.bookings_api_post("/compute-availabilities", json={"target_day": day, "room_code": "room1"})
+            return response.json[0]["free_slots"]
+
+        self.assertEqual(free_slots("2020-03-29"), [
+            {"start_datetime": "2020-03-29T00:00:00+01:00", "duration_in_hours": 23},
+        ])
+        self.assertEqual(free_slots("2020-10-25"), [
+            {"start_datetime": "2020-10-25T00:00:00+02:00", "duration_in_hours": 1},
+            {"start_datetime": "2020-10-25T03:00:00+01:00", "duration_in_hours": 21},
+        ])
+
+    def test_booking_the_repeated_hour_of_a_day_changing_offset_should_not_conflict_with_the_first_one(self):
+        self.assertEqual(self._book("2020-10-25T02:00:00+02:00", 1).status_code, 201)
+        self.assertEqual(self._book("2020-10-25T02:00:00+02:00", 1).status_code, 409)
+        self.assertEqual(self._book("2020-10-25T02:00:00+01:00", 1).status_code, 201)
+        self.assertEqual(self._book("2020-10-25T01:30:00+00:30", 1).status_code, 422)
+
+    def test_computing_availabilities_without_a_day_should_compute_those_of_today(self):
+        response = self.bookings_api_post("/compute-availabilities", json={"room_code": "room1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json[0]["free_slots"][0]["start_datetime"][:10], dt.date.today().isoformat())
+
+    def test_computing_availabilities_over_a_reversed_range_should_fail(self):
+        response = self.bookings_api_post(
+            "/compute-availabilities",
+            json={"start_day": "2020-08-05", "end_day": "2020-08-03"},
+        )
+        self.assertEqual(response.status_code, 422)
+
+    #
+    # Tests on searching free slots (POST /booking/search):
+    #
+    def _search(self, **payload):
+        return self.bookings_api_post("/search", json=payload)
+
+    def test_searching_free_slots_should_return_the_earliest_first_fitting_starts(self):
+        self._book("2020-08-04T00:00:00", 10)
+        self._book("2020-08-04T12:00:00", 1)
+        self._book("2020-08-04T15:00:00", 9)
+
+        response = self._search(duration_in_hours=2, start_day="2020-08-04", end_day="2020-08-05", floor=1, limit=4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [
+            {"room_code": "room2", "capacity": 20, "start_datetime": "2020-08-04T00:00:00+02:00"},
+            {"room_code": "room3", "capacity": 18, "start_datetime": "2020-08-04T00:00:00+02:00"},
+            {"room_code": "room1", "capacity": 12, "start_datetime": "2020-08-04T10:00:00+02:00"},
+            {"room_code": "room1", "capacity": 12, "start_datetime": "2020-08-04T13:00:00+02:00"},
+        ])
+
+    def test_searching_free_slots_should_rank_the_smallest_fitting_rooms_first(self):
+        self.bookings_api_post("/recurring", json={
+            "author": "Alan Turing",
+            "start_datetime": "2020-08-03T08:00:00",
+            "duration_in_hours": 12,
+            "room_code": "room7",
+            "frequency": "daily",
+            "until": "2020-12-28",
+        })
+
+        response = self._search(
+            duration_in_hours=20, start_day="2020-08-03", end_day="2020-09-30", min_capacity=10, floor=3,
+            limit=3, order_by="smallest_room",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item["room_code"], item["start_datetime"]) for item in response.json], [
+            ("room8", "2020-08-03T00:00:00+02:00"),
+            ("room9", "2020-08-03T00:00:00+02:00"),
+        ])
+
+    def test_searching_free_slots_should_reach_the_following_chunks_of_the_window(self):
+        self.bookings_api_post("/recurring", json={
+            "author": "Alan Turing",
+            "start_datetime": "2020-08-03T00:00:00",
+            "duration_in_hours": 24,
+            "room_code": "room9",
+            "frequency": "daily",
+            "until": "2020-08-12",
+        })
+
+        response = self._search(
+            duration_in_hours=25, start_day="2020-08-03", end_day="2020-08-31", min_capacity=40, limit=3
+        )
+        self.assertEqual([(item["room_code"], item["start_datetime"]) for item in response.json], [
+            ("room0", "2020-08-03T00:00:00+02:00"),
+            ("room9", "2020-08-13T00:00:00+02:00"),
+        ])
+
+    def test_searching_free_slots_with_an_invalid_duration_should_fail(self):
+        self.assertEqual(self._search(duration_in_hours=26).status_code, 422)
+
+    #
+    # Tests on following the changes of the bookings (GET /booking/events):
+    #
+    def test_following_events_should_resume_after_the_last_one_with_the_matching_changes(self):
+        last_event_id = change_feed.last_id
+        booking_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+        self._book("2020-08-04T09:00:00", 2, room_code="room4")
+        self._book("2020-08-06T09:00:00", 2)
+        self.bookings_api_delete(f"/{booking_id}")
+
+        events = self.follow_booking_events(
+            query_string={"floor": 1, "start_day": "2020-08-03", "end_day": "2020-08-05"},
+            headers={"Last-Event-ID": str(last_event_id)},
+        )
+        self.assertEqual(
+            [(event["event"], json.loads(event["data"])["id"]) for event in events if "event" in event],
+            [("booking_created", booking_id), ("booking_deleted", booking_id)],
+        )
+        self.assertEqual(json.loads(events[0]["data"])["start_datetime"], "2020-08-04T09:00:00+02:00")
+        # (the heartbeats move the id of the client past the last change)
+        self.assertEqual(events[-1], {"id": str(last_event_id + 4)})
+
+    def test_following_events_should_skip_the_rooms_removed_from_the_catalog(self):
+        last_event_id = change_feed.last_id
+        change_feed.publish(BOOKING_CREATED, 1000, "Ada Lovelace", "removed_room", 443480, 2)
+        booking_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+
+        events = self.follow_booking_events(query_string={"floor": 1}, headers={"Last-Event-ID": str(last_event_id)})
+        self.assertEqual([json.loads(event["data"])["id"] for event in events if "event" in event], [booking_id])
+
+    def test_following_events_after_a_lost_one_should_reset_the_client(self):
+        events = self.follow_booking_events(query_string={"last_event_id": change_feed.last_id + 1})
+        self.assertEqual(events[0]["event"], "reset")
+        self.assertEqual(events[0]["id"], str(change_feed.last_id))
+
+    def test_following_events_should_be_refused_beyond_the_maximum_number_of_streams(self):
+        with mock.patch.object(config, "CHANGE_FEED_MAX_STREAMS", 0):
+            response = self.bookings_api_get("/events")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], str(config.CHANGE_FEED_HEARTBEAT_IN_SECONDS))
+
+        # (a stream gives its place back once closed)
+        with mock.patch.object(config, "CHANGE_FEED_MAX_STREAMS", 1):
+            self.follow_booking_events()
+            self.follow_booking_events()
+
+    #
+    # Tests on the serialization of responses:
+    #
+    def test_serializing_from_rows_should_produce_the_same_json_as_marshalling(self):
+        booking_id = self._book("2020-08-04T22:00:00", 4).json["id"]
+        self._book("2020-08-04T09:00:00", 2, room_code="room2")
+        self._book_weekly("2020-08-03T12:00:00", 1, until="2020-08-31")
+        requests = [
+            lambda: self.bookings_api_get(query_string={"day": "2020-08-04"}),
+            lambda: self.bookings_api_get(query_string={"day": "2020-08-04", "format": "ndjson"}),
+            lambda: self.bookings_api_get(f"/{booking_id}"),
+            lambda: self.bookings_api_post(
+                "/compute-availabilities", json={"start_day": "2020-08-04", "end_day": "2020-08-05"}
+            ),
+            lambda: self.bookings_api_post(
+                "/search", json={"duration_in_hours": 3, "start_day": "2020-08-04", "order_by": "smallest_room"}
+            ),
+        ]
+
+        fast_responses = [request().get_data(as_text=True) for request in requests]
+        with mock.patch.object(config, "FAST_SERIALIZATION_ENDPOINTS", frozenset()):
+            marshalled_responses = [request().get_data(as_text=True) for request in requests]
+        self.assertEqual(fast_responses, marshalled_responses)
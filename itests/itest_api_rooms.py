@@ -1,4 +1,9 @@
+import sqlite3
+import time
+from unittest import mock
+
 from base import IntegrationTest
+from configs import config
 
 
 class TestApiRooms(IntegrationTest):
@@ -16,6 +21,33 @@ class TestApiRooms(IntegrationTest):
         response_room_codes = [item["code"] for item in response.json]
         self.assertEqual(response_room_codes, expected_room_codes)
 
+    def test_searching_rooms_by_name_should_rank_the_matches(self):
+        response = self.rooms_api_get(query_string={"search_in_name": "HÂ"})
+        self.assertEqual([item["code"] for item in response.json], ["room8", "room3"])
+
+        response = self.rooms_api_get(query_string={"search_in_name": "salle", "limit": 2})
+        self.assertEqual([item["code"] for item in response.json], ["room1", "room2"])
+
+    def test_searching_rooms_should_combine_the_filters(self):
+        response = self.rooms_api_get(query_string={"search_in_name": "on", "floor": 3, "min_capacity": 12})
+        self.assertEqual([item["code"] for item in response.json], ["room9"])
+
+        response = self.rooms_api_get(query_string={"floor": 2, "min_capacity": 20})
+        self.assertEqual([item["code"] for item in response.json], ["room4", "room5"])
+
+    def test_searching_rooms_should_find_the_changed_rooms_once_the_catalog_expires(self):
+        self.assertEqual(self.rooms_api_get(query_string={"search_in_name": "turing"}).json, [])
+        connection = sqlite3.connect(config.DATABASE_URI.replace("sqlite:///", ""))
+        connection.execute("INSERT INTO rooms VALUES ('room10', 1, 'Salle Alan Turing', 4, 8);")
+        connection.commit()
+        connection.close()
+
+        self.assertEqual(self.rooms_api_get(query_string={"search_in_name": "turing"}).json, [])
+        expired_time = time.monotonic() + config.ROOM_CATALOG_TTL_IN_SECONDS
+        with mock.patch("lib.catalog.time.monotonic", return_value=expired_time):
+            response = self.rooms_api_get(query_string={"search_in_name": "turing"})
+        self.assertEqual([item["code"] for item in response.json], ["room10"])
+
     #
     # Tests on GETting one room (/rooms/<code>):
     #
@@ -32,4 +64,13 @@ class TestApiRooms(IntegrationTest):
         self.assertEqual(response.status_code, 200)
         self.assertDictEqual(expected_room_data, response.json)
 
+    #
+    # Tests on the serialization of responses:
+    #
+    def test_serializing_from_rows_should_produce_the_same_json_as_marshalling(self):
+        requests = [lambda: self.rooms_api_get(query_string={"floor": 1}), lambda: self.rooms_api_get("/room2")]
 
+        fast_responses = [request().get_data(as_text=True) for request in requests]
+        with mock.patch.object(config, "FAST_SERIALIZATION_ENDPOINTS", frozenset()):
+            marshalled_responses = [request().get_data(as_text=True) for request in requests]
+        self.assertEqual(fast_responses, marshalled_responses)
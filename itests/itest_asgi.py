@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from unittest import TestCase, mock
+
+import requests
+
+from base import IntegrationTest, parse_server_sent_events
+from configs import config
+
+from asgi import create_asgi_app
+from lib.async_db import async_pool
+from lib.catalog import room_catalog
+from lib.change_feed import change_feed
+from lib.storage.sql import SqlStorage
+
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestAsgi(IntegrationTest):
+    """Test the asynchronous serving mode against the synchronous one, which it must mimic."""
+
+    def _book(self, start_datetime: str, duration_in_hours: int, room_code: str = "room1"):
+        return self.bookings_api_post(json={
+            "author": "Grace Hopper",
+            "start_datetime": start_datetime,
+            "duration_in_hours": duration_in_hours,
+            "room_code": room_code,
+        })
+
+    def _asgi_requests(
+        self, requests: List[Tuple[str, str, str, Optional[Any]]], connected_seconds: Optional[float] = None
+    ) -> List[Tuple[int, Dict, bytes]]:
+        """
+        Send the (method, path, query string, JSON payload) requests in turn, between startup and shutdown, each client
+        staying connected until its response is complete, or for this duration at most.
+        """
+        asgi_app = create_asgi_app()
+
+        async def request(method: str, path: str, query_string: str, payload: Any) -> Tuple[int, Dict, bytes]:
+            body = json.dumps(payload).encode() if payload is not None else b""
+            messages = []
+            received = []
+
+            async def receive():
+                if received:
+                    await (asyncio.sleep(connected_seconds) if connected_seconds is not None else asyncio.Future())
+                    return {"type": "http.disconnect"}
+                received.append(body)
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            await asgi_app({
+                "type": "http",
+                "http_version": "1.1",
+                "method": method,
+                "scheme": "http",
+                "path": path,
+                "root_path": "",
+                "query_string": query_string.encode(),
+                "headers": [
+                    (b"host", b"localhost:5000"),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+                "server": ("localhost", 5000),
+                "client": ("127.0.0.1", 12345),
+            }, receive, send)
+            start = messages[0]
+            headers = {name.decode().lower(): value.decode() for name, value in start["headers"]}
+            return start["status"], headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+        async def run():
+            lifespan_messages = asyncio.Queue()
+            lifespan_messages.put_nowait({"type": "lifespan.startup"})
+            sent = asyncio.Queue()
+            lifespan = asyncio.ensure_future(
+                asgi_app({"type": "lifespan"}, lifespan_messages.get, sent.put)
+            )
+            self.assertEqual((await sent.get())["type"], "lifespan.startup.complete")
+            responses = [await request(*args) for args in requests]
+            lifespan_messages.put_nowait({"type": "lifespan.shutdown"})
+            await lifespan
+            return responses
+
+        return asyncio.run(run())
+
+    def test_listing_bookings_should_return_the_same_pages_and_streams(self):
+        for hour in (9, 10, 11, 13):
+            self._book(f"2020-08-04T{hour:02}:00:00", 1)
+            self._book(f"2020-08-04T{hour:02}:00:00", 1, room_code="room2")
+        self.bookings_api_post("/recurring", json={
+            "author": "Alan Turing",
+            "start_datetime": "2020-08-03T12:00:00",
+            "duration_in_hours": 1,
+            "room_code": "room1",
+            "frequency": "daily",
+            "until": "2020-08-31",
+        })
+        query_strings = [
+            "day=2020-08-04&limit=3",
+            "day=2020-08-04&room_code=room2",
+            "day=2020-08-03&end_day=2020-08-05&format=ndjson&limit=6",
+            "day=2020-08-04&format=ndjson",
+            "day=2020-08-04&limit=0",
+            "cursor=invalid",
+        ]
+
+        responses = self._asgi_requests([("GET", "/booking/", query_string, None) for query_string in query_strings])
+        for query_string, (status, headers, body) in zip(query_strings, responses):
+            expected = self.test_client.get("/booking/?" + query_string)
+            self.assertEqual(status, expected.status_code, query_string)
+            self.assertEqual(body, expected.get_data(), query_string)
+            self.assertEqual(headers.get("x-next-cursor"), expected.headers.get("X-Next-Cursor"), query_string)
+
+    def test_computing_availabilities_should_return_the_same_slots(self):
+        self._book("2020-08-04T22:00:00", 4)
+        payloads = [
+            {"target_day": "2020-08-05", "room_code": "room1"},
+            {"start_day": "2020-08-04", "end_day": "2020-08-06", "floor": 1},
+            {"target_day": "2020-08-05", "room_code": "unknown"},
+            {"start_day": "2020-08-05", "end_day": "2020-08-03"},
+        ]
+
+        responses = self._asgi_requests(
+            [("POST", "/booking/compute-availabilities", "", payload) for payload in payloads]
+        )
+        for payload, (status, _, body) in zip(payloads, responses):
+            expected = self.bookings_api_post("/compute-availabilities", json=payload)
+            self.assertEqual(status, expected.status_code, payload)
+            self.assertEqual(body, expected.get_data(), payload)
+
+    def test_computing_availabilities_should_read_the_occupancy_index_loaded_at_startup(self):
+        self._book("2020-08-05T09:00:00", 2)
+        payload = {"target_day": "2020-08-05", "room_code": "room1"}
+
+        with mock.patch.object(async_pool, "fetch_all", wraps=async_pool.fetch_all) as fetch_all:
+            ((status, _, body),) = self._asgi_requests([("POST", "/booking/compute-availabilities", "", payload)])
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.bookings_api_post("/compute-availabilities", json=payload).get_data())
+        fetch_all.assert_not_called()
+
+    def test_following_events_should_return_the_same_events(self):
+        last_event_id = change_feed.last_id
+        booking_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+        self._book("2020-08-04T09:00:00", 2, room_code="room4")
+        self.bookings_api_delete(f"/{booking_id}")
+        query_strings = [
+            f"floor=1&last_event_id={last_event_id}",
+            f"room_code=room4&start_day=2020-08-04&end_day=2020-08-04&last_event_id={last_event_id}",
+            f"last_event_id={last_event_id + 10}",
+            "room_code=unknown",
+        ]
+
+        with mock.patch.multiple(
+            config, CHANGE_FEED_HEARTBEAT_IN_SECONDS=0.05, CHANGE_FEED_STREAM_DURATION_IN_SECONDS=0.1
+        ):
+            responses = self._asgi_requests(
+                [("GET", "/booking/events", query_string, None) for query_string in query_strings]
+            )
+        for query_string, (status, headers, body) in zip(query_strings[:3], responses):
+            self.assertEqual(status, 200, query_string)
+            self.assertEqual(headers["content-type"], "text/event-stream", query_string)
+            events = parse_server_sent_events(body.decode())
+            expected_events = [
+                event for event in self.follow_booking_events(query_string=query_string) if "event" in event
+            ]
+            self.assertTrue(expected_events, query_string)
+            self.assertEqual([event for event in events if "event" in event], expected_events, query_string)
+            # (the heartbeats move the id of the client past the last change)
+            self.assertEqual(events[-1], {"id": str(change_feed.last_id)}, query_string)
+        self.assertEqual(responses[3][0], 404)
+
+    def test_following_events_should_end_once_the_client_is_gone(self):
+        # (without holding a thread, nor its place among the streams, until the end of the stream)
+        with mock.patch.multiple(config, CHANGE_FEED_MAX_STREAMS=0, CHANGE_FEED_MAX_ASYNC_STREAMS=1):
+            start = time.monotonic()
+            responses = self._asgi_requests([("GET", "/booking/events", "", None)] * 2, connected_seconds=0.1)
+            self.assertLess(time.monotonic() - start, config.CHANGE_FEED_HEARTBEAT_IN_SECONDS)
+            self.assertEqual([status for status, _, _ in responses], [200, 200])
+
+            with mock.patch.object(config, "CHANGE_FEED_MAX_ASYNC_STREAMS", 0):
+                ((status, headers, _),) = self._asgi_requests([("GET", "/booking/events", "", None)])
+        self.assertEqual(status, 503)
+        self.assertEqual(headers["retry-after"], str(config.CHANGE_FEED_HEARTBEAT_IN_SECONDS))
+
+    def test_other_requests_should_be_handed_over_to_the_flask_application(self):
+        booking = {"author": "Grace Hopper", "start_datetime": "2020-08-04T09:00:00", "duration_in_hours": 2,
+                   "room_code": "room1"}
+
+        (status, _, body), (conflict_status, _, _), (room_status, _, room_body) = self._asgi_requests([
+            ("POST", "/booking/", "", booking),
+            ("POST", "/booking/", "", booking),
+            ("GET", "/rooms/room2", "", None),
+        ])
+        self.assertEqual(status, 201)
+        self.assertEqual(json.loads(body)["room"]["code"], "room1")
+        self.assertEqual(conflict_status, 409)
+        self.assertEqual(room_status, 200)
+        self.assertEqual(room_body, self.rooms_api_get("/room2").get_data())
+
+    def test_sqlalchemy_should_never_query_the_database_within_the_event_loop(self):
+        self._book("2020-08-04T22:00:00", 4)
+        query_threads = []
+
+        def record_thread(method):
+            def recording_method(*args, **kwargs):
+                query_threads.append(threading.current_thread())
+                return method(*args, **kwargs)
+            return recording_method
+
+        # (with the changes of the other processes to apply, and the catalog of rooms expiring at once)
+        with mock.patch.object(config, "SYNC_INDEXES_BETWEEN_PROCESSES", True), \
+                mock.patch.object(room_catalog, "_ttl_in_seconds", 0), \
+                mock.patch.object(SqlStorage, "room_rows", record_thread(SqlStorage.room_rows)), \
+                mock.patch.object(SqlStorage, "changes_after", record_thread(SqlStorage.changes_after)), \
+                mock.patch.object(SqlStorage, "last_change_id", record_thread(SqlStorage.last_change_id)):
+            responses = self._asgi_requests([
+                ("GET", "/booking/", "day=2020-08-04", None),
+                ("POST", "/booking/compute-availabilities", "", {"target_day": "2020-08-05", "room_code": "room1"}),
+                ("POST", "/booking/compute-availabilities", "", {"target_day": "2020-08-05", "room_code": "room1"}),
+                ("GET", "/rooms/room2", "", None),
+            ])
+        self.assertEqual([status for status, _, _ in responses], [200, 200, 200, 200])
+        self.assertTrue(query_threads)
+        self.assertNotIn(threading.main_thread(), query_threads)
+
+
+class TestAsgiEntryPoint(TestCase):
+    """Test the launch of the asynchronous serving mode from the root of the project, with the production config."""
+
+    def test_launching_with_the_prod_config_should_serve_on_the_bind_address(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        with tempfile.TemporaryDirectory() as directory:
+            environment = {
+                **os.environ,
+                "ENVIRONMENT": "prod",
+                "WORKROOMS_BIND": f"127.0.0.1:{port}",
+                "WORKROOMS_DATABASE_URI": "sqlite:///" + os.path.join(directory, "workrooms_booking.db"),
+            }
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(_ROOT_DIR, "run_app.py"), "--asgi"],
+                cwd=directory,
+                env=environment,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            try:
+                status = self._wait_for_status(f"http://127.0.0.1:{port}/rooms/", process)
+            finally:
+                process.terminate()
+                _, errors = process.communicate(timeout=10)
+            self.assertEqual(status, 200, errors.decode())
+
+    @staticmethod
+    def _wait_for_status(url: str, process: subprocess.Popen, timeout_in_seconds: float = 20) -> Optional[int]:
+        """The status of the first response to a GET of the url, once the server is up (or None if it never is)."""
+        deadline = time.monotonic() + timeout_in_seconds
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                return requests.get(url, timeout=1).status_code
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        return None
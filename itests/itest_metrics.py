@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from base import IntegrationTest
+from configs import config
+
+from app import create_app
+from lib.instrumentation import instrumentation
+
+
+class TestMetrics(IntegrationTest):
+    """Test the instrumentation of the requests, when it is enabled."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.profile_dir = tempfile.mkdtemp()
+        with mock.patch.multiple(
+            config,
+            INSTRUMENTATION_ENABLED=True,
+            PROFILE_SAMPLE_RATE=1.,
+            PROFILE_SLOW_REQUESTS_IN_SECONDS=0.,
+            PROFILE_DIR=cls.profile_dir,
+        ):
+            cls.app = create_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.profile_dir)
+
+    def setUp(self) -> None:
+        super().setUp()
+        instrumentation.reset()
+
+    def test_metrics_should_split_the_time_of_the_requests_per_endpoint_and_phase(self):
+        self.bookings_api_post("/compute-availabilities", json={"target_day": "2020-08-04", "room_code": "room1"})
+        self.bookings_api_post("/compute-availabilities", json={"target_day": "2020-08-05", "room_code": "room1"})
+
+        response = self.test_client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.get_data(as_text=True)
+        labels = 'method="POST",endpoint="/booking/compute-availabilities"'
+        self.assertIn(f"workrooms_request_duration_seconds_count{{{labels}}} 2\n", metrics)
+        for phase in ("parse", "db", "algorithm", "marshal"):
+            self.assertIn(f'workrooms_request_phase_seconds_total{{{labels},phase="{phase}"}} ', metrics)
+        self.assertNotIn(f"workrooms_db_queries_total{{{labels}}} 0\n", metrics)
+        self.assertIn("\nworkrooms_availability_cache_misses ", metrics)
+
+        # All requests were sampled and slow enough to be profiled:
+        profiles = os.listdir(self.profile_dir)
+        self.assertTrue(any(name.startswith("POST_booking_compute-availabilities") for name in profiles))
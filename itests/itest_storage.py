@@ -0,0 +1,202 @@
+import os
+import sqlite3
+from typing import List
+from unittest import mock
+
+import requests
+
+from base import IntegrationTest
+from configs import config
+from manage_storage import _MIGRATIONS, _create_base_schema, empty_sqlite_db, upgrade_sqlite_db
+
+from lib.occupancy import occupancy_index
+from lib.sqlalchemy.session import dispose_engine, remove_current_session
+from lib.storage import close_storages, current_storage
+from lib.storage.memory import MemoryStorage
+
+
+class TestStorage(IntegrationTest):
+    """Test the upgrades of the databases created by former versions."""
+
+    def _create_former_db(self, version: int) -> sqlite3.Connection:
+        # (the database of the latest version is replaced by an empty one)
+        remove_current_session()
+        dispose_engine()
+        empty_sqlite_db()
+        connection = sqlite3.connect(config.DATABASE_URI.replace("sqlite:///", ""))
+        cur = connection.cursor()
+        _create_base_schema(cur)
+        for migration in _MIGRATIONS[:version]:
+            migration(cur)
+        cur.execute(f"PRAGMA user_version = {version};")
+        cur.execute("INSERT INTO buildings (id, address, tz_name) VALUES (1, 'La Défense', 'Europe/Paris');")
+        cur.execute("INSERT INTO rooms VALUES ('room1', 1, 'Salle Ada Lovelace', 1, 12);")
+        return connection
+
+    def test_upgrading_local_datetimes_should_store_the_hours_of_the_time_zone_of_the_rooms(self):
+        connection = self._create_former_db(5)
+        connection.executemany(
+            "INSERT INTO bookings (id, author, start_datetime, duration, room_code) VALUES (?, ?, ?, ?, ?);",
+            [
+                (1, "Ada Lovelace", "2020-08-04 10:00:00.000000", 2, "room1"),
+                (3, "Grace Hopper", "2020-10-25 01:00:00.000000", 3, "room1"),
+            ],
+        )
+        connection.commit()
+        connection.close()
+        upgrade_sqlite_db()
+
+        response = self.bookings_api_get(query_string={"day": "2020-08-04"})
+        self.assertEqual([booking["start_datetime"] for booking in response.json], ["2020-08-04T10:00:00+02:00"])
+        response = self.bookings_api_post(
+            "/compute-availabilities",
+            json={"target_day": "2020-10-25", "room_code": "room1"},
+        )
+        self.assertEqual(response.json[0]["free_slots"], [
+            {"start_datetime": "2020-10-25T00:00:00+02:00", "duration_in_hours": 1},
+            {"start_datetime": "2020-10-25T03:00:00+01:00", "duration_in_hours": 21},
+        ])
+
+        # The slots were rebuilt, and the identifiers keep increasing:
+        booking = {"author": "Alan Turing", "duration_in_hours": 1, "room_code": "room1"}
+        self.assertEqual(
+            self.bookings_api_post(json={**booking, "start_datetime": "2020-08-04T11:00:00"}).status_code, 409
+        )
+        response = self.bookings_api_post(json={**booking, "start_datetime": "2020-08-04T12:00:00"})
+        self.assertEqual(response.json["id"], 4)
+
+    def test_upgrading_should_roll_up_the_usage_of_the_existing_bookings(self):
+        connection = self._create_former_db(6)
+        # (10:00 in Paris on 2020-08-04, and 01:00 on 2020-10-25, followed by 02:00 twice)
+        connection.executemany(
+            "INSERT INTO bookings (id, author, start_hour, end_hour, room_code) VALUES (?, ?, ?, ?, ?);",
+            [(1, "Ada Lovelace", 443480, 443482, "room1"), (2, "Grace Hopper", 445439, 445442, "room1")],
+        )
+        connection.execute(
+            "INSERT INTO recurring_bookings (author, start_datetime, duration, room_code, frequency, interval, until) "
+            "VALUES ('Alan Turing', '2020-08-03 09:00:00.000000', 2, 'room1', 'weekly', 1, '2020-08-17');"
+        )
+        connection.commit()
+        connection.close()
+        upgrade_sqlite_db()
+
+        august = {"start_day": "2020-08-01", "end_day": "2020-08-31"}
+        response = self.analytics_api_get("/utilization", query_string={**august, "end_day": "2020-10-31"})
+        self.assertEqual(response.json[0]["booked_hours"], 2 + 3 + 3 * 2)
+        response = self.analytics_api_get("/peak_hours", query_string={"start_day": "2020-10-25"})
+        self.assertEqual(response.json[:2], [
+            {"hour": 1, "available_hours": 1, "booked_hours": 1, "occupancy_rate": 1.},
+            {"hour": 2, "available_hours": 2, "booked_hours": 2, "occupancy_rate": 1.},
+        ])
+        response = self.analytics_api_get("/top_authors", query_string=august)
+        self.assertEqual([(item["author"], item["bookings"]) for item in response.json], [
+            ("Alan Turing", 3), ("Ada Lovelace", 1),
+        ])
+
+        # The rollups keep being maintained by the new bookings:
+        self.bookings_api_post(json={
+            "author": "Ada Lovelace",
+            "start_datetime": "2020-08-10T12:00:00",
+            "duration_in_hours": 5,
+            "room_code": "room1",
+        })
+        response = self.analytics_api_get("/top_authors", query_string=august)
+        self.assertEqual([(item["author"], item["booked_hours"]) for item in response.json], [
+            ("Ada Lovelace", 7), ("Alan Turing", 6),
+        ])
+
+
+class TestMemoryStorage(IntegrationTest):
+    """Test the in-memory storage engine, and its recovery from its snapshot and journals."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        patcher = mock.patch.object(config, "STORAGE_ENGINE", "memory")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recovered_storages: List[MemoryStorage] = []
+
+    def tearDown(self) -> None:
+        for storage in self.recovered_storages:
+            storage.close()
+        super().tearDown()
+
+    def _book(self, start_datetime: str, duration_in_hours: int) -> requests.Response:
+        return self.bookings_api_post(json={
+            "author": "Grace Hopper",
+            "start_datetime": start_datetime,
+            "duration_in_hours": duration_in_hours,
+            "room_code": "room1",
+        })
+
+    def _recover(self) -> MemoryStorage:
+        """A storage loading the files written so far, as if the process had crashed and restarted."""
+        storage = MemoryStorage(config.MEMORY_STORAGE_DIR, 300, False)
+        self.recovered_storages.append(storage)
+        return storage
+
+    def test_bookings_should_be_kept_in_memory_and_persisted_in_files(self):
+        self.assertEqual(self._book("2020-08-04T09:00:00", 2).status_code, 201)
+        self.assertEqual(self._book("2020-08-04T10:00:00", 2).status_code, 409)
+        response = self.bookings_api_post("/recurring", json={
+            "author": "Alan Turing",
+            "start_datetime": "2020-08-03T14:00:00",
+            "duration_in_hours": 1,
+            "room_code": "room1",
+            "frequency": "weekly",
+            "until": "2020-08-31",
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._book("2020-08-10T14:00:00", 1).status_code, 409)
+
+        # The bookings are found again after a restart, but were never written in the database:
+        close_storages()
+        occupancy_index.clear()
+        response = self.bookings_api_get(query_string={"day": "2020-08-04", "end_day": "2020-08-10"})
+        self.assertEqual(
+            [(item["start_datetime"], item["recurring_booking_id"]) for item in response.json],
+            [("2020-08-04T09:00:00+02:00", None), ("2020-08-10T14:00:00+02:00", 1)],
+        )
+        self.assertEqual(self._book("2020-08-04T10:00:00", 1).status_code, 409)
+        self.assertEqual(self._book("2020-08-04T11:00:00", 1).json["id"], 2)
+        connection = sqlite3.connect(config.DATABASE_URI.replace("sqlite:///", ""))
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM bookings;").fetchone(), (0,))
+        connection.close()
+
+    def test_recovering_should_replay_the_journal_up_to_an_interrupted_write(self):
+        first_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+        second_id = self._book("2020-08-04T12:00:00", 1).json["id"]
+        self.assertEqual(self.bookings_api_delete(f"/{first_id}").status_code, 204)
+        journal_name = [name for name in os.listdir(config.MEMORY_STORAGE_DIR) if name.startswith("journal-")][-1]
+        with open(os.path.join(config.MEMORY_STORAGE_DIR, journal_name), "a") as journal:
+            journal.write('[4, "insert_bookings", [[3, "Ada Lovel')
+
+        storage = self._recover()
+        self.assertIsNone(storage.get_booking(first_id))
+        self.assertEqual(storage.get_booking_row(second_id), (second_id, "Grace Hopper", 443482, 1, "room1", None))
+        self.assertIsNone(storage.get_booking(3))
+
+    def test_recovering_should_load_the_snapshot_then_the_journal_written_since(self):
+        first_id = self._book("2020-08-04T09:00:00", 2).json["id"]
+        current_storage().snapshot()
+        second_id = self._book("2020-08-04T12:00:00", 1).json["id"]
+
+        storage = self._recover()
+        self.assertEqual([booking.id for booking in storage.bookings_between(None, None)], [first_id, second_id])
+        self.assertFalse(storage.insert_bookings([storage.new_booking("Ada Lovelace", 443480, 443481, "room1")]))
+
+    def test_listing_the_bookings_of_a_room_should_follow_the_cursor(self):
+        for hour in (9, 10, 11, 13):
+            self._book(f"2020-08-04T{hour:02}:00:00", 1)
+        self.bookings_api_post(json={
+            "author": "Ada Lovelace",
+            "start_datetime": "2020-08-04T09:00:00",
+            "duration_in_hours": 1,
+            "room_code": "room2",
+        })
+
+        query_string = {"day": "2020-08-04", "room_code": "room1", "limit": 3}
+        response = self.bookings_api_get(query_string=query_string)
+        self.assertEqual([item["id"] for item in response.json], [1, 2, 3])
+        response = self.bookings_api_get(query_string={**query_string, "cursor": response.headers["X-Next-Cursor"]})
+        self.assertEqual([item["id"] for item in response.json], [4])
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import json
+import sqlite3
+from typing import List
+from unittest import mock
+
+from base import IntegrationTest
+from configs import config
+
+from lib.change_feed import change_feed
+from lib.occupancy import occupancy_index
+from lib.storage.sql import SqlStorage
+
+
+# The hour since the epoch of 2020-08-04T10:00:00+02:00:
+_TEN_O_CLOCK_IN_PARIS = 443480
+
+
+class TestWorkers(IntegrationTest):
+    """Test the coherence of the indexes of processes sharing the same database."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        # (the changes are read before every lookup)
+        patcher = mock.patch.multiple(config, SYNC_INDEXES_BETWEEN_PROCESSES=True, SYNC_INDEXES_INTERVAL_IN_SECONDS=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _free_durations(self, day: str) -> List[int]:
+        response = self.bookings_api_post(
+            "/compute-availabilities",
+            json={"target_day": day, "room_code": "room1"},
+        )
+        return [slot["duration_in_hours"] for slot in response.json[0]["free_slots"]]
+
+    def _book_from_another_process(self, start_hour: int, duration: int, day: str) -> int:
+        """Book the room as another process would, returning the id of the journaled change."""
+        connection = sqlite3.connect(config.DATABASE_URI.replace("sqlite:///", ""))
+        try:
+            booking_id = connection.execute(
+                "INSERT INTO bookings (author, start_hour, end_hour, room_code) VALUES (?, ?, ?, ?);",
+                ("Alan Turing", start_hour, start_hour + duration, "room1"),
+            ).lastrowid
+            change_id = connection.execute(
+                "INSERT INTO booking_changes (room_code, day, kind, booking_id, author, start_hour, duration) "
+                "VALUES (?, ?, 'booking_created', ?, 'Alan Turing', ?, ?);",
+                ("room1", day, booking_id, start_hour, duration),
+            ).lastrowid
+            connection.commit()
+            return change_id
+        finally:
+            connection.close()
+
+    def test_writes_should_be_journaled(self):
+        response = self.bookings_api_post(json={
+            "author": "Grace Hopper",
+            "start_datetime": "2020-08-04T23:00:00",
+            "duration_in_hours": 2,
+            "room_code": "room1",
+        })
+        self.assertEqual(response.status_code, 201)
+        self.bookings_api_delete(str(response.json["id"]))
+
+        connection = sqlite3.connect(config.DATABASE_URI.replace("sqlite:///", ""))
+        try:
+            changes = connection.execute("SELECT room_code, day FROM booking_changes ORDER BY id;").fetchall()
+        finally:
+            connection.close()
+        self.assertEqual(changes, [("room1", "2020-08-04"), ("room1", "2020-08-05")] * 2)
+
+    def test_bookings_of_another_process_should_be_seen_by_a_rebuilt_index(self):
+        occupancy_index.rebuild()
+        self.assertEqual(self._free_durations("2020-08-04"), [24])
+
+        self._book_from_another_process(_TEN_O_CLOCK_IN_PARIS, 2, "2020-08-04")
+        self.assertEqual(self._free_durations("2020-08-04"), [10, 12])
+
+    def test_events_of_all_the_processes_should_be_followed_with_the_ids_of_the_journal(self):
+        last_event_id = change_feed.last_id
+        response = self.bookings_api_post(json={
+            "author": "Grace Hopper",
+            "start_datetime": "2020-08-04T23:00:00",
+            "duration_in_hours": 2,
+            "room_code": "room1",
+        })
+        change_id = self._book_from_another_process(_TEN_O_CLOCK_IN_PARIS, 2, "2020-08-04")
+
+        # (the first booking journaled a change per day, the event being held by the first one)
+        events = self.follow_booking_events(headers={"Last-Event-ID": str(last_event_id)})
+        self.assertEqual(
+            [(event["id"], json.loads(event["data"])["author"]) for event in events if "event" in event],
+            [(str(last_event_id + 1), "Grace Hopper"), (str(change_id), "Alan Turing")],
+        )
+        self.assertEqual(change_id, last_event_id + 3)
+        self.assertEqual(response.json["id"], json.loads(events[0]["data"])["id"])
+
+        # A client may resume from any of these ids, whichever process it reconnects to:
+        events = self.follow_booking_events(headers={"Last-Event-ID": str(last_event_id + 1)})
+        self.assertEqual([event["id"] for event in events if "event" in event], [str(change_id)])
+
+    def test_bookings_of_another_process_should_be_seen_by_a_lazy_index(self):
+        self.assertEqual(self._free_durations("2020-08-04"), [24])
+
+        self._book_from_another_process(_TEN_O_CLOCK_IN_PARIS, 2, "2020-08-04")
+        self.assertEqual(self._free_durations("2020-08-04"), [10, 12])
+
+    def test_changes_should_be_read_at_most_once_per_interval(self):
+        self.assertEqual(self._free_durations("2020-08-04"), [24])
+        with mock.patch.object(config, "SYNC_INDEXES_INTERVAL_IN_SECONDS", 60), \
+                mock.patch.object(SqlStorage, "changes_after", wraps=SqlStorage.changes_after, autospec=True) as read:
+            occupancy_index.sync()
+            self._book_from_another_process(_TEN_O_CLOCK_IN_PARIS, 2, "2020-08-04")
+            for _ in range(3):
+                self.assertEqual(self._free_durations("2020-08-04"), [24])
+        self.assertEqual(read.call_count, 1)
+
+    def test_changes_should_be_read_without_holding_the_index(self):
+        self.assertEqual(self._free_durations("2020-08-04"), [24])
+        self._book_from_another_process(_TEN_O_CLOCK_IN_PARIS, 2, "2020-08-04")
+        other_lookups = []
+        original_changes_after = SqlStorage.changes_after
+
+        def changes_after(storage, change_id):
+            # (another thread looks the index up meanwhile, without waiting for this query)
+            if not other_lookups:
+                other_lookups.append(None)
+                executor = ThreadPoolExecutor(1)
+                try:
+                    lookup = executor.submit(occupancy_index.day_bitmap, "room2", dt.date(2020, 8, 4))
+                    other_lookups[0] = lookup.result(timeout=2)
+                finally:
+                    executor.shutdown(wait=False)
+            return original_changes_after(storage, change_id)
+
+        with mock.patch.object(SqlStorage, "changes_after", changes_after):
+            self.assertEqual(self._free_durations("2020-08-04"), [10, 12])
+        self.assertEqual(other_lookups, [0])
@@ -1,6 +1,12 @@
+import argparse
+import datetime as dt
 import os
-from typing import Optional, Tuple
+import random
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+from pytz import timezone
 import sqlite3
 
 from configs import config
@@ -8,6 +14,25 @@ from configs import config
 
 _DB_FILE_NAME = config.DATABASE_URI.replace("sqlite:///", "")
 
+# The format in which SQLAlchemy stores datetimes in SQLite:
+_SQLALCHEMY_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _epoch_hour(tz, local_datetime: dt.datetime) -> int:
+    """The number of hours since the Unix epoch of the naive datetime of the (pytz) time zone, as the API stores it."""
+    return int(tz.localize(local_datetime).timestamp()) // 3600
+
+
+def _room_time_zones(cur: sqlite3.Cursor) -> Dict[str, dt.tzinfo]:
+    """The (pytz) time zone of each room, each one resolved once."""
+    time_zones: Dict[str, dt.tzinfo] = {}
+    room_time_zones = {}
+    for room_code, tz_name in cur.execute(
+        "SELECT rooms.code, buildings.tz_name FROM rooms JOIN buildings ON buildings.id = rooms.building_id;"
+    ).fetchall():
+        room_time_zones[room_code] = time_zones.setdefault(tz_name, timezone(tz_name))
+    return room_time_zones
+
 
 def _connect_to_sqlite_db_file() -> Optional[Tuple[sqlite3.Connection, sqlite3.Cursor]]:
     """Connect to the expected DB file name."""
@@ -16,16 +41,290 @@ def _connect_to_sqlite_db_file() -> Optional[Tuple[sqlite3.Connection, sqlite3.C
     return conn, cur
 
 
-def init_sqlite_db() -> None:
+#
+# Successive changes of the schema, applied in order to the databases created by former versions:
+#
+def _add_booking_slots(cur: sqlite3.Cursor) -> None:
+    """Add the table of booked hours, whose primary key forbids double-bookings, and fill it from the bookings."""
+    cur.execute(
+        """
+        CREATE TABLE booking_slots (
+            room_code TEXT NOT NULL,
+            slot_start TEXT NOT NULL,
+            booking_id INTEGER NOT NULL,
+            PRIMARY KEY (room_code, slot_start),
+            FOREIGN KEY(room_code) REFERENCES rooms(code),
+            FOREIGN KEY(booking_id) REFERENCES bookings(id)
+        );
+        """
+    )
+    slots = []
+    for booking_id, room_code, start_datetime, duration in cur.execute(
+        "SELECT id, room_code, start_datetime, duration FROM bookings;"
+    ).fetchall():
+        start_datetime = dt.datetime.fromisoformat(start_datetime)
+        for i in range(duration):
+            slot_start = start_datetime + dt.timedelta(hours=i)
+            slots.append((room_code, slot_start.strftime(_SQLALCHEMY_DATETIME_FORMAT), booking_id))
+    # Former versions could let bookings overlap, in which case the first one keeps the slot:
+    cur.executemany("INSERT OR IGNORE INTO booking_slots VALUES (?, ?, ?);", slots)
+
+
+def _add_bookings_indexes(cur: sqlite3.Cursor) -> None:
+    """Index the bookings on their room and on their author, then on their start."""
+    cur.execute("CREATE INDEX ix_bookings_room_code_start_datetime ON bookings (room_code, start_datetime);")
+    cur.execute("CREATE INDEX ix_bookings_author_start_datetime ON bookings (author, start_datetime);")
+
+
+def _add_recurring_bookings(cur: sqlite3.Cursor) -> None:
+    """Add the table of the recurring bookings, whose occurrences are never stored."""
+    cur.execute(
+        """
+        CREATE TABLE recurring_bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author TEXT NOT NULL,
+            start_datetime TEXT NOT NULL,
+            duration INTEGER NOT NULL,
+            room_code TEXT NOT NULL,
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 1,
+            until TEXT NOT NULL,
+            FOREIGN KEY(room_code) REFERENCES rooms(code)
+        );
+        """
+    )
+    cur.execute("CREATE INDEX ix_recurring_bookings_room_code_until ON recurring_bookings (room_code, until);")
+
+
+def _add_bookings_start_datetime_index(cur: sqlite3.Cursor) -> None:
+    """Index the bookings on their start then on their id, in the order of the pages of the list of bookings."""
+    cur.execute("CREATE INDEX ix_bookings_start_datetime_id ON bookings (start_datetime, id);")
+
+
+def _add_booking_changes(cur: sqlite3.Cursor) -> None:
+    """Add the journal of the rooms and days whose bookings changed, read by the other processes of the API."""
+    cur.execute(
+        """
+        CREATE TABLE booking_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_code TEXT NOT NULL,
+            day TEXT,
+            FOREIGN KEY(room_code) REFERENCES rooms(code)
+        );
+        """
+    )
+
+
+def _add_bookings_hours_indexes(cur: sqlite3.Cursor) -> None:
+    """Index the bookings on their room, on their author, and in the order of the pages, then on their start hour."""
+    cur.execute("CREATE INDEX ix_bookings_room_code_start_hour ON bookings (room_code, start_hour);")
+    cur.execute("CREATE INDEX ix_bookings_author_start_hour ON bookings (author, start_hour);")
+    cur.execute("CREATE INDEX ix_bookings_start_hour_id ON bookings (start_hour, id);")
+
+
+def _store_bookings_as_epoch_hours(cur: sqlite3.Cursor) -> None:
     """
-    Create a SQLite database, the data structures involved in the project,
-    and initialize it with the constant set of rooms.
+    Store the periods of the bookings and their slots as hours since the Unix epoch, instead of local datetimes: the
+    tables are rebuilt, converting the local datetimes in the time zone of each room.
+    The recurring bookings keep their local start datetime, at which all their occurrences start.
+    """
+    room_time_zones = _room_time_zones(cur)
+    bookings = []
+    for booking_id, author, start_datetime, duration, room_code in cur.execute(
+        "SELECT id, author, start_datetime, duration, room_code FROM bookings;"
+    ).fetchall():
+        start_hour = _epoch_hour(room_time_zones[room_code], dt.datetime.fromisoformat(start_datetime))
+        bookings.append((booking_id, author, start_hour, start_hour + duration, room_code))
+    sequence = cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'bookings';").fetchone()
+
+    cur.execute("DROP TABLE booking_slots;")
+    cur.execute("DROP TABLE bookings;")
+    cur.execute(
+        """
+        CREATE TABLE bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author TEXT NOT NULL,
+            start_hour INTEGER NOT NULL,
+            end_hour INTEGER NOT NULL,
+            room_code TEXT NOT NULL,
+            FOREIGN KEY(room_code) REFERENCES rooms(code)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE booking_slots (
+            room_code TEXT NOT NULL,
+            slot_hour INTEGER NOT NULL,
+            booking_id INTEGER NOT NULL,
+            PRIMARY KEY (room_code, slot_hour),
+            FOREIGN KEY(room_code) REFERENCES rooms(code),
+            FOREIGN KEY(booking_id) REFERENCES bookings(id)
+        );
+        """
+    )
+    cur.executemany(
+        "INSERT INTO bookings (id, author, start_hour, end_hour, room_code) VALUES (?, ?, ?, ?, ?);", bookings
+    )
+    # (the hours repeated when the offset moves backward may now overlap, in which case the first booking keeps them)
+    cur.executemany(
+        "INSERT OR IGNORE INTO booking_slots (room_code, slot_hour, booking_id) VALUES (?, ?, ?);",
+        (
+            (room_code, hour, booking_id)
+            for booking_id, _, start_hour, end_hour, room_code in bookings
+            for hour in range(start_hour, end_hour)
+        ),
+    )
+    if sequence:
+        # (the identifiers of the deleted bookings must never be reused)
+        cur.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'bookings';", sequence)
+    _add_bookings_hours_indexes(cur)
+
+
+# Number of days between two occurrences of a recurring booking, per frequency (to multiply by its interval):
+_FREQUENCIES_IN_DAYS = {"daily": 1, "weekly": 7}
+
+
+# Number of bookings rolled up in memory before the rollups are added to their tables:
+_ROLLUPS_CHUNK_SIZE = 100_000
+
+
+class _DailyUsage:
+    """
+    The usage of the rooms per local day, rolled up in memory from periods then added to the tables: the hours booked
+    in each room (along with their bitmap, from the first hour of the day), and the hours booked by each author (along
+    with the number of bookings starting during the day).
+    """
+
+    def __init__(self):
+        self._room_usage: Dict[Tuple[str, dt.date], List[int]] = {}
+        self._author_usage: Dict[Tuple[str, dt.date, str], List[int]] = {}
+        self.periods = 0
+
+    def add(self, room_code: str, tz: dt.tzinfo, author: str, start_hour: int, end_hour: int) -> None:
+        from lib.hours import split_per_day  # (not at the top: src/ is set as the root of the code by the launchers)
+        self.periods += 1
+        for i, (day, mask) in enumerate(split_per_day(tz, start_hour, end_hour - start_hour)):
+            hours = bin(mask).count("1")
+            usage = self._room_usage.setdefault((room_code, day), [0, 0])
+            usage[0] += hours
+            usage[1] |= mask
+            usage = self._author_usage.setdefault((room_code, day, author), [0, 0])
+            usage[0] += i == 0
+            usage[1] += hours
+
+    def flush(self, cur: sqlite3.Cursor) -> None:
+        """Add the usage rolled up so far to the tables (the periods of a day may be split between several flushes)."""
+        cur.executemany(
+            "INSERT INTO room_day_usage (room_code, day, booked_hours, hours_bitmap) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (room_code, day) DO UPDATE SET booked_hours = booked_hours + excluded.booked_hours, "
+            "hours_bitmap = hours_bitmap | excluded.hours_bitmap;",
+            ((room_code, day.isoformat(), *usage) for (room_code, day), usage in self._room_usage.items()),
+        )
+        cur.executemany(
+            "INSERT INTO author_day_usage (room_code, day, author, bookings, booked_hours) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (room_code, day, author) DO UPDATE SET bookings = bookings + excluded.bookings, "
+            "booked_hours = booked_hours + excluded.booked_hours;",
+            (
+                (room_code, day.isoformat(), author, *usage)
+                for (room_code, day, author), usage in self._author_usage.items()
+            ),
+        )
+        self._room_usage.clear()
+        self._author_usage.clear()
+        self.periods = 0
+
+
+def _fill_daily_usage(cur: sqlite3.Cursor) -> None:
+    """
+    Roll up the usage of the rooms per local day, from all the bookings and all the occurrences of the recurring
+    bookings, chunk by chunk. The rows are read through cursors of their own, the rollups being added through this one.
+    """
+    room_time_zones = _room_time_zones(cur)
+    daily_usage = _DailyUsage()
+    for room_code, author, start_hour, end_hour in cur.connection.execute(
+        "SELECT room_code, author, start_hour, end_hour FROM bookings;"
+    ):
+        daily_usage.add(room_code, room_time_zones[room_code], author, start_hour, end_hour)
+        if daily_usage.periods >= _ROLLUPS_CHUNK_SIZE:
+            daily_usage.flush(cur)
+    for author, start_datetime, duration, room_code, frequency, interval, until in cur.connection.execute(
+        "SELECT author, start_datetime, duration, room_code, frequency, interval, until FROM recurring_bookings;"
+    ):
+        tz = room_time_zones[room_code]
+        occurrence, until = dt.datetime.fromisoformat(start_datetime), dt.date.fromisoformat(until)
+        step = dt.timedelta(days=_FREQUENCIES_IN_DAYS[frequency] * interval)
+        while occurrence.date() <= until:
+            start_hour = _epoch_hour(tz, occurrence)
+            daily_usage.add(room_code, tz, author, start_hour, start_hour + duration)
+            occurrence += step
+    daily_usage.flush(cur)
+
+
+def _add_daily_usage_rollups(cur: sqlite3.Cursor) -> None:
+    """Add the tables rolling up the usage of the rooms per local day, read by the analytics, and fill them."""
+    cur.execute(
+        """
+        CREATE TABLE room_day_usage (
+            room_code TEXT NOT NULL,
+            day TEXT NOT NULL,
+            booked_hours INTEGER NOT NULL,
+            hours_bitmap INTEGER NOT NULL,
+            PRIMARY KEY (room_code, day),
+            FOREIGN KEY(room_code) REFERENCES rooms(code)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE author_day_usage (
+            room_code TEXT NOT NULL,
+            day TEXT NOT NULL,
+            author TEXT NOT NULL,
+            bookings INTEGER NOT NULL,
+            booked_hours INTEGER NOT NULL,
+            PRIMARY KEY (room_code, day, author),
+            FOREIGN KEY(room_code) REFERENCES rooms(code)
+        );
+        """
+    )
+    _fill_daily_usage(cur)
+
+
+def _add_booking_events_to_changes(cur: sqlite3.Cursor) -> None:
+    """Journal the events of the bookings along with their changes, for the clients of every process to follow them."""
+    for column in ("kind TEXT", "booking_id INTEGER", "author TEXT", "start_hour INTEGER", "duration INTEGER"):
+        cur.execute(f"ALTER TABLE booking_changes ADD COLUMN {column};")
+
+
+_MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _add_booking_slots,
+    _add_bookings_indexes,
+    _add_recurring_bookings,
+    _add_bookings_start_datetime_index,
+    _add_booking_changes,
+    _store_bookings_as_epoch_hours,
+    _add_daily_usage_rollups,
+    _add_booking_events_to_changes,
+]
+
+
+def upgrade_sqlite_db() -> None:
+    """
+    Apply to the database the changes of the schema which it has not received yet.
+    The number of changes already applied is stored as the user_version of the database.
     """
-    # Connect to the database:
-    if _DB_FILE_NAME in os.listdir(os.getcwd()):
-        return None
     conn, cur = _connect_to_sqlite_db_file()
+    version = cur.execute("PRAGMA user_version;").fetchone()[0]
+    for new_version, migration in enumerate(_MIGRATIONS[version:], start=version + 1):
+        migration(cur)
+        cur.execute(f"PRAGMA user_version = {new_version};")
+    conn.commit()
+    conn.close()
+
 
+def _create_base_schema(cur: sqlite3.Cursor) -> None:
+    """Create the tables of the first version of the schema (the next ones are added by the _MIGRATIONS)."""
     # Create the tables representing our data structures: the rooms and the bookings.
     # As a modelization choice, we also create a building table which defines groups of rooms,
     # allowing us to store common information like the local time zone:
@@ -63,6 +362,20 @@ def init_sqlite_db() -> None:
         """
     )
 
+
+def init_sqlite_db() -> None:
+    """
+    Create a SQLite database, the data structures involved in the project,
+    and initialize it with the constant set of rooms.
+    If the database already exists, only upgrade its schema.
+    """
+    # Connect to the database:
+    if os.path.exists(_DB_FILE_NAME):
+        upgrade_sqlite_db()
+        return None
+    conn, cur = _connect_to_sqlite_db_file()
+    _create_base_schema(cur)
+
     # Populate the rooms:
     cur.execute(
         """
@@ -88,9 +401,10 @@ def init_sqlite_db() -> None:
         """
     )
 
-    # End the process:
+    # End the process, with the latest version of the schema:
     conn.commit()
     conn.close()
+    upgrade_sqlite_db()
 
 
 def empty_sqlite_db() -> None:
@@ -99,9 +413,181 @@ def empty_sqlite_db() -> None:
     conn, cur = _connect_to_sqlite_db_file()
 
     # Drop all tables:
-    for table_name in ("bookings", "rooms", "buildings"):
+    for table_name in (
+        "author_day_usage", "room_day_usage", "booking_changes", "recurring_bookings", "booking_slots", "bookings",
+        "rooms", "buildings",
+    ):
         cur.execute(f"DROP TABLE {table_name};")
+    cur.execute("PRAGMA user_version = 0;")
 
     # End the process:
     conn.commit()
     conn.close()
+
+
+#
+# Generation of large synthetic databases (e.g. for capacity testing and benchmarks):
+#
+_GENERATED_TIME_ZONES = (
+    "Europe/Paris", "Europe/London", "America/New_York", "America/Los_Angeles", "Asia/Tokyo", "Australia/Sydney",
+)
+_GENERATED_FLOORS = 10
+_GENERATED_CAPACITIES = (4, 6, 8, 10, 12, 16, 20, 30, 40, 250)
+
+# Working hours during which bookings are generated (local time of the rooms), and their maximum duration:
+_GENERATED_FIRST_HOUR, _GENERATED_END_HOUR = 8, 20
+_GENERATED_MAX_DURATION = 3
+
+# Number of bookings inserted by each executemany:
+_GENERATION_CHUNK_SIZE = 100_000
+
+# Indexes on the bookings, dropped during the loading and created again once all bookings are inserted:
+_BOOKINGS_INDEXES = ("ix_bookings_room_code_start_hour", "ix_bookings_author_start_hour", "ix_bookings_start_hour_id")
+
+
+def _generate_bookings(
+    rooms: List[Tuple[str, str]],
+    first_day: dt.date,
+    last_day: dt.date,
+    density: float,
+    rng: random.Random,
+) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yield (room_code, stored start hour, duration) bookings of the (room_code, tz_name) rooms, room by room, then day by
+    day, so that about `density` of the working hours are booked. A booking starts at each free hour with the
+    probability giving this density, given the mean duration of the bookings.
+    """
+    mean_duration = (_GENERATED_MAX_DURATION + 1) / 2
+    start_probability = density / (mean_duration * (1 - density) + density) if density < 1 else 1
+    # (the local hours are converted once per hour of each day and time zone, instead of once per booking)
+    days_hours_per_time_zone = {
+        tz_name: [
+            [
+                _epoch_hour(timezone(tz_name), dt.datetime.combine(first_day + dt.timedelta(days=i), dt.time(hour)))
+                for hour in range(24)
+            ]
+            for i in range((last_day - first_day).days + 1)
+        ]
+        for tz_name in {tz_name for _, tz_name in rooms}
+    }
+    random_number = rng.random
+    for room_code, tz_name in rooms:
+        for day_hours in days_hours_per_time_zone[tz_name]:
+            hour = _GENERATED_FIRST_HOUR
+            while hour < _GENERATED_END_HOUR:
+                if random_number() >= start_probability:
+                    hour += 1
+                    continue
+                duration = min(1 + int(random_number() * _GENERATED_MAX_DURATION), _GENERATED_END_HOUR - hour)
+                yield room_code, day_hours[hour], duration
+                hour += duration
+
+
+def generate_sqlite_db(
+    buildings: int,
+    rooms: int,
+    first_day: dt.date,
+    last_day: dt.date,
+    density: float,
+    seed: Optional[int] = None,
+) -> int:
+    """
+    Create a new SQLite database (which must not exist yet) with buildings spread over several time zones, rooms spread
+    over their floors, and non-overlapping bookings from first_day to last_day (included), booking about `density` of
+    their working hours. Return the number of generated bookings.
+
+    All rows are loaded by chunks with executemany, in a single transaction which is neither journaled nor synced,
+    and the indexes of the bookings are only built at the end.
+    """
+    if os.path.exists(_DB_FILE_NAME):
+        raise FileExistsError(f"The database {_DB_FILE_NAME} already exists, empty it or delete it first.")
+    rng = random.Random(seed)
+    conn, cur = _connect_to_sqlite_db_file()
+    cur.execute("PRAGMA journal_mode = OFF;")
+    cur.execute("PRAGMA synchronous = OFF;")
+    _create_base_schema(cur)
+    for migration in _MIGRATIONS:
+        migration(cur)
+    cur.execute(f"PRAGMA user_version = {len(_MIGRATIONS)};")
+    for index_name in _BOOKINGS_INDEXES:
+        cur.execute(f"DROP INDEX {index_name};")
+
+    # Generate the buildings and their rooms:
+    building_time_zones = [_GENERATED_TIME_ZONES[i % len(_GENERATED_TIME_ZONES)] for i in range(buildings)]
+    cur.executemany(
+        "INSERT INTO buildings (id, address, tz_name) VALUES (?, ?, ?);",
+        ((i + 1, f"Building {i + 1}", tz_name) for i, tz_name in enumerate(building_time_zones)),
+    )
+    room_codes = [f"room{i}" for i in range(rooms)]
+    cur.executemany(
+        "INSERT INTO rooms (code, building_id, name, floor, capacity) VALUES (?, ?, ?, ?, ?);",
+        (
+            (code, i % buildings + 1, f"Salle {i}", i // buildings % _GENERATED_FLOORS, capacity)
+            for i, (code, capacity) in enumerate(zip(room_codes, rng.choices(_GENERATED_CAPACITIES, k=rooms)))
+        ),
+    )
+
+    # Generate the bookings along with their slots and their daily usage, chunk by chunk:
+    booking_rows: List[Tuple[int, str, int, int, str]] = []
+    slot_rows: List[Tuple[str, int, int]] = []
+    daily_usage = _DailyUsage()
+    booking_id = 0
+    authors = [f"Author {i}" for i in range(1000)]
+
+    def insert_chunk():
+        cur.executemany(
+            "INSERT INTO bookings (id, author, start_hour, end_hour, room_code) VALUES (?, ?, ?, ?, ?);",
+            booking_rows,
+        )
+        cur.executemany("INSERT INTO booking_slots (room_code, slot_hour, booking_id) VALUES (?, ?, ?);", slot_rows)
+        daily_usage.flush(cur)
+        booking_rows.clear()
+        slot_rows.clear()
+
+    generated_rooms = [(code, building_time_zones[i % buildings]) for i, code in enumerate(room_codes)]
+    # (pytz returns the same instance of a time zone for its name, on which the hours of its days are cached)
+    room_time_zones = {room_code: timezone(tz_name) for room_code, tz_name in generated_rooms}
+    for room_code, start_hour, duration in _generate_bookings(generated_rooms, first_day, last_day, density, rng):
+        booking_id += 1
+        author = authors[int(rng.random() * 1000)]
+        booking_rows.append((booking_id, author, start_hour, start_hour + duration, room_code))
+        slot_rows.extend((room_code, start_hour + i, booking_id) for i in range(duration))
+        daily_usage.add(room_code, room_time_zones[room_code], author, start_hour, start_hour + duration)
+        if len(booking_rows) >= _GENERATION_CHUNK_SIZE:
+            insert_chunk()
+    insert_chunk()
+
+    # Build the indexes at once, then end the process:
+    _add_bookings_hours_indexes(cur)
+    conn.commit()
+    conn.close()
+    return booking_id
+
+
+def _parse_command_line() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Manage the SQLite database of the configured ENVIRONMENT.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init", help="Create the database with the constant set of rooms, or upgrade its schema.")
+    commands.add_parser("empty", help="Drop all the tables of the database.")
+    generate = commands.add_parser("generate", help="Create a new database filled with synthetic data.")
+    generate.add_argument("--buildings", type=int, default=10, help="Number of buildings, over several time zones.")
+    generate.add_argument("--rooms", type=int, default=1000, help="Number of rooms, spread over the buildings.")
+    generate.add_argument("--first-day", type=dt.date.fromisoformat, default=dt.date(2021, 1, 1))
+    generate.add_argument("--last-day", type=dt.date.fromisoformat, default=dt.date(2021, 12, 31))
+    generate.add_argument("--density", type=float, default=0.5, help="Booked share of the working hours (8-20h).")
+    generate.add_argument("--seed", type=int, help="Seed of the random generator, to generate the same data again.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_command_line()
+    # Set the src/ directory as the root of the source code (for the rollups, see _DailyUsage):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    if args.command == "init":
+        init_sqlite_db()
+    elif args.command == "empty":
+        empty_sqlite_db()
+    else:
+        start = time.perf_counter()
+        count = generate_sqlite_db(args.buildings, args.rooms, args.first_day, args.last_day, args.density, args.seed)
+        print(f"Generated {count} bookings in {time.perf_counter() - start:.1f} seconds.")
@@ -1,14 +1,29 @@
 """
 Launch the API from the root of the project.
 """
+import argparse
 import os
 from runpy import run_path
 import sys
 
+from configs import config
 from manage_storage import init_sqlite_db
 
 
 def launch() -> None:
+    parser = argparse.ArgumentParser(description="Launch the API.")
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="Serve the listings and availabilities asynchronously (ASGI), instead of with the Flask server.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Serve the API with this number of pre-forked processes (default: the WORKERS of the configuration).",
+    )
+    args = parser.parse_args()
+
     # Set the src/ directory as the root of the source code:
     src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
     sys.path.insert(0, src_dir)
@@ -17,7 +32,20 @@ def launch() -> None:
     init_sqlite_db()
 
     # Launch the API:
-    run_path(os.path.join(src_dir, "app.py"), run_name="workrooms_booking")
+    workers = config.WORKERS if args.workers is None else args.workers
+    if args.asgi:
+        import uvicorn
+        from asgi import create_asgi_app
+
+        # (bound like the pre-forked server, SERVER_NAME being unset in production)
+        host, _, port = config.BIND.partition(":")
+        uvicorn.run(create_asgi_app(), host=host, port=int(port or 5000))
+    elif workers:
+        from server import serve
+
+        serve(workers)
+    else:
+        run_path(os.path.join(src_dir, "app.py"), run_name="workrooms_booking")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+"""
+Benchmark the API from the root of the project, under a mixed workload of bookings, listings and availabilities.
+
+The benchmark database is seeded first, then the requests are sent either through the Flask test client, in this
+process, or to a server launched with run_app.py. The latencies, throughput and peak memory are reported as JSON, to
+be compared between versions, e.g.:
+    python run_benchmarks.py --target server --rooms 2000 --days 365 --output before.json
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+# The kinds of requests of the workload, with their default weights:
+_DEFAULT_MIX = {"post_booking": 2, "list_bookings": 5, "compute_availabilities": 3}
+
+_FIRST_DAY = dt.date(2021, 1, 4)
+_PERCENTILES = (50, 95, 99)
+
+
+#
+# Seeding of the benchmark database:
+#
+def _seed_database(buildings: int, rooms: int, days: int, density: float, seed: int) -> int:
+    """Create a new benchmark database of synthetic data, and return its number of bookings."""
+    from configs import config
+    from manage_storage import generate_sqlite_db
+
+    db_file_name = config.DATABASE_URI.replace("sqlite:///", "")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_file_name + suffix):
+            os.remove(db_file_name + suffix)
+    return generate_sqlite_db(
+        buildings, rooms, _FIRST_DAY, _FIRST_DAY + dt.timedelta(days=days - 1), density, seed=seed
+    )
+
+
+#
+# Workload:
+#
+class _Request(NamedTuple):
+    kind: str
+    method: str
+    path: str
+    query_string: Optional[Dict[str, Any]] = None
+    json: Optional[Dict[str, Any]] = None
+
+
+def _draw_request(kind: str, rooms: int, days: int, rng: random.Random) -> _Request:
+    room_code = f"room{rng.randrange(rooms)}"
+    day = _FIRST_DAY + dt.timedelta(days=rng.randrange(days))
+    if kind == "post_booking":
+        return _Request(kind, "POST", "/booking/", json={
+            "author": "Benchmark",
+            "start_datetime": dt.datetime.combine(day, dt.time(rng.randrange(8, 19))).isoformat(),
+            "duration_in_hours": rng.randint(1, 2),
+            "room_code": room_code,
+        })
+    if kind == "list_bookings":
+        query_string = {"day": day.isoformat()}
+        if rng.random() < 0.5:
+            query_string["room_code"] = room_code
+        return _Request(kind, "GET", "/booking/", query_string=query_string)
+    if kind == "compute_availabilities":
+        return _Request(kind, "POST", "/booking/compute-availabilities", json={
+            "target_day": day.isoformat(),
+            "floor": rng.randrange(10),
+        })
+    raise ValueError(f"Unknown kind of request: {kind}")
+
+
+def _draw_workload(mix: Dict[str, int], count: int, rooms: int, days: int, rng: random.Random) -> List[_Request]:
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [_draw_request(kind, rooms, days, rng) for kind in kinds]
+
+
+#
+# Targets, sending a request and returning its status code:
+#
+def _client_sender() -> Callable[[_Request], int]:
+    """Send the requests through the Flask test client (one per thread), in this process."""
+    from app import create_app
+    from lib.occupancy import occupancy_index
+
+    app = create_app()
+    occupancy_index.rebuild()
+    clients = threading.local()
+
+    def send(request: _Request) -> int:
+        if not hasattr(clients, "client"):
+            clients.client = app.test_client()
+        response = clients.client.open(
+            request.path, method=request.method, query_string=request.query_string, json=request.json
+        )
+        response.get_data()
+        return response.status_code
+
+    return send
+
+
+def _server_sender(base_url: str) -> Callable[[_Request], int]:
+    """Send the requests over HTTP (with a session per thread)."""
+    import requests
+
+    sessions = threading.local()
+
+    def send(request: _Request) -> int:
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        response = sessions.session.request(
+            request.method, base_url + request.path, params=request.query_string, json=request.json
+        )
+        return response.status_code
+
+    return send
+
+
+def _launch_server(base_url: str, timeout_in_seconds: float = 30) -> subprocess.Popen:
+    """Launch run_app.py with the benchmark configuration, and wait until it answers."""
+    import requests
+
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(root_dir, "run_app.py")],
+        cwd=root_dir,
+        env={**os.environ, "ENVIRONMENT": "bench"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout_in_seconds
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + "/rooms/room0", timeout=1)
+            return server
+        except requests.ConnectionError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The server could not be launched.")
+
+
+def _peak_rss_in_kb(pid: Optional[int] = None) -> int:
+    """The peak resident memory of a process (of this one by default)."""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+#
+# Measures:
+#
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return sorted_values[max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)]
+
+
+def _summarize(latencies: List[float], statuses: List[int]) -> Dict[str, Any]:
+    sorted_latencies = sorted(latencies)
+    status_counts: Dict[str, int] = {}
+    for status in statuses:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    return {
+        "requests": len(latencies),
+        "statuses": status_counts,
+        **{
+            f"p{percentile}_ms": round(_percentile(sorted_latencies, percentile) * 1000, 3)
+            for percentile in _PERCENTILES
+        },
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+    }
+
+
+def _run_workload(send: Callable[[_Request], int], workload: List[_Request], concurrency: int) -> Dict[str, Any]:
+    """Send all the requests from concurrent threads, and summarize their latencies per kind and overall."""
+    def timed_send(request: _Request) -> Tuple[str, float, int]:
+        start = time.perf_counter()
+        status = send(request)
+        return request.kind, time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_send, workload))
+    duration = time.perf_counter() - start
+
+    per_kind: Dict[str, Tuple[List[float], List[int]]] = {}
+    for kind, latency, status in results:
+        per_kind.setdefault(kind, ([], []))
+        per_kind[kind][0].append(latency)
+        per_kind[kind][1].append(status)
+    return {
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(results) / duration, 1),
+        "overall": _summarize([latency for _, latency, _ in results], [status for _, _, status in results]),
+        "per_kind": {kind: _summarize(*values) for kind, values in sorted(per_kind.items())},
+    }
+
+
+def _parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition(":")
+        if kind not in _DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown kind of request: {kind}")
+        mix[kind] = int(weight or 1)
+    return mix
+
+
+def launch() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("client", "server"), default="client", help="Where to send requests.")
+    parser.add_argument("--buildings", type=int, default=10, help="Number of buildings to seed.")
+    parser.add_argument("--rooms", type=int, default=1000, help="Number of rooms to seed.")
+    parser.add_argument("--days", type=int, default=90, help="Number of days over which bookings are seeded.")
+    parser.add_argument("--density", type=float, default=0.5, help="Booked share of the working hours when seeding.")
+    parser.add_argument("--no-seed", action="store_true", help="Reuse the benchmark database as it is.")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of measured requests.")
+    parser.add_argument("--warmup", type=int, default=200, help="Number of requests sent before measuring.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of threads sending requests.")
+    parser.add_argument(
+        "--mix",
+        type=_parse_mix,
+        default=_DEFAULT_MIX,
+        help="Weights of the kinds of requests, e.g. post_booking:2,list_bookings:5,compute_availabilities:3.",
+    )
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file in which to write the report (printed by default).")
+    args = parser.parse_args()
+
+    # Set the src/ directory as the root of the source code, and use the benchmark configuration:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    os.environ["ENVIRONMENT"] = "bench"
+    rng = random.Random(args.random_seed)
+
+    # Seed the database:
+    seeding_start = time.perf_counter()
+    bookings = None
+    if not args.no_seed:
+        bookings = _seed_database(args.buildings, args.rooms, args.days, args.density, args.random_seed)
+    seeding_duration = time.perf_counter() - seeding_start
+
+    # Send the requests to the target:
+    from configs import config
+    server = None
+    if args.target == "server":
+        base_url = f"http://{config.SERVER_NAME}"
+        server = _launch_server(base_url)
+        send = _server_sender(base_url)
+    else:
+        send = _client_sender()
+    try:
+        _run_workload(send, _draw_workload(args.mix, args.warmup, args.rooms, args.days, rng), args.concurrency)
+        results = _run_workload(
+            send, _draw_workload(args.mix, args.requests, args.rooms, args.days, rng), args.concurrency
+        )
+        peak_rss_in_kb = _peak_rss_in_kb(server.pid if server else None)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    # Report:
+    report = {
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "seeded_bookings": bookings,
+        "seeding_s": round(seeding_duration, 3),
+        "peak_rss_kb": peak_rss_in_kb,
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    launch()
@@ -3,6 +3,7 @@ Create the main API and aggregate all endpoint namespaces in it.
 """
 from flask_restx import Api
 
+from .analytics import api as analytics_ns
 from .bookings import api as booking_ns
 from .rooms import api as rooms_ns
 
@@ -14,3 +15,4 @@ api = Api(
 )
 api.add_namespace(booking_ns)
 api.add_namespace(rooms_ns)
+api.add_namespace(analytics_ns)
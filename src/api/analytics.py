@@ -0,0 +1,180 @@
+import datetime as dt
+from typing import Any, Dict, List, Tuple
+
+from flask_restx import Namespace, Resource, fields, inputs, marshal
+from flask_restx.reqparse import RequestParser
+from werkzeug.exceptions import NotFound, UnprocessableEntity
+
+from lib.analytics import BY_BUILDING, BY_FLOOR, BY_ROOM, hourly_occupancy, top_authors, utilization
+from lib.catalog import RoomInfo, room_catalog
+from lib.instrumentation import timed
+
+
+# Maximum number of days covered by a single request:
+MAX_ANALYTICS_DAYS = 2 * 366
+
+# Default and maximum numbers of authors in the ranking of the authors:
+DEFAULT_TOP_AUTHORS = 10
+MAX_TOP_AUTHORS = 100
+
+
+# Create the namespace of endpoints summing up the usage of the rooms:
+api = Namespace(
+    "Analytics",
+    path="/analytics",
+    description="Usage of the rooms over ranges of days, per room, floor or building (from daily rollups)."
+)
+
+
+# Output models:
+utilization_model = api.model("utilization", {
+    "building_id": fields.Integer(description="Identifier of the building of the rooms.", example=1),
+    "floor": fields.Integer(description="The floor of the rooms, unless grouped by building.", example=1),
+    "room_code": fields.String(description="Code of the room, if grouped by room.", example="room0"),
+    "rooms": fields.Integer(description="Number of rooms in the group.", example=3),
+    "available_hours": fields.Integer(description="Number of hours of all the days, for all the rooms.", example=72),
+    "booked_hours": fields.Integer(description="Number of these hours which are booked.", example=18),
+    "utilization_rate": fields.Float(description="The share of the available hours which are booked.", example=0.25),
+})
+hour_occupancy_model = api.model("hour_occupancy", {
+    "hour": fields.Integer(description="A local hour of the day, from 0 to 23.", example=10),
+    "available_hours": fields.Integer(description="Number of times the rooms were open at this hour.", example=31),
+    "booked_hours": fields.Integer(description="Number of times they were booked at this hour.", example=24),
+    "occupancy_rate": fields.Float(description="The share of the rooms booked at this hour.", example=0.77),
+})
+author_usage_model = api.model("author_usage", {
+    "author": fields.String(description="Name of the booking author."),
+    "bookings": fields.Integer(description="Number of bookings (or occurrences) starting during the days."),
+    "booked_hours": fields.Integer(description="Number of hours booked during the days."),
+})
+
+AUTHOR_USAGE_COLUMNS = ("author", "bookings", "booked_hours")
+
+
+# Inputs parsers:
+def _analytics_parser() -> RequestParser:
+    parser = RequestParser()
+    parser.add_argument(
+        "start_day",
+        type=inputs.date_from_iso8601,
+        required=True,
+        help="Sum up the usage of the rooms from this day...",
+        location="args",
+    )
+    parser.add_argument(
+        "end_day",
+        type=inputs.date_from_iso8601,
+        help="... to this one, included (defaults to start_day).",
+        location="args",
+    )
+    parser.add_argument("room_code", type=str, help="Only sum up the usage of this room.", location="args")
+    parser.add_argument(
+        "building_id", type=int, help="Only sum up the usage of the rooms of this building.", location="args"
+    )
+    parser.add_argument("floor", type=int, help="Only sum up the usage of the rooms of this floor.", location="args")
+    return parser
+
+
+def _utilization_parser() -> RequestParser:
+    parser = _analytics_parser()
+    parser.add_argument(
+        "group_by",
+        type=str,
+        choices=(BY_ROOM, BY_FLOOR, BY_BUILDING),
+        default=BY_ROOM,
+        help="Sum up the usage per room, per floor of each building, or per building.",
+        location="args",
+    )
+    return parser
+
+
+def _top_authors_parser() -> RequestParser:
+    parser = _analytics_parser()
+    parser.add_argument(
+        "limit",
+        type=inputs.int_range(1, MAX_TOP_AUTHORS),
+        default=DEFAULT_TOP_AUTHORS,
+        help=f"Number of authors in the ranking (at most {MAX_TOP_AUTHORS}).",
+        location="args",
+    )
+    return parser
+
+
+def _validate_analytics_inputs(args: Dict[str, Any]) -> Tuple[dt.date, dt.date, List[RoomInfo]]:
+    """Return the range of days, and the rooms, whose usage must be summed up."""
+    start_day = args["start_day"]
+    end_day = args.get("end_day") or start_day
+    if not 0 <= (end_day - start_day).days < MAX_ANALYTICS_DAYS:
+        raise UnprocessableEntity(f"The end_day must follow the start_day by less than {MAX_ANALYTICS_DAYS} days.")
+    room_code = args.get("room_code")
+    building_id = args.get("building_id")
+    floor = args.get("floor")
+
+    # Get the rooms whose usage must be summed up:
+    if room_code:
+        room = room_catalog.get(room_code)
+        if not room:
+            raise NotFound(f"Unknown room code: {room_code}.")
+        rooms = [room]
+    else:
+        rooms = room_catalog.all() if floor is None else room_catalog.on_floor(floor)
+        if building_id is not None:
+            rooms = [room for room in rooms if room.building_id == building_id]
+    return start_day, end_day, rooms
+
+
+@api.route("/utilization")
+class UtilizationResource(Resource):
+    parser = _utilization_parser()
+
+    @api.doc("get_utilization")
+    @api.expect(parser)
+    @api.response(200, "Success", [utilization_model])
+    @api.response(404, "Unknown room code.")
+    @api.response(422, f"Too many days (more than {MAX_ANALYTICS_DAYS}).")
+    def get(self):
+        """Get the share of the hours during which the rooms were booked, per room, floor or building"""
+        with timed("parse"):
+            args = self.parser.parse_args(strict=True)
+        start_day, end_day, rooms = _validate_analytics_inputs(args)
+        res = utilization(rooms, start_day, end_day, args["group_by"])
+        with timed("marshal"):
+            return marshal(res, utilization_model), 200
+
+
+@api.route("/peak_hours")
+class PeakHoursResource(Resource):
+    parser = _analytics_parser()
+
+    @api.doc("get_peak_hours")
+    @api.expect(parser)
+    @api.response(200, "Success", [hour_occupancy_model])
+    @api.response(404, "Unknown room code.")
+    @api.response(422, f"Too many days (more than {MAX_ANALYTICS_DAYS}).")
+    def get(self):
+        """Get the share of the rooms booked at each local hour of the day, the busiest hours first"""
+        with timed("parse"):
+            args = self.parser.parse_args(strict=True)
+        start_day, end_day, rooms = _validate_analytics_inputs(args)
+        res = hourly_occupancy(rooms, start_day, end_day)
+        with timed("marshal"):
+            return marshal(res, hour_occupancy_model), 200
+
+
+@api.route("/top_authors")
+class TopAuthorsResource(Resource):
+    parser = _top_authors_parser()
+
+    @api.doc("get_top_authors")
+    @api.expect(parser)
+    @api.response(200, "Success", [author_usage_model])
+    @api.response(404, "Unknown room code.")
+    @api.response(422, f"Too many days (more than {MAX_ANALYTICS_DAYS}).")
+    def get(self):
+        """Get the authors having booked the most hours of the rooms"""
+        with timed("parse"):
+            args = self.parser.parse_args(strict=True)
+        start_day, end_day, rooms = _validate_analytics_inputs(args)
+        res = top_authors(rooms, start_day, end_day, args["limit"])
+        with timed("marshal"):
+            return marshal([dict(zip(AUTHOR_USAGE_COLUMNS, row)) for row in res], author_usage_model), 200
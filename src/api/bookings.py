@@ -1,17 +1,67 @@
+import base64
 import datetime as dt
-from typing import Any, Dict
-
+import heapq
+from itertools import islice
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from flask import Response, request, stream_with_context
 from flask_restx import Namespace, Resource, fields, inputs, marshal
 from flask_restx.reqparse import RequestParser
-from pytz import timezone
-from sqlalchemy import func
-from werkzeug.exceptions import NotFound, UnprocessableEntity
-
-from lib.algorithms import get_available_slots, is_room_available
-from lib.sqlalchemy.session import new_session
-from lib.sqlalchemy.models import Booking, Room
-
-from api.rooms import room_model
+from werkzeug.exceptions import BadRequest, Conflict, HTTPException, NotFound, ServiceUnavailable, UnprocessableEntity
+
+from configs import config
+from lib.algorithms import (
+    EARLIEST_FIRST,
+    SMALLEST_ROOM_FIRST,
+    get_available_slot_rows_in_range,
+    get_available_slots,
+    get_available_slots_in_range,
+    is_room_available,
+    search_free_slot_rows,
+    search_free_slots,
+)
+from lib.availability_cache import CacheKey, availability_cache
+from lib.bookings import (
+    delete_booking,
+    delete_recurring_booking,
+    insert_booking,
+    insert_bookings,
+    insert_recurring_booking,
+)
+from lib.catalog import RoomInfo, room_catalog
+from lib.change_feed import BookingEvent, change_feed
+from lib.hours import from_epoch_hour, is_whole_hour_offset, local_day, to_epoch_hour
+from lib.instrumentation import timed
+from lib.sqlalchemy.models import FREQUENCIES_IN_DAYS, Occurrence, RecurringBooking
+from lib.storage import BOOKING_ROW_COLUMNS, AnyBooking, BookingRow, current_storage
+from lib.write_queue import write_queue
+
+from api.rooms import room_model, room_row, serialize_room
+from api.serializers import compile_serializer, is_fast_serialization_enabled
+
+
+# Maximum number of days covered by a single computation of availabilities:
+MAX_AVAILABILITIES_DAYS = 31
+
+# Maximum number of days of the window of a search of free slots, and default and maximum numbers of its results:
+MAX_SEARCH_DAYS = 366
+DEFAULT_SEARCH_RESULTS = 10
+MAX_SEARCH_RESULTS = 100
+
+# Default and maximum numbers of bookings in a page of the list of bookings, and number of bookings fetched at once
+# when the list is streamed:
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+# Maximum number of bookings made by a single bulk request:
+MAX_BULK_BOOKINGS = 1000
+
+# Maximum number of days between the first and the last occurrences of a recurring booking:
+MAX_RECURRENCE_DAYS = 2 * 366
 
 
 # Initialize the collection of endpoints related to bookings themselves, that will be populated in this file:
@@ -37,6 +87,14 @@ room_availabilities_model = api.model("range_of_availabilities", {
         help="A range of available periods for this room."
     ),
 })
+found_slot_model = api.model("found_slot", {
+    "room_code": fields.String(description="Code (identifier) of a room.", example="room0"),
+    "capacity": fields.Integer(description="The maximum number of people who can sit in the room.", example=12),
+    "start_datetime": fields.DateTime(
+        description="The first hour of a run of free hours from which the room can be booked for the duration.",
+        example="2020-08-04 09:00:00",
+    ),
+})
 booking_short_model = api.model("bookings_collection_item", {
     "id": fields.Integer(description="Automatically generated identifier (number) of the booking."),
     "author": fields.String(description="Name of the booking author."),
@@ -50,11 +108,89 @@ booking_short_model = api.model("bookings_collection_item", {
         description="The number of hours for which the booking must be registered.",
         example="2",
     ),
-    "room_code": fields.String(description="Identifier code of the booked room.", example="room0")
+    "room_code": fields.String(description="Identifier code of the booked room.", example="room0"),
+    "recurring_booking_id": fields.Integer(
+        description="For an occurrence of a recurring booking (which has no id of its own), the id of the latter."
+    ),
 })
 booking_model = api.clone("single_booking", booking_short_model, {
     "room": fields.Nested(room_model, description="Full information about the booked room.")
 })
+recurring_booking_model = api.model("recurring_booking", {
+    "id": fields.Integer(description="Automatically generated identifier (number) of the recurring booking."),
+    "author": fields.String(description="Name of the booking author."),
+    "start_datetime": fields.DateTime(
+        description="Start date and hour of the first occurrence in ISO 8601 format.",
+        example="2020-08-03 09:00:00",
+    ),
+    "duration_in_hours": fields.Integer(
+        attribute="duration",
+        description="The number of hours for which each occurrence is booked.",
+        example="2",
+    ),
+    "room_code": fields.String(description="Identifier code of the booked room.", example="room0"),
+    "frequency": fields.String(description="The unit of the interval between occurrences.", enum=["daily", "weekly"]),
+    "interval": fields.Integer(description="Number of days or weeks between two occurrences.", example=1),
+    "until": fields.Date(description="The day of the last possible occurrence (included).", example="2021-08-02"),
+})
+booking_input_model = api.model("booking_request", {
+    "author": fields.String(description="The name of the person for whom the booking is made.", required=True),
+    "start_datetime": fields.DateTime(
+        description="The datetime at which the booking must start (no minutes nor seconds are allowed).",
+        example="2020-08-04 09:00:00",
+        required=True,
+    ),
+    "duration_in_hours": fields.Integer(description="Number of hours for which the booking will last.", required=True),
+    "room_code": fields.String(description="Identifier of the room to book.", example="room0", required=True),
+})
+bulk_bookings_model = api.model("bulk_booking_request", {
+    "bookings": fields.List(fields.Nested(booking_input_model), required=True),
+})
+bulk_booking_result_model = api.model("bulk_booking_result", {
+    "index": fields.Integer(description="Position of the booking in the request."),
+    "status": fields.Integer(
+        description="The status that a single POST /booking/ would have returned: 201, 400, 404, 409 or 422.",
+        example=201,
+    ),
+    "message": fields.String(description="Explanation of the failure, if any."),
+    "booking": fields.Nested(booking_short_model, allow_null=True, description="The booking, if it was made."),
+})
+
+
+# Serializers of the output models from rows (made of the BOOKING_COLUMNS for bookings and their occurrences):
+BOOKING_COLUMNS = (*BOOKING_ROW_COLUMNS, "room")
+
+
+def _localized_start_datetime(row: tuple) -> dt.datetime:
+    return from_epoch_hour(row[2], room_catalog.time_zone(row[4]))
+
+
+def _occurrence_row(occurrence: Occurrence) -> tuple:
+    return (
+        None,
+        occurrence.author,
+        occurrence.start_hour,
+        occurrence.duration,
+        occurrence.room_code,
+        occurrence.recurring_booking_id,
+    )
+
+
+serialize_booking_short = compile_serializer(
+    booking_short_model, BOOKING_COLUMNS, computed={"start_datetime": _localized_start_datetime}
+)
+serialize_booking = compile_serializer(
+    booking_model,
+    BOOKING_COLUMNS,
+    computed={"start_datetime": _localized_start_datetime},
+    nested={"room": serialize_room},
+)
+serialize_room_availabilities = compile_serializer(
+    room_availabilities_model,
+    ("room_code", "free_slots"),
+    nested={"free_slots": compile_serializer(available_period_model, ("start_datetime", "duration_in_hours"))},
+)
+serialize_found_slot = compile_serializer(found_slot_model, ("room_code", "capacity", "start_datetime"))
 
 
 # Definitions of inputs parser(s) and/or validator(s):
@@ -64,14 +200,105 @@ def _list_parser() -> RequestParser:
     parser.add_argument(
         "day",
         type=inputs.date_from_iso8601,
-        default=lambda: dt.datetime.now().date().isoformat(),
-        help="Filter the bookings planned during this day.",
+        default=dt.date.today,
+        help="Filter the bookings planned during this day (defaults to today).",
+        location="args",
+    )
+    parser.add_argument(
+        "end_day",
+        type=inputs.date_from_iso8601,
+        help="Filter the bookings planned from the day above to this one, included (defaults to the day above).",
         location="args",
     )
     parser.add_argument("room_code", type=str, help="Filter bookings taking place in this room.", location="args")
+    parser.add_argument(
+        "limit",
+        type=inputs.int_range(1, MAX_PAGE_SIZE),
+        help=f"Maximum number of bookings to return (by default, {DEFAULT_PAGE_SIZE}, or all of them when streaming).",
+        location="args",
+    )
+    parser.add_argument(
+        "cursor",
+        type=str,
+        help="Return the bookings following this cursor, sent in the X-Next-Cursor header of the previous page.",
+        location="args",
+    )
+    parser.add_argument(
+        "format",
+        type=str,
+        choices=("json", "ndjson"),
+        default="json",
+        help="Either a page of bookings as a JSON list, or a stream of bookings as newline-delimited JSON.",
+        location="args",
+    )
     return parser
 
 
+#
+# Keyset pagination of the lists of bookings, ordered by start hour (i.e. by start instant, whatever the time zones of
+# the rooms) then by identifier. The occurrences of recurring bookings come after the bookings starting at the same
+# hour, ordered by the id of their recurring booking:
+#
+_ListingKey = Tuple[int, int, int]
+
+
+def _listing_key(item: Union[AnyBooking, Occurrence]) -> _ListingKey:
+    if isinstance(item, Occurrence):
+        return item.start_hour, 1, item.recurring_booking_id
+    return item.start_hour, 0, item.id
+
+
+def _row_listing_key(row: tuple) -> _ListingKey:
+    if row[5] is not None:
+        return row[2], 1, row[5]
+    return row[2], 0, row[0]
+
+
+def _encode_cursor(key: _ListingKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> _ListingKey:
+    try:
+        start_hour, kind, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(start_hour), int(kind), int(id)
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid cursor: it must be copied from the X-Next-Cursor header of the previous page.")
+
+
+def _bookings_after(cursor: _ListingKey) -> Tuple[int, Optional[int]]:
+    """The (start_hour, id) after which the bookings come (the id being None to skip all those of the hour)."""
+    start_hour, kind, id = cursor
+    return start_hour, None if kind == 1 else id
+
+
+class _ListingInputs(NamedTuple):
+    first_day: Optional[dt.date]
+    last_day: Optional[dt.date]
+    limit: Optional[int]
+    cursor: Optional[_ListingKey]
+    is_streamed: bool
+    filters: Dict[str, Any]
+
+
+def _validate_listing_inputs(args: Dict[str, Any]) -> _ListingInputs:
+    """Split the inputs of the list of bookings, and keep only the actual filters on columns."""
+    args = dict(args)
+    first_day = args.pop("day")
+    last_day = args.pop("end_day") or first_day
+    if last_day < first_day:
+        raise UnprocessableEntity("The end_day must not precede the day.")
+    cursor = args.pop("cursor")
+    return _ListingInputs(
+        first_day=first_day,
+        last_day=last_day,
+        limit=args.pop("limit"),
+        cursor=_decode_cursor(cursor) if cursor else None,
+        is_streamed=args.pop("format") == "ndjson",
+        filters={key: value for key, value in args.items() if value is not None},
+    )
+
+
 def _post_parser() -> RequestParser:
     parser = RequestParser()
     parser.add_argument("author", type=str, required=True, help="The name of the person for whom the booking is made.")
@@ -99,8 +326,7 @@ def _validate_booking_inputs(input_args: Dict[str, Any]) -> Dict[str, Any]:
     duration: int = input_args["duration_in_hours"]
 
     # Check that the room_code refers to an existing room:
-    db_session = new_session()
-    room = db_session.query(Room).get(room_code)
+    room = room_catalog.get(room_code)
     if not room:
         raise NotFound(f"No room bearing the code {room_code}. Please provide a valid one.")
 
@@ -111,12 +337,19 @@ def _validate_booking_inputs(input_args: Dict[str, Any]) -> Dict[str, Any]:
         )
 
     # Make the start datetime localized in the same time zone as the room:
-    local_tz = timezone(room.building.tz_name)
+    local_tz = room.tz
     if start_datetime.tzinfo is None:
         output_args["start_datetime"] = local_tz.localize(start_datetime)
     else:
         output_args["start_datetime"] = start_datetime.astimezone(local_tz)
 
+    # Check that it is an hour start in the time zone of the room too, since the bookings are stored as hours:
+    if output_args["start_datetime"].minute != 0 or not is_whole_hour_offset(output_args["start_datetime"]):
+        raise UnprocessableEntity(
+            "The offset of the start_datetime must be made of entire hours, as well as the one of the time zone of "
+            "the room."
+        )
+
     # Check that the booking duration does not lead to the next day:
     if not 0 < duration <= 25:
         raise UnprocessableEntity(
@@ -124,25 +357,278 @@ def _validate_booking_inputs(input_args: Dict[str, Any]) -> Dict[str, Any]:
             "The parameter duration_in_hours must be a positive number less or equal to 24."
         )
 
-    db_session.close()
+    return output_args
+
+
+def _post_recurring_parser() -> RequestParser:
+    parser = _post_parser()
+    parser.add_argument(
+        "frequency",
+        type=str,
+        choices=tuple(FREQUENCIES_IN_DAYS),
+        required=True,
+        help="Whether the booking is repeated every interval days or every interval weeks.",
+    )
+    parser.add_argument("interval", type=int, default=1, help="Number of days or weeks between two occurrences.")
+    parser.add_argument(
+        "until",
+        type=inputs.date_from_iso8601,
+        required=True,
+        help="The day of the last possible occurrence (included)."
+    )
+    return parser
+
+
+def _validate_recurring_booking_inputs(input_args: Dict[str, Any]) -> Dict[str, Any]:
+    # Check the first occurrence as a single booking:
+    output_args = _validate_booking_inputs(input_args)
+    first_day: dt.date = output_args["start_datetime"].date()
+    until: dt.date = input_args["until"]
+    interval: int = input_args["interval"]
+
+    # Check the recurrence itself:
+    if interval < 1:
+        raise UnprocessableEntity("The interval between two occurrences must be a positive number.")
+    if not 0 <= (until - first_day).days <= MAX_RECURRENCE_DAYS:
+        raise UnprocessableEntity(
+            f"The last occurrence must come after the first one, by less than {MAX_RECURRENCE_DAYS} days."
+        )
+    if input_args["duration_in_hours"] > 24 * FREQUENCIES_IN_DAYS[input_args["frequency"]] * interval:
+        raise UnprocessableEntity("An occurrence must not last until the next one.")
 
     return output_args
 
 
+def _parse_bulk_item(parser: RequestParser, item: Any) -> Dict[str, Any]:
+    """Parse one of the bookings of a bulk request exactly as the payload of a single booking."""
+    if not isinstance(item, dict):
+        raise BadRequest("Each booking must be an object.")
+    with timed("parse"):
+        return parser.parse_args(req=SimpleNamespace(json=item, values={}), strict=True)
+
+
+def _error_message(error: HTTPException) -> str:
+    """The message that would have been returned in the body of the error response."""
+    data = getattr(error, "data", None) or {}
+    message = data.get("message", error.description)
+    if data.get("errors"):
+        message += ": " + " ".join(f"{name}: {details}" for name, details in data["errors"].items())
+    return message
+
+
 def _post_computation_parser() -> RequestParser:
     parser = RequestParser()
     parser.add_argument(
         "target_day",
         type=inputs.date_from_iso8601,
-        required=True,
-        help="The start datetime of the day for which we want to compute availabilities.",
-        default=lambda: dt.datetime.now().date().isoformat()
+        help="The day for which we want to compute availabilities (defaults to today).",
+        default=dt.date.today,
+    )
+    parser.add_argument(
+        "start_day",
+        type=inputs.date_from_iso8601,
+        help="Instead of a single target_day, compute availabilities for all days from this one...",
+    )
+    parser.add_argument(
+        "end_day",
+        type=inputs.date_from_iso8601,
+        help="... to this one, included (defaults to start_day).",
     )
     parser.add_argument("room_code", type=str, help="Identifier of the room for which to compute availabilities.")
     parser.add_argument("floor", type=int, help="If no room_code, compute availabilities for all rooms of this floor.")
     return parser
 
 
+def _validate_computation_inputs(args: Dict[str, Any]) -> Tuple[dt.date, dt.date, List[str]]:
+    """Return the range of days, and the codes of the rooms, for which availabilities must be computed."""
+    start_day = args.get("start_day") or args["target_day"]
+    end_day = args.get("end_day") or start_day
+    if not 0 <= (end_day - start_day).days < MAX_AVAILABILITIES_DAYS:
+        raise UnprocessableEntity(
+            f"The end_day must follow the start_day by less than {MAX_AVAILABILITIES_DAYS} days."
+        )
+    room_code = args.get("room_code")
+    floor = args.get("floor")
+
+    # Get the rooms for which the computations must be done:
+    if room_code:
+        room = room_catalog.get(room_code)
+        if not room:
+            raise NotFound(f"Unknown room code: {room_code}.")
+        rooms = [room]
+    elif floor is not None:
+        rooms = room_catalog.on_floor(floor)
+    else:
+        rooms = room_catalog.all()
+    return start_day, end_day, [r.code for r in rooms]
+
+
+def _post_search_parser() -> RequestParser:
+    parser = RequestParser()
+    parser.add_argument(
+        "duration_in_hours", type=int, required=True, help="Number of hours for which a room must be free."
+    )
+    parser.add_argument(
+        "start_day",
+        type=inputs.date_from_iso8601,
+        help="The first day of the window in which to search (defaults to today).",
+        default=dt.date.today,
+    )
+    parser.add_argument(
+        "end_day",
+        type=inputs.date_from_iso8601,
+        help="The last day of the window, included (defaults to start_day). A found slot ends before its end.",
+    )
+    parser.add_argument("min_capacity", type=int, help="Only search the rooms which can sit this number of people.")
+    parser.add_argument("floor", type=int, help="Only search the rooms of this floor.")
+    parser.add_argument(
+        "limit",
+        type=inputs.int_range(1, MAX_SEARCH_RESULTS),
+        default=DEFAULT_SEARCH_RESULTS,
+        help=f"Maximum number of found slots (at most {MAX_SEARCH_RESULTS}).",
+    )
+    parser.add_argument(
+        "order_by",
+        type=str,
+        choices=(EARLIEST_FIRST, SMALLEST_ROOM_FIRST),
+        default=EARLIEST_FIRST,
+        help="Return the earliest slots first, or the slots of the smallest rooms first (then the earliest ones).",
+    )
+    return parser
+
+
+def _validate_search_inputs(args: Dict[str, Any]) -> Tuple[dt.date, dt.date, int, List[RoomInfo]]:
+    """Return the window of days, the duration and the rooms in which free slots must be searched."""
+    start_day = args["start_day"]
+    end_day = args.get("end_day") or start_day
+    if not 0 <= (end_day - start_day).days < MAX_SEARCH_DAYS:
+        raise UnprocessableEntity(f"The end_day must follow the start_day by less than {MAX_SEARCH_DAYS} days.")
+    duration = args["duration_in_hours"]
+    if not 0 < duration <= 25:
+        raise UnprocessableEntity(
+            "No booking duration is allowed to exceed a day. "
+            "The parameter duration_in_hours must be a positive number less or equal to 24."
+        )
+
+    # Get the rooms in which to search:
+    floor = args.get("floor")
+    min_capacity = args.get("min_capacity")
+    rooms = room_catalog.all() if floor is None else room_catalog.on_floor(floor)
+    if min_capacity is not None:
+        rooms = [room for room in rooms if room.capacity is not None and room.capacity >= min_capacity]
+    return start_day, end_day, duration, rooms
+
+
+def _events_parser() -> RequestParser:
+    parser = RequestParser()
+    parser.add_argument(
+        "room_code",
+        type=str,
+        action="append",
+        help="Only follow the bookings of this room (can be repeated).",
+        location="args",
+    )
+    parser.add_argument("floor", type=int, help="Only follow the bookings of the rooms of this floor.", location="args")
+    parser.add_argument(
+        "start_day",
+        type=inputs.date_from_iso8601,
+        help="Only follow the bookings covering a day from this one...",
+        location="args",
+    )
+    parser.add_argument("end_day", type=inputs.date_from_iso8601, help="... to this one, included.", location="args")
+    parser.add_argument(
+        "last_event_id",
+        type=int,
+        help="Resume after this event (the Last-Event-ID header, sent by clients reconnecting, takes precedence).",
+        location="args",
+    )
+    return parser
+
+
+def _validate_events_inputs(
+    args: Dict[str, Any], last_event_id_header: Optional[str]
+) -> Tuple[Optional[int], Callable[[BookingEvent], bool]]:
+    """Return the id of the event after which to resume, if any, and the filter of the followed events."""
+    last_event_id = last_event_id_header or args.get("last_event_id")
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            raise BadRequest("The Last-Event-ID header must be the id of an event.")
+    room_codes = set(args.get("room_code") or ())
+    for room_code in room_codes:
+        if not room_catalog.get(room_code):
+            raise NotFound(f"Unknown room code: {room_code}.")
+    floor = args.get("floor")
+    start_day = args.get("start_day") or dt.date.min
+    end_day = args.get("end_day") or dt.date.max
+
+    def matches(event: BookingEvent) -> bool:
+        if room_codes and event.room_code not in room_codes:
+            return False
+        # (the room may have been removed from the catalog since the event)
+        room = room_catalog.get(event.room_code)
+        if room is None or (floor is not None and room.floor != floor):
+            return False
+        return local_day(event.start_hour, room.tz) <= end_day and \
+            start_day <= local_day(event.start_hour + event.duration - 1, room.tz)
+
+    return last_event_id, matches
+
+
+def _heartbeat_message(last_event_id: int) -> str:
+    """The server-sent event moving the id of the last event of the client forward, past the events not matching."""
+    return f"id: {last_event_id}\n\n"
+
+
+def _reset_message(last_event_id: int) -> str:
+    """The server-sent event telling the client that some events were lost: it must get the bookings again."""
+    return f"id: {last_event_id}\nevent: reset\ndata: {{}}\n\n"
+
+
+def _event_messages(events: List[BookingEvent], matches: Callable[[BookingEvent], bool]) -> str:
+    """The server-sent events of the matching events."""
+    messages = []
+    for event in events:
+        if matches(event):
+            row = (event.booking_id, event.author, event.start_hour, event.duration, event.room_code, None)
+            data = json.dumps(serialize_booking_short(row))
+            messages.append(f"id: {event.id}\nevent: {event.kind}\ndata: {data}\n\n")
+    return "".join(messages)
+
+
+def _event_stream(last_event_id: Optional[int], matches: Callable[[BookingEvent], bool]) -> Iterator[str]:
+    """
+    Yield the matching events following the last one, as server-sent events, until the stream has lasted long enough.
+    The heartbeats also move the id of the last event of the client forward, past the events which did not match.
+    """
+    if last_event_id is None:
+        last_event_id = change_feed.last_id
+    elif not change_feed.can_resume_after(last_event_id):
+        last_event_id = change_feed.last_id
+        yield _reset_message(last_event_id)
+    deadline = time.monotonic() + config.CHANGE_FEED_STREAM_DURATION_IN_SECONDS
+    while True:
+        remaining_seconds = deadline - time.monotonic()
+        if remaining_seconds <= 0:
+            return
+        events = change_feed.wait_after(last_event_id, min(config.CHANGE_FEED_HEARTBEAT_IN_SECONDS, remaining_seconds))
+        if not events:
+            yield _heartbeat_message(last_event_id)
+            continue
+        messages = _event_messages(events, matches)
+        if messages:
+            yield messages
+        last_event_id = events[-1].id
+
+
+def _conflict_response(room_code: str, day: dt.date) -> Tuple[Dict[str, Any], int]:
+    """The response to a booking request overlapping another booking: the free slots of the room during the day."""
+    room_availability_info = get_available_slots(day, room_codes=[room_code])
+    assert len(room_availability_info) == 1
+    return marshal(room_availability_info[0], room_availabilities_model), 409
+
+
 #
 # Endpoints:
 #
@@ -153,25 +639,72 @@ class BookingsResource(Resource):
 
     @api.doc("list_bookings")
     @api.expect(list_parser)
-    @api.marshal_list_with(booking_short_model)
+    @api.response(200, "Success (see the X-Next-Cursor header for the next page).", [booking_short_model])
+    @api.response(400, "Invalid cursor.")
+    @api.response(422, "The end_day precedes the day.")
     def get(self):
-        """List all bookings"""
+        """List all bookings, page by page or as a stream"""
         # Get the filters from inputs:
-        filters = self.list_parser.parse_args(strict=True)
-
-        # Build the filtered query:
-        db_session = new_session()
-        query = db_session.query(Booking)
-        day_filter_value = filters.pop("day")
-        if day_filter_value:
-            query = query.filter(func.DATE(Booking.start_datetime) == day_filter_value)
-        actual_filters = {key: value for key, value in filters.items() if value is not None}
-        query = query.filter_by(**actual_filters)
-
-        # Return all matching results:
-        bookings = query.all()
-        db_session.close()
-        return bookings, 200
+        with timed("parse"):
+            args = self.list_parser.parse_args(strict=True)
+        first_day, last_day, limit, cursor, is_streamed, actual_filters = _validate_listing_inputs(args)
+
+        # Choose between rows with their compiled serializer, or objects to marshal:
+        is_fast = is_fast_serialization_enabled("list_bookings")
+        if is_fast:
+            listing_key, serialize = _row_listing_key, serialize_booking_short
+        else:
+            listing_key, serialize = _listing_key, None
+
+        # Select the matching bookings, in the order of the pages:
+        storage = current_storage()
+
+        def bookings(limit: Optional[int] = None) -> Iterable[Union[AnyBooking, BookingRow]]:
+            return storage.bookings_between(
+                first_day,
+                last_day,
+                after=_bookings_after(cursor) if cursor else None,
+                limit=limit,
+                as_rows=is_fast,
+                batch_size=STREAM_BATCH_SIZE,
+                **actual_filters,
+            )
+
+        # Get the occurrences of the matching recurring bookings during the days, expanded in memory:
+        occurrences = []
+        if first_day:
+            recurring_bookings = storage.recurring_bookings_between(first_day, last_day, **actual_filters)
+            occurrences = sorted(
+                (
+                    recurring_booking.occurrence(start_datetime)
+                    for recurring_booking in recurring_bookings
+                    for start_datetime in recurring_booking.occurrences_between(first_day, last_day)
+                ),
+                key=_listing_key,
+            )
+            if cursor:
+                occurrences = [occurrence for occurrence in occurrences if _listing_key(occurrence) > cursor]
+            if serialize:
+                occurrences = [_occurrence_row(occurrence) for occurrence in occurrences]
+        serialize = serialize or (lambda item: marshal(item, booking_short_model))
+
+        # Either stream all matching results, fetching them from the database by batches...
+        if is_streamed:
+            items = heapq.merge(bookings(), occurrences, key=listing_key)
+            if limit:
+                items = islice(items, limit)
+            lines = (json.dumps(serialize(item)) + "\n" for item in items)
+            return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+        # ... or return a page of them, along with the cursor of the next page if there is one:
+        limit = limit or DEFAULT_PAGE_SIZE
+        items = list(islice(heapq.merge(bookings(limit + 1), occurrences, key=listing_key), limit + 1))
+        headers = {}
+        if len(items) > limit:
+            items = items[:limit]
+            headers["X-Next-Cursor"] = _encode_cursor(listing_key(items[-1]))
+        with timed("marshal"):
+            return [serialize(item) for item in items], 200, headers
 
     post_parser = _post_parser()
 
@@ -188,30 +721,107 @@ class BookingsResource(Resource):
     def post(self):
         """Try to book a room"""
         # Get and validate inputs:
-        args = self.post_parser.parse_args(strict=True)
+        with timed("parse"):
+            args = self.post_parser.parse_args(strict=True)
         args = _validate_booking_inputs(args)
 
-        # Check the availability of the room for the requested period:
+        # Check the availability of the room for the requested period, without even opening a transaction if the
+        # index already knows that it is booked:
         room_code = args["room_code"]
         start_datetime = args["start_datetime"]
         if not is_room_available(room_code, start_datetime, args["duration_in_hours"]):
-            room_availability_info = get_available_slots(start_datetime.date(), room_codes=[room_code])
-            assert len(room_availability_info) == 1
-            return marshal(room_availability_info[0], room_availabilities_model), 409
+            return _conflict_response(room_code, start_datetime.date())
 
-        # Book the room:
-        new_booking = Booking(
-            author=args["author"],
-            start_datetime=start_datetime,
-            duration=args["duration_in_hours"],
-            room_code=room_code,
+        # Book the room (unless a concurrent request was faster):
+        start_hour = to_epoch_hour(start_datetime)
+        new_booking = current_storage().new_booking(
+            args["author"], start_hour, start_hour + args["duration_in_hours"], room_code
         )
-        db_session = new_session()
-        db_session.add(new_booking)
-        db_session.commit()
-        db_session.close()
+        is_inserted = write_queue.insert(new_booking) if config.WRITE_QUEUE_ENABLED else insert_booking(new_booking)
+        if not is_inserted:
+            return _conflict_response(room_code, start_datetime.date())
 
-        return marshal(new_booking, booking_model), 201
+        with timed("marshal"):
+            return marshal(new_booking, booking_model), 201
+
+
+@api.route("/bulk")
+class BulkBookingsResource(Resource):
+    """Actions on many Booking objects at once."""
+    item_parser = _post_parser()
+
+    @api.doc("post_bookings_in_bulk")
+    @api.expect(bulk_bookings_model)
+    @api.response(200, "The result of each booking, in the order of the request.", model=[bulk_booking_result_model])
+    @api.response(400, "The payload is not a list of bookings.")
+    @api.response(422, f"Too many bookings (more than {MAX_BULK_BOOKINGS}).")
+    def post(self):
+        """Try to book many rooms at once"""
+        # Get the list of bookings:
+        payload = request.get_json(silent=True)
+        items = payload.get("bookings") if isinstance(payload, dict) else None
+        if not isinstance(items, list):
+            raise BadRequest("The payload must be an object holding the list of bookings to make.")
+        if len(items) > MAX_BULK_BOOKINGS:
+            raise UnprocessableEntity(f"No more than {MAX_BULK_BOOKINGS} bookings can be made at once.")
+
+        # Parse and validate each of them, and prepare the valid ones:
+        results: List[Dict[str, Any]] = [{"index": index} for index in range(len(items))]
+        new_bookings: List[Tuple[int, AnyBooking]] = []
+        for index, item in enumerate(items):
+            try:
+                args = _validate_booking_inputs(_parse_bulk_item(self.item_parser, item))
+            except HTTPException as error:
+                results[index].update(status=error.code, message=_error_message(error))
+                continue
+            start_hour = to_epoch_hour(args["start_datetime"])
+            new_booking = current_storage().new_booking(
+                args["author"], start_hour, start_hour + args["duration_in_hours"], args["room_code"]
+            )
+            new_bookings.append((index, new_booking))
+
+        # Book all the rooms which are available, at once:
+        insertions = insert_bookings([new_booking for _, new_booking in new_bookings])
+        for (index, new_booking), is_inserted in zip(new_bookings, insertions):
+            if is_inserted:
+                results[index].update(status=201, booking=new_booking)
+            else:
+                results[index].update(
+                    status=409,
+                    message="The room is not available at this time, or was already booked by a previous item.",
+                )
+
+        with timed("marshal"):
+            return marshal(results, bulk_booking_result_model), 200
+
+
+@api.route("/events")
+class BookingEventsResource(Resource):
+    """Changes of the bookings, pushed to the clients."""
+    parser = _events_parser()
+
+    @api.doc("follow_booking_events")
+    @api.expect(parser)
+    @api.response(200, "A stream of server-sent events: booking_created, booking_deleted, or reset if some were lost.")
+    @api.response(404, "Unknown room code.")
+    @api.response(503, "Too many streams are open: retry later (see the Retry-After header).")
+    def get(self):
+        """Follow the creations and deletions of bookings, as server-sent events, resuming after the last one if any."""
+        with timed("parse"):
+            args = self.parser.parse_args(strict=True)
+        last_event_id, matches = _validate_events_inputs(args, request.headers.get("Last-Event-ID"))
+        if not change_feed.open_stream(config.CHANGE_FEED_MAX_STREAMS):
+            raise ServiceUnavailable(
+                "Too many clients are following the events.", retry_after=config.CHANGE_FEED_HEARTBEAT_IN_SECONDS
+            )
+        response = Response(
+            stream_with_context(_event_stream(last_event_id, matches)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # (even if the stream is never read)
+        response.call_on_close(change_feed.close_stream)
+        return response
 
 
 @api.route("/<int:id>")
@@ -219,30 +829,95 @@ class BookingResource(Resource):
     """Actions on a single Booking object that already exists."""
 
     @api.doc("get_booking")
-    @api.marshal_with(booking_model)
+    @api.response(200, "Success", booking_model)
     def get(self, id: int):
         """Get a booking from its id."""
-        db_session = new_session()
-        booking = db_session.query(Booking).get(id)
-        db_session.close()
+        if is_fast_serialization_enabled("get_booking"):
+            row = current_storage().get_booking_row(id)
+            if not row:
+                raise NotFound(f"This booking ID does not exist: {id}.")
+            # (the room is read from the catalog, instead of being joined)
+            with timed("marshal"):
+                return serialize_booking((*row, room_row(room_catalog.get(row[4])))), 200
+
+        booking = current_storage().get_booking(id)
         if not booking:
             raise NotFound(f"This booking ID does not exist: {id}.")
-        return booking, 200
+        with timed("marshal"):
+            return marshal(booking, booking_model), 200
 
     @api.doc("delete_booking")
     def delete(self, id: int):
         """Delete a booking identified by its id."""
-        db_session = new_session()
-
         # First check that this booking exists:
-        booking = db_session.query(Booking).get(id)
+        booking = current_storage().get_booking(id)
         if not booking:
             raise NotFound(f"This booking ID does not exist: {id}.")
 
         # Then delete it:
-        db_session.delete(booking)
-        db_session.commit()
-        db_session.close()
+        delete_booking(booking)
+
+        return None, 204
+
+
+@api.route("/recurring")
+class RecurringBookingsResource(Resource):
+    """Actions on RecurringBooking objects not involving an existing identifier."""
+    post_parser = _post_recurring_parser()
+
+    @api.doc("post_recurring_booking")
+    @api.expect(post_parser, validate=True)
+    @api.response(201, "The room was successfully booked for all occurrences.", model=recurring_booking_model)
+    @api.response(404, "Unknown room code.")
+    @api.response(409, "The room is not available for at least one of the occurrences.")
+    @api.response(422, "Invalid input (start_datetime, duration, interval or until).")
+    def post(self):
+        """Try to book a room repeatedly"""
+        # Get and validate inputs:
+        with timed("parse"):
+            args = self.post_parser.parse_args(strict=True)
+        args = _validate_recurring_booking_inputs(args)
+
+        # Book the room for all occurrences:
+        new_recurring_booking = RecurringBooking(
+            author=args["author"],
+            start_datetime=args["start_datetime"],
+            duration=args["duration_in_hours"],
+            room_code=args["room_code"],
+            frequency=args["frequency"],
+            interval=args["interval"],
+            until=args["until"],
+        )
+        if not insert_recurring_booking(new_recurring_booking):
+            raise Conflict("The room is already booked during at least one of the occurrences.")
+
+        with timed("marshal"):
+            return marshal(new_recurring_booking, recurring_booking_model), 201
+
+
+@api.route("/recurring/<int:id>")
+class RecurringBookingResource(Resource):
+    """Actions on a single RecurringBooking object that already exists."""
+
+    @api.doc("get_recurring_booking")
+    @api.marshal_with(recurring_booking_model)
+    def get(self, id: int):
+        """Get a recurring booking from its id."""
+        recurring_booking = current_storage().get_recurring_booking(id)
+        if not recurring_booking:
+            raise NotFound(f"This recurring booking ID does not exist: {id}.")
+        return recurring_booking, 200
+
+    @api.doc("delete_recurring_booking")
+    def delete(self, id: int):
+        """Delete a recurring booking, and all its occurrences."""
+        # First check that this recurring booking exists:
+        recurring_booking = current_storage().get_recurring_booking(id)
+        if not recurring_booking:
+            raise NotFound(f"This recurring booking ID does not exist: {id}.")
+
+        # Then delete it:
+        delete_recurring_booking(recurring_booking)
 
         return None, 204
 
@@ -254,28 +929,65 @@ class AvailabilitiesResource(Resource):
 
     @api.doc("compute_availabilities")
     @api.expect(parser, validate=True)
-    @api.marshal_list_with(room_availabilities_model)
+    @api.response(422, "Invalid range of days.")
+    @api.response(200, "Success (with an ETag).", [room_availabilities_model])
+    @api.response(304, "The availabilities did not change since the ETag of the If-None-Match header.")
     def post(self):
-        """Listing all availabilities for a given day, and for a given room if requested."""
+        """Listing all availabilities for a given day or range of days, and for a given room if requested."""
         # Get and validate inputs:
-        args = self.parser.parse_args(strict=True)
-        target_day = args["target_day"]
-        room_code = args.get("room_code")
-        floor = args.get("floor")
-
-        # Get the rooms for which the computations must be done:
-        db_session = new_session()
-        if room_code:
-            room = db_session.query(Room).get(room_code)
-            if not room:
-                raise NotFound(f"Unknown room code: {room_code}.")
-            rooms = [room]
-        elif floor is not None:
-            rooms = db_session.query(Room).filter_by(floor=floor).all()
-        else:
-            rooms = db_session.query(Room).all()
-        db_session.close()
-
-        # Compute availabilities for all these rooms:
-        availabilities = get_available_slots(target_day, room_codes=[r.code for r in rooms])
-        return availabilities, 200
+        with timed("parse"):
+            args = self.parser.parse_args(strict=True)
+        start_day, end_day, room_codes = _validate_computation_inputs(args)
+
+        # Get the cached availabilities of all these rooms, or compute and cache them:
+        key: CacheKey = (start_day, end_day, tuple(room_codes))
+        cached = availability_cache.get(key)
+        if cached is None:
+            generation = availability_cache.generation
+            cached = availability_cache.put(key, self._compute(start_day, end_day, room_codes), generation)
+
+        # Return them, unless the client already has them:
+        headers = {"ETag": f'"{cached.etag}"'}
+        if request.if_none_match.contains(cached.etag):
+            return None, 304, headers
+        return cached.data, 200, headers
+
+    @staticmethod
+    def _compute(start_day: dt.date, end_day: dt.date, room_codes: List[str]) -> List[Dict[str, Any]]:
+        if is_fast_serialization_enabled("compute_availabilities"):
+            rows = get_available_slot_rows_in_range(start_day, end_day, room_codes=room_codes)
+            with timed("marshal"):
+                return [serialize_room_availabilities(row) for row in rows]
+        availabilities = get_available_slots_in_range(start_day, end_day, room_codes=room_codes)
+        with timed("marshal"):
+            return marshal(availabilities, room_availabilities_model)
+
+
+@api.route("/search")
+class SearchResource(Resource):
+    """Search of free slots."""
+    parser = _post_search_parser()
+
+    @api.doc("search_free_slots")
+    @api.expect(parser, validate=True)
+    @api.response(422, "Invalid window of days or duration.")
+    @api.response(200, "Success", [found_slot_model])
+    def post(self):
+        """Find the first rooms and hours from which a room is free for a given duration, within a window of days."""
+        # Get and validate inputs:
+        with timed("parse"):
+            args = self.parser.parse_args(strict=True)
+        start_day, end_day, duration, rooms = _validate_search_inputs(args)
+
+        # Search the free slots, stopping as soon as enough are found:
+        if is_fast_serialization_enabled("search_free_slots"):
+            rows = search_free_slot_rows(
+                start_day, end_day, duration, rooms=rooms, limit=args["limit"], order=args["order_by"]
+            )
+            with timed("marshal"):
+                return [serialize_found_slot(row) for row in rows], 200
+        found_slots = search_free_slots(
+            start_day, end_day, duration, rooms=rooms, limit=args["limit"], order=args["order_by"]
+        )
+        with timed("marshal"):
+            return marshal(found_slots, found_slot_model), 200
@@ -1,9 +1,11 @@
-from flask_restx import Namespace, Resource, fields
+from flask_restx import Namespace, Resource, fields, inputs, marshal
 from flask_restx.reqparse import RequestParser
 from werkzeug.exceptions import NotFound
 
-from lib.sqlalchemy.session import new_session
-from lib.sqlalchemy.models import Room
+from lib.catalog import RoomInfo, room_catalog
+from lib.instrumentation import timed
+
+from api.serializers import compile_serializer, is_fast_serialization_enabled
 
 
 # Create the namespace of endpoints related to the rooms:
@@ -25,10 +27,27 @@ room_model = api.clone("single_room", room_short_model, {
 })
 
 
+# Serializers of the same models, from rows:
+ROOM_COLUMNS = ("code", "name", "floor", "capacity")
+serialize_room_short = compile_serializer(room_short_model, ROOM_COLUMNS[:2])
+serialize_room = compile_serializer(room_model, ROOM_COLUMNS)
+
+
+def room_row(room: RoomInfo) -> tuple:
+    """The row of a room of the catalog, made of the ROOM_COLUMNS."""
+    return room.code, room.name, room.floor, room.capacity
+
+
 # Inputs parser (for filters):
 def _list_parser() -> RequestParser:
     parser = RequestParser()
-    parser.add_argument("search_in_name", type=str, help="Filter rooms which name contains this text.", location="args")
+    parser.add_argument(
+        "search_in_name",
+        type=str,
+        help="Filter rooms which name contains this text (whatever the case and the accents), ranking first those "
+             "whose name, or else a word of it, starts with it.",
+        location="args",
+    )
     parser.add_argument("floor", type=int, help="Filter rooms located at this floor of the building.", location="args")
     parser.add_argument(
         "min_capacity",
@@ -36,6 +55,12 @@ def _list_parser() -> RequestParser:
         help="Filter rooms in which at least this number of people can sit.",
         location="args"
     )
+    parser.add_argument(
+        "limit",
+        type=inputs.positive,
+        help="Maximum number of rooms to return (by default, all of them).",
+        location="args",
+    )
     return parser
 
 
@@ -45,41 +70,37 @@ class RoomsResource(Resource):
 
     @api.doc("list_rooms")
     @api.expect(parser)
-    @api.marshal_list_with(room_short_model)
+    @api.response(200, "Success", [room_short_model])
     def get(self):
         """List all rooms"""
         # Get the input filters, if any:
-        filters = self.parser.parse_args(strict=True)
-        search_in_name = filters.get("search_in_name")
-        floor = filters.get("floor")
-        min_capacity = filters.get("min_capacity")
-
-        # Build the query:
-        db_session = new_session()
-        query = db_session.query(Room)
-        if search_in_name:
-            query = query.filter(Room.name.ilike(f"%{search_in_name}%"))
-        if floor is not None:
-            query = query.filter_by(floor=floor)
-        if min_capacity:
-            query = query.filter(Room.capacity >= min_capacity)
+        with timed("parse"):
+            filters = self.parser.parse_args(strict=True)
+        # Search the rooms in the index of the catalog:
+        res = room_catalog.search(
+            filters.get("search_in_name"), filters.get("floor"), filters.get("min_capacity"), filters.get("limit")
+        )
 
         # Return all matching results:
-        res = query.all()
-        db_session.close()
-        return res, 200
+        if is_fast_serialization_enabled("list_rooms"):
+            with timed("marshal"):
+                return [serialize_room_short(room_row(room)) for room in res], 200
+        with timed("marshal"):
+            return marshal(res, room_short_model), 200
 
 
 @api.route("/<string:code>")
 class RoomResource(Resource):
 
     @api.doc("get_room")
-    @api.marshal_with(room_model)
+    @api.response(200, "Success", room_model)
     def get(self, code: str):
         """Get the room identified by the code."""
-        db_session = new_session()
-        room = db_session.query(Room).get(code)
-        db_session.close()
+        room = room_catalog.get(code)
         if not room:
             raise NotFound(f"The code {code} does not identify any room.")
-        return room, 200
+        if is_fast_serialization_enabled("get_room"):
+            with timed("marshal"):
+                return serialize_room(room_row(room)), 200
+        with timed("marshal"):
+            return marshal(room, room_model), 200
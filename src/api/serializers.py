@@ -0,0 +1,87 @@
+"""
+Serializers of the output models compiled once and for all, working from plain row tuples instead of ORM objects.
+
+flask_restx's marshal() looks every field up by name on every object, and the bookings localize their start datetime
+one by one through their room: on long lists, this dominates the time spent on responses. A compiled serializer
+knows the position of each field in the rows, along with its formatting function, and produces the same JSON.
+
+Each endpoint listed in the FAST_SERIALIZATION_ENDPOINTS configuration uses them, the others keep using marshal().
+"""
+import datetime as dt
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from flask_restx import Model, fields
+
+from configs import config
+
+
+Row = Sequence[Any]
+Serializer = Callable[[Row], Dict[str, Any]]
+
+
+def is_fast_serialization_enabled(endpoint: str) -> bool:
+    """Whether the endpoint (identified as in its documentation) must serialize its responses from rows."""
+    return endpoint in config.FAST_SERIALIZATION_ENDPOINTS
+
+
+def _format_datetime(value: dt.datetime) -> str:
+    return value.isoformat()
+
+
+def _format_date(value: dt.date) -> str:
+    return (value.date() if isinstance(value, dt.datetime) else value).isoformat()
+
+
+def _formatter(key: str, field: fields.Raw, nested: Dict[str, Serializer]) -> Callable[[Any], Any]:
+    """The function formatting the (not None) values of the field, like the field itself would."""
+    if isinstance(field, fields.Nested):
+        return nested[key]
+    if isinstance(field, fields.List) and isinstance(field.container, fields.Nested):
+        serialize_item = nested[key]
+        return lambda values: [serialize_item(value) for value in values]
+    if isinstance(field, fields.Date):
+        return _format_date
+    if isinstance(field, fields.DateTime) and field.dt_format == "iso8601":
+        return _format_datetime
+    if isinstance(field, fields.Integer):
+        return int
+    if isinstance(field, fields.String):
+        return str
+    raise TypeError(f"No compiled serialization for the field {key} ({type(field).__name__}).")
+
+
+def compile_serializer(
+    model: Model,
+    columns: Sequence[str],
+    computed: Optional[Dict[str, Callable[[Row], Any]]] = None,
+    nested: Optional[Dict[str, Serializer]] = None,
+) -> Serializer:
+    """
+    Compile the serializer of the rows made of the columns, in this order, into the fields of the model.
+
+    :param model: The output model to produce.
+    :param columns: The names of the values of the rows, as the attributes of the fields (which default to their key).
+    :param computed: The functions computing the values of some fields from the whole row, instead of a column.
+    :param nested: The serializers of the nested fields (or of the items of nested lists), from their own rows.
+    """
+    computed = computed or {}
+    nested = nested or {}
+    positions = {name: position for position, name in enumerate(columns)}
+
+    # Compile once the getter, formatting function and default output of each field:
+    compiled_fields: List[Tuple[str, Callable[[Row], Any], Callable[[Any], Any], Any]] = []
+    for key, field in model.items():
+        getter = computed.get(key) or itemgetter(positions[field.attribute or key])
+        formatter = _formatter(key, field, nested)
+        default = field.default
+        compiled_fields.append((key, getter, formatter, formatter(default) if default else default))
+
+    def serialize(row: Row) -> Dict[str, Any]:
+        serialized = {}
+        for key, getter, formatter, default in compiled_fields:
+            value = getter(row)
+            serialized[key] = default if value is None else formatter(value)
+        return serialized
+
+    return serialize
@@ -6,6 +6,13 @@ from flask import Flask
 from configs import config
 
 from api import api
+from lib.availability_cache import availability_cache
+from lib.catalog import room_catalog
+from lib.instrumentation import instrumentation
+from lib.occupancy import occupancy_index
+from lib.sqlalchemy.session import engine, remove_current_session
+from lib.storage import current_storage
+from lib.write_queue import write_queue
 
 
 # Create and configure the app:
@@ -13,10 +20,18 @@ def create_app() -> Flask:
     _app = Flask(__name__)
     _app.config.from_object(config)
     api.init_app(_app)
+    _app.teardown_appcontext(remove_current_session)
+    if config.INSTRUMENTATION_ENABLED:
+        instrumentation.install(_app, engine)
+        instrumentation.add_stats_source("room_catalog", room_catalog.stats)
+        instrumentation.add_stats_source("availability_cache", availability_cache.stats)
+        instrumentation.add_stats_source("storage", lambda: current_storage().stats())
+        instrumentation.add_stats_source("write_queue", write_queue.stats)
     return _app
 
 
 # Run it (for local use only):
 if __name__ == "workrooms_booking":
     app = create_app()
+    occupancy_index.rebuild()
     app.run()
@@ -0,0 +1,428 @@
+"""
+Create the application for the asynchronous serving mode (ASGI).
+
+The listing of bookings, the computation of availabilities and the lookup of rooms are served by coroutines: the
+listings query the database through aiosqlite, while the availabilities are computed from the occupancy index, loaded
+in memory at startup (only the changes of the other processes and the recurring bookings it forgot are read again,
+in a worker thread). A single process can then multiplex many concurrent requests of these kinds. The streams of
+events (GET /booking/events) are served by coroutines too, polling the change feed: they hold no thread while they
+last, and up to CHANGE_FEED_MAX_ASYNC_STREAMS of them can be followed at once.
+They accept the same inputs and return the same outputs as the endpoints of the namespaces (whose parsers, validators
+and serializers they reuse). All the other requests are handed over to the Flask application, in worker threads.
+The lookups which may still query the database through SQLAlchemy (the storage built on the first call, the catalog of
+rooms loaded again once expired, the changes journaled by the other processes applied to the occupancy index) are run
+in worker threads too, never within the event loop.
+
+With an in-memory storage engine, which never waits for I/O, the bookings are not read from the database: the
+listings are handed over to the Flask application too.
+"""
+import asyncio
+import datetime as dt
+from functools import partial
+import heapq
+from itertools import islice
+import json
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound, ServiceUnavailable
+from werkzeug.http import parse_etags
+
+from app import create_app
+from api.bookings import (
+    AvailabilitiesResource,
+    BookingEventsResource,
+    BookingsResource,
+    DEFAULT_PAGE_SIZE,
+    STREAM_BATCH_SIZE,
+    _encode_cursor,
+    _event_messages,
+    _heartbeat_message,
+    _listing_key,
+    _occurrence_row,
+    _reset_message,
+    _row_listing_key,
+    _validate_computation_inputs,
+    _validate_events_inputs,
+    _validate_listing_inputs,
+    serialize_booking_short,
+    serialize_room_availabilities,
+)
+from api.rooms import room_row, serialize_room
+from configs import config
+from lib.algorithms import get_available_slot_rows_in_range
+from lib.async_db import async_pool, format_datetime, parse_datetime
+from lib.availability_cache import availability_cache
+from lib.catalog import room_catalog
+from lib.change_feed import BookingEvent, change_feed
+from lib.hours import day_hours
+from lib.occupancy import occupancy_index
+from lib.sqlalchemy.models import RecurringBooking
+from lib.storage import current_storage
+
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+T = TypeVar("T")
+
+
+async def _in_thread(function: Callable[..., T], *args, **kwargs) -> T:
+    """Call a function which may wait for the database, in a worker thread (out of the event loop)."""
+    return await asyncio.get_running_loop().run_in_executor(None, partial(function, *args, **kwargs))
+
+
+#
+# Queries:
+#
+async def _fetch_recurring_bookings(where: str = "", parameters: Tuple = ()) -> List[RecurringBooking]:
+    """The recurring bookings as transient objects (never attached to a session)."""
+    rows = await async_pool.fetch_all(
+        "SELECT id, author, start_datetime, duration, room_code, frequency, interval, until "
+        f"FROM recurring_bookings {where};",
+        parameters,
+    )
+    return [
+        RecurringBooking(
+            id=id,
+            author=author,
+            start_datetime=parse_datetime(start_datetime),
+            duration=duration,
+            room_code=room_code,
+            frequency=frequency,
+            interval=interval,
+            until=dt.date.fromisoformat(until),
+        )
+        for id, author, start_datetime, duration, room_code, frequency, interval, until in rows
+    ]
+
+
+def _midnight(day: dt.date) -> dt.datetime:
+    return dt.datetime.combine(day, dt.time())
+
+
+def _starts_between(first_day: dt.date, last_day: dt.date, room_code: Optional[str]) -> Tuple[str, List[Any]]:
+    """The SQL condition of Booking.starts_between, along with its parameters."""
+    conditions, parameters = [], []
+    codes_per_time_zone = room_catalog.codes_per_time_zone(room_code)
+    for tz, room_codes in codes_per_time_zone.items():
+        condition = "start_hour >= ? AND start_hour < ?"
+        condition_parameters = [day_hours(tz, first_day)[0], day_hours(tz, last_day)[1]]
+        if len(codes_per_time_zone) > 1:
+            condition = f"room_code IN ({', '.join('?' * len(room_codes))}) AND {condition}"
+            condition_parameters = [*room_codes, *condition_parameters]
+        conditions.append(f"({condition})")
+        parameters += condition_parameters
+    return " OR ".join(conditions) or "0", parameters
+
+
+#
+# Streams:
+#
+async def _wait_for_disconnection(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _event_stream(
+    last_event_id: Optional[int], matches: Callable[[BookingEvent], bool], disconnection: asyncio.Future
+) -> AsyncIterator[str]:
+    """
+    Like api.bookings._event_stream, but reading the new events of the feed every CHANGE_FEED_POLL_INTERVAL_IN_SECONDS
+    instead of waiting for them in a thread, until the stream has lasted long enough or the client is gone.
+    """
+    if last_event_id is None:
+        last_event_id = await _in_thread(lambda: change_feed.last_id)
+    elif not await _in_thread(change_feed.can_resume_after, last_event_id):
+        last_event_id = await _in_thread(lambda: change_feed.last_id)
+        yield _reset_message(last_event_id)
+    deadline = time.monotonic() + config.CHANGE_FEED_STREAM_DURATION_IN_SECONDS
+    next_heartbeat = time.monotonic() + config.CHANGE_FEED_HEARTBEAT_IN_SECONDS
+    while True:
+        # (without waiting: the journal of the storage is read at once)
+        events = await _in_thread(change_feed.wait_after, last_event_id, 0)
+        now = time.monotonic()
+        if events:
+            # (the catalog of rooms may be loaded again to match them)
+            messages = await _in_thread(_event_messages, events, matches)
+            if messages:
+                yield messages
+            last_event_id = events[-1].id
+            next_heartbeat = now + config.CHANGE_FEED_HEARTBEAT_IN_SECONDS
+        elif now >= min(next_heartbeat, deadline):
+            yield _heartbeat_message(last_event_id)
+            next_heartbeat = now + config.CHANGE_FEED_HEARTBEAT_IN_SECONDS
+        if now >= deadline:
+            return
+        if not events:
+            timeout = min(now + config.CHANGE_FEED_POLL_INTERVAL_IN_SECONDS, next_heartbeat, deadline) - now
+            await asyncio.wait({disconnection}, timeout=timeout)
+            if disconnection.done():
+                return
+
+
+#
+# Endpoints:
+#
+class _AsyncEndpoints:
+    """The endpoints served by coroutines, parsing their inputs within the context of the Flask application."""
+
+    def __init__(self, flask_app: Flask):
+        self._flask_app = flask_app
+
+    def _parse(self, parser, query: MultiDict, payload: Any) -> Dict[str, Any]:
+        # (the parsers read their configuration from the application)
+        with self._flask_app.app_context():
+            return parser.parse_args(req=SimpleNamespace(args=query, values=query, json=payload), strict=True)
+
+    async def list_bookings(self, query: MultiDict, _payload: Any, send: Send) -> None:
+        # (the validation, and the time zones of the rooms, may load the catalog: the other lookups then hit it)
+        first_day, last_day, limit, cursor, is_streamed, filters = await _in_thread(
+            _validate_listing_inputs, self._parse(BookingsResource.list_parser, query, None)
+        )
+        days_condition, days_parameters = await _in_thread(
+            _starts_between, first_day, last_day, filters.get("room_code")
+        )
+
+        # Build the filtered query, in the order of the pages:
+        conditions, parameters = [], []
+        for column in ("author", "room_code"):
+            if column in filters:
+                conditions.append(f"{column} = ?")
+                parameters.append(filters[column])
+        conditions.append(f"({days_condition})")
+        parameters += days_parameters
+        if cursor:
+            cursor_start, kind, cursor_id = cursor
+            if kind == 1:
+                conditions.append("start_hour > ?")
+                parameters.append(cursor_start)
+            else:
+                conditions.append("(start_hour > ? OR (start_hour = ? AND id > ?))")
+                parameters += [cursor_start, cursor_start, cursor_id]
+        sql = "SELECT id, author, start_hour, end_hour - start_hour, room_code, NULL FROM bookings " \
+              f"WHERE {' AND '.join(conditions)} ORDER BY start_hour, id"
+
+        # Get the occurrences of the matching recurring bookings during the days, expanded in memory:
+        recurring_conditions = ["start_datetime < ?", "until >= ?"]
+        recurring_parameters = [format_datetime(_midnight(last_day + dt.timedelta(1))), first_day.isoformat()]
+        for column in ("author", "room_code"):
+            if column in filters:
+                recurring_conditions.append(f"{column} = ?")
+                recurring_parameters.append(filters[column])
+        recurring_bookings = await _fetch_recurring_bookings(
+            f"WHERE {' AND '.join(recurring_conditions)}", tuple(recurring_parameters)
+        )
+        occurrences = sorted(
+            (
+                recurring_booking.occurrence(start_datetime)
+                for recurring_booking in recurring_bookings
+                for start_datetime in recurring_booking.occurrences_between(first_day, last_day)
+            ),
+            key=_listing_key,
+        )
+        occurrence_rows = [
+            _occurrence_row(occurrence) for occurrence in occurrences
+            if not cursor or _listing_key(occurrence) > cursor
+        ]
+
+        # Either stream all matching results, fetching them from the database by batches...
+        if is_streamed:
+            await _start_response(send, 200, "application/x-ndjson")
+            async with async_pool.connection() as connection:
+                async with connection.execute(sql + ";", parameters) as db_cursor:
+                    remaining = limit
+                    pending_occurrences = occurrence_rows
+                    while remaining is None or remaining > 0:
+                        batch = list(await db_cursor.fetchmany(STREAM_BATCH_SIZE))
+                        if batch:
+                            # (the occurrences before the last row of the batch can be merged with it)
+                            last_key = _row_listing_key(batch[-1])
+                            split = next(
+                                (i for i, row in enumerate(pending_occurrences) if _row_listing_key(row) > last_key),
+                                len(pending_occurrences),
+                            )
+                            items = list(heapq.merge(batch, pending_occurrences[:split], key=_row_listing_key))
+                            pending_occurrences = pending_occurrences[split:]
+                        else:
+                            items, pending_occurrences = pending_occurrences, []
+                        if remaining is not None:
+                            items, remaining = items[:remaining], remaining - len(items[:remaining])
+                        if not items:
+                            break
+                        body = "".join(json.dumps(serialize_booking_short(item)) + "\n" for item in items)
+                        await send({"type": "http.response.body", "body": body.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # ... or return a page of them, along with the cursor of the next page if there is one:
+        limit = limit or DEFAULT_PAGE_SIZE
+        rows = await async_pool.fetch_all(f"{sql} LIMIT ?;", (*parameters, limit + 1))
+        items = list(islice(heapq.merge(rows, occurrence_rows, key=_row_listing_key), limit + 1))
+        headers = {}
+        if len(items) > limit:
+            items = items[:limit]
+            headers["X-Next-Cursor"] = _encode_cursor(_row_listing_key(items[-1]))
+        await _send_json(send, 200, [serialize_booking_short(item) for item in items], headers)
+
+    async def compute_availabilities(self, query: MultiDict, payload: Any, if_none_match: str, send: Send) -> None:
+        start_day, end_day, room_codes = await _in_thread(
+            _validate_computation_inputs, self._parse(AvailabilitiesResource.parser, query, payload)
+        )
+        key = (start_day, end_day, tuple(room_codes))
+        # (the lookups of the cache and of the index first apply the changes journaled by the other processes)
+        cached = await _in_thread(availability_cache.get, key)
+        if cached is None:
+            generation = availability_cache.generation
+            rows = await _in_thread(get_available_slot_rows_in_range, start_day, end_day, room_codes=room_codes)
+            cached = availability_cache.put(key, [serialize_room_availabilities(row) for row in rows], generation)
+
+        headers = {"etag": f'"{cached.etag}"'}
+        if parse_etags(if_none_match).contains(cached.etag):
+            await _start_response(send, 304, "application/json", headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await _send_json(send, 200, cached.data, headers)
+
+    async def follow_booking_events(
+        self, query: MultiDict, last_event_id_header: Optional[str], receive: Receive, send: Send
+    ) -> None:
+        # (the validation may load the catalog)
+        last_event_id, matches = await _in_thread(
+            _validate_events_inputs, self._parse(BookingEventsResource.parser, query, None), last_event_id_header
+        )
+        if not change_feed.open_stream(config.CHANGE_FEED_MAX_ASYNC_STREAMS):
+            raise ServiceUnavailable(
+                "Too many clients are following the events.", retry_after=config.CHANGE_FEED_HEARTBEAT_IN_SECONDS
+            )
+        disconnection = asyncio.ensure_future(_wait_for_disconnection(receive))
+        try:
+            await _start_response(
+                send, 200, "text/event-stream", {"cache-control": "no-cache", "x-accel-buffering": "no"}
+            )
+            async for messages in _event_stream(last_event_id, matches, disconnection):
+                await send({"type": "http.response.body", "body": messages.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnection.cancel()
+            change_feed.close_stream()
+
+    async def get_room(self, code: str, send: Send) -> None:
+        room = await _in_thread(room_catalog.get, code)
+        if not room:
+            raise NotFound(f"The code {code} does not identify any room.")
+        await _send_json(send, 200, serialize_room(room_row(room)))
+
+
+#
+# Responses:
+#
+async def _start_response(send: Send, status: int, content_type: str, headers: Optional[Dict[str, str]] = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            *((name.encode(), value.encode()) for name, value in (headers or {}).items()),
+        ],
+    })
+
+
+async def _send_json(send: Send, status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+    # (formatted like the responses of flask_restx)
+    body = (json.dumps(data) + "\n").encode()
+    await _start_response(send, status, "application/json", {**(headers or {}), "content-length": str(len(body))})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_json(receive: Receive) -> Any:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise BadRequest("Failed to decode JSON object.")
+
+
+#
+# Application:
+#
+class AsgiApp:
+    """Route the requests either to the coroutines, or to the Flask application."""
+
+    _ROOM_PATH = re.compile(r"^/rooms/([^/]+)$")
+
+    def __init__(self, flask_app: Flask):
+        self._endpoints = _AsyncEndpoints(flask_app)
+        self._wsgi_app = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"]
+        room_match = self._ROOM_PATH.match(path)
+        is_listing = (method, path) == ("GET", "/booking/") and (await _in_thread(current_storage)).is_blocking
+        is_following = (method, path) == ("GET", "/booking/events")
+        if not is_listing and not is_following and (method, path) != ("POST", "/booking/compute-availabilities") and \
+                not (method == "GET" and room_match):
+            await self._wsgi_app(scope, receive, send)
+            return
+
+        try:
+            if room_match:
+                await self._endpoints.get_room(room_match.group(1), send)
+                return
+            query = MultiDict(parse_qsl(scope["query_string"].decode(), keep_blank_values=True))
+            headers = dict(scope.get("headers", ()))
+            if is_following:
+                last_event_id_header = headers[b"last-event-id"].decode() if b"last-event-id" in headers else None
+                await self._endpoints.follow_booking_events(query, last_event_id_header, receive, send)
+                return
+            payload = await _read_json(receive) if method == "POST" else None
+            if path == "/booking/":
+                await self._endpoints.list_bookings(query, payload, send)
+            else:
+                if_none_match = headers.get(b"if-none-match", b"").decode()
+                await self._endpoints.compute_availabilities(query, payload, if_none_match, send)
+        except HTTPException as error:
+            # (formatted like the errors of flask_restx, with their headers, e.g. Retry-After)
+            headers = {name.lower(): value for name, value in error.get_headers() if name.lower() != "content-type"}
+            await _send_json(send, error.code, getattr(error, "data", None) or {"message": error.description}, headers)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await async_pool.open()
+                # Load the catalog and the index at once, out of the event loop, like the synchronous application:
+                await asyncio.get_running_loop().run_in_executor(None, _warm_up)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_pool.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _warm_up() -> None:
+    room_catalog.all()
+    occupancy_index.rebuild()
+
+
+def create_asgi_app() -> AsgiApp:
+    return AsgiApp(create_app())
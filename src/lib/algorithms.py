@@ -2,37 +2,34 @@
 A collection of small algorithms serving business purposes.
 """
 import datetime as dt
-from typing import Dict, List, TypedDict
+from itertools import groupby
+from typing import List, Optional, Tuple, TypedDict
 
-from pytz import timezone
-from sqlalchemy import func
+from lib.catalog import RoomInfo, room_catalog
+from lib.hours import day_hours, from_epoch_hour, to_epoch_hour
+from lib.instrumentation import instrumented
+from lib.occupancy import fitting_run_starts, occupancy_index
 
-from lib.sqlalchemy.models import Booking, Room
-from lib.sqlalchemy.session import new_session
 
+# The fewest hours of a local day (when the offset of its time zone moves forward):
+_MIN_HOURS_PER_DAY = 23
 
+
+# Number of days of the window searched at once for free slots, before checking if enough were found:
+SEARCH_CHUNK_IN_DAYS = 7
+
+# The orders of the results of a search:
+EARLIEST_FIRST = "earliest"
+SMALLEST_ROOM_FIRST = "smallest_room"
+
+
+@instrumented("algorithm")
 def is_room_available(room_code: str, start_datetime: dt.datetime, duration_in_hours: int) -> bool:
     """
     Returns True if the room is available during the whole requested period, False otherwise.
+    The start_datetime is expected to be aware, in any time zone.
     """
-    # Get all bookings related to this room:
-    db_session = new_session()
-    daily_room_bookings = db_session.query(Booking) \
-        .filter_by(room_code=room_code) \
-        .filter(func.DATE(Booking.start_datetime) == start_datetime.date()) \
-        .all()
-
-    # Detect any booked period overlapping the requested one:
-    end_datetime = start_datetime + dt.timedelta(hours=duration_in_hours)
-    for booking in daily_room_bookings:
-        if start_datetime <= booking.start_datetime < end_datetime or \
-                start_datetime < booking.start_datetime + dt.timedelta(hours=booking.duration) <= end_datetime:
-            return False
-
-    db_session.close()
-
-    # If none was found, the room is available:
-    return True
+    return occupancy_index.is_free(room_code, to_epoch_hour(start_datetime), duration_in_hours)
 
 
 class FreeSlot(TypedDict):
@@ -49,68 +46,167 @@ def get_available_slots(requested_day: dt.date, *, room_codes: List[str]) -> Lis
     """
     Return the list of bookable periods during the requested day for the target rooms.
     """
-    # Get all bookings related to these rooms:
-    db_session = new_session()
-    requested_day_bookings = db_session.query(Booking) \
-        .filter(Booking.room_code.in_(room_codes), func.DATE(Booking.start_datetime) == requested_day) \
-        .order_by(Booking.room_code, Booking.start_datetime) \
-        .all()
-
-    # Reorganize the results per room:
-    bookings_per_room: Dict[str, List[Booking]] = {}
-    for booking in requested_day_bookings:
-        bookings_per_room.setdefault(booking.room_code, []).append(booking)
-
-    # Compute the remaining free slots...
+    return get_available_slots_in_range(requested_day, requested_day, room_codes=room_codes)
+
+
+# The same free slots as plain rows: (start_datetime, duration_in_hours) and (room_code, free slots):
+FreeSlotRow = Tuple[dt.datetime, int]
+RoomFreeSlotsRow = Tuple[str, List[FreeSlotRow]]
+
+
+@instrumented("algorithm")
+def get_available_slots_in_range(start_day: dt.date, end_day: dt.date, *, room_codes: List[str]) -> List[RoomFreeSlots]:
+    """
+    Return the list of bookable periods of the target rooms, day by day from start_day to end_day (both included).
+    The free slots never span over midnight: a fully free day is a single slot of all its hours (24, or 23 or 25 when
+    the offset of the time zone of the room changes during the day).
+    """
+    return [
+        {
+            "room_code": code,
+            "free_slots": [
+                {"start_datetime": start_datetime, "duration_in_hours": duration}
+                for start_datetime, duration in room_free_slots
+            ],
+        }
+        for code, room_free_slots in get_available_slot_rows_in_range(start_day, end_day, room_codes=room_codes)
+    ]
+
+
+@instrumented("algorithm")
+def get_available_slot_rows_in_range(
+    start_day: dt.date,
+    end_day: dt.date,
+    *,
+    room_codes: List[str],
+) -> List[RoomFreeSlotsRow]:
+    """Same as get_available_slots_in_range, but as plain rows."""
+    # Get the matrix of the free periods (rooms x days), materialized by the index:
+    days = [start_day + dt.timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    free_periods_matrix = occupancy_index.free_periods_matrix(room_codes, days)
+
+    # Localize the free slots of each room:
     free_slots = []
-    for code in room_codes:
-
-        # ... for the rooms that are free for the whole day (for which no booking exists):
-        if code not in bookings_per_room:
-            room = db_session.query(Room).get(code)
-            local_tz = timezone(room.building.tz_name)
-            requested_day_start = local_tz.localize(dt.datetime.combine(requested_day, dt.time()))
-            room_free_slots = [{"start_datetime": requested_day_start, "duration_in_hours": 24}]
-            free_slots.append({"room_code": code, "free_slots": room_free_slots})
-            continue
-
-        # ... for each room having at least one booking:
-        room_bookings = bookings_per_room[code]
-        room_free_slots = []
-
-        # ...   First, detect if there is a free slot before the first booking:
-        first_booking = room_bookings[0]
-        first_booking_start: dt.datetime = first_booking.start_datetime
-        local_tz = timezone(first_booking.room.building.tz_name)
-        requested_day_start = local_tz.localize(dt.datetime.combine(requested_day, dt.time()))
-        if first_booking_start.hour != 0:
-            room_free_slots.append(
-                {"start_datetime": requested_day_start, "duration_in_hours": first_booking_start.hour}
-            )
-
-        # ...   Second, detect all available slots between two bookings:
-        for i, booking in enumerate(requested_day_bookings[:-1]):
-            current_booking_end_datetime = booking.start_datetime + dt.timedelta(hours=booking.duration)
-            next_booking_start_datetime = requested_day_bookings[i+1].start_datetime
-            if current_booking_end_datetime != next_booking_start_datetime:
-                new_free_slot_timedelta = next_booking_start_datetime - current_booking_end_datetime
-                new_free_slot_duration_in_hours = int(new_free_slot_timedelta.total_seconds() // 3600)
-                room_free_slots.append(
-                    {
-                        "start_datetime": current_booking_end_datetime,
-                        "duration_in_hours": new_free_slot_duration_in_hours,
-                    }
-                )
-
-        # ...   Finally, detect if there is a free slot at the end of the day, after the last booking:
-        last_booking = requested_day_bookings[-1]
-        last_booking_end = last_booking.start_datetime + dt.timedelta(hours=last_booking.duration)
-        if last_booking_end.hour != 0:
-            room_free_slots.append({"start_datetime": last_booking_end, "duration_in_hours": 24-last_booking_end.hour})
-
-        # ...   Save the results:
-        free_slots.append({"room_code": code, "free_slots": room_free_slots})
-
-    db_session.close()
+    for code, room_free_periods in zip(room_codes, free_periods_matrix):
+        local_tz = room_catalog.time_zone(code)
+        room_free_slots = [
+            (from_epoch_hour(day_hours(local_tz, day)[0] + start_hour, local_tz), duration)
+            for day, day_free_periods in zip(days, room_free_periods)
+            for start_hour, duration in day_free_periods
+        ]
+        free_slots.append((code, room_free_slots))
 
     return free_slots
+
+
+class FoundSlot(TypedDict):
+    room_code: str
+    capacity: Optional[int]
+    start_datetime: dt.datetime
+
+
+# The same found slot as a plain row:
+FoundSlotRow = Tuple[str, Optional[int], dt.datetime]
+
+
+def search_free_slots(
+    start_day: dt.date,
+    end_day: dt.date,
+    duration_in_hours: int,
+    *,
+    rooms: List[RoomInfo],
+    limit: int,
+    order: str = EARLIEST_FIRST,
+) -> List[FoundSlot]:
+    """
+    Return up to limit periods of the requested duration during which one of the rooms is free, from start_day to
+    end_day (both included, in the local days of each room).
+    Only the first fitting start of each run of free hours is returned, either the earliest ones first, or the ones
+    of the smallest rooms first (then the earliest ones).
+    """
+    return [
+        {"room_code": code, "capacity": capacity, "start_datetime": start_datetime}
+        for code, capacity, start_datetime in search_free_slot_rows(
+            start_day, end_day, duration_in_hours, rooms=rooms, limit=limit, order=order
+        )
+    ]
+
+
+@instrumented("algorithm")
+def search_free_slot_rows(
+    start_day: dt.date,
+    end_day: dt.date,
+    duration_in_hours: int,
+    *,
+    rooms: List[RoomInfo],
+    limit: int,
+    order: str = EARLIEST_FIRST,
+) -> List[FoundSlotRow]:
+    """Same as search_free_slots, but as plain rows."""
+    if order == EARLIEST_FIRST:
+        return _search_earliest_free_slots(start_day, end_day, duration_in_hours, rooms, limit)
+
+    # Search the groups of rooms of the same capacity in turn, the smallest ones first (and the unknown ones last):
+    found: List[FoundSlotRow] = []
+    rooms = sorted(rooms, key=lambda room: (room.capacity is None, room.capacity or 0, room.code))
+    for _, same_capacity_rooms in groupby(rooms, key=lambda room: room.capacity):
+        if len(found) >= limit:
+            break
+        found += _search_earliest_free_slots(
+            start_day, end_day, duration_in_hours, list(same_capacity_rooms), limit - len(found)
+        )
+    return found
+
+
+def _search_earliest_free_slots(
+    start_day: dt.date,
+    end_day: dt.date,
+    duration_in_hours: int,
+    rooms: List[RoomInfo],
+    limit: int,
+) -> List[FoundSlotRow]:
+    """
+    Search the window chunk by chunk of days, in the order of time, and stop as soon as no later chunk can hold any
+    slot starting before the last of the limit earliest slots found so far.
+    """
+    found: List[Tuple[int, str, Optional[int]]] = []
+    room_codes = [room.code for room in rooms]
+    # (the days following a chunk that a slot starting in it may cover)
+    overflow_days = (duration_in_hours + _MIN_HOURS_PER_DAY - 2) // _MIN_HOURS_PER_DAY
+    chunk_start = start_day
+    while chunk_start <= end_day and rooms:
+        # (the time zones of the rooms may differ, so the chunk starts at the earliest of their local midnights)
+        if len(found) >= limit and min(day_hours(room.tz, chunk_start)[0] for room in rooms) > found[-1][0]:
+            break
+        chunk_end = min(chunk_start + dt.timedelta(days=SEARCH_CHUNK_IN_DAYS - 1), end_day)
+
+        # Get the bitmaps from the day before the chunk (to know where the runs of free hours start) to its overflow:
+        first_day = max(chunk_start - dt.timedelta(days=1), start_day)
+        last_day = min(chunk_end + dt.timedelta(days=overflow_days), end_day)
+        days = [first_day + dt.timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+        occupancy = occupancy_index.matrix(room_codes, days)
+
+        # Read the fitting starts of each room in its free hours, concatenated over the days (which are contiguous, but
+        # whose numbers of hours may vary):
+        for room, room_bitmaps in zip(rooms, occupancy):
+            first_hour = day_hours(room.tz, first_day)[0]
+            booked = 0
+            for day, bitmap in zip(days, room_bitmaps):
+                booked |= bitmap << day_hours(room.tz, day)[0] - first_hour
+            chunk_mask = (1 << day_hours(room.tz, chunk_end)[1] - first_hour) - \
+                (1 << day_hours(room.tz, chunk_start)[0] - first_hour)
+            all_days_mask = (1 << day_hours(room.tz, last_day)[1] - first_hour) - 1
+            starts = fitting_run_starts(~booked & all_days_mask, duration_in_hours) & chunk_mask
+            # (a room cannot hold more than limit of the results, the earliest ones)
+            for _ in range(limit):
+                if not starts:
+                    break
+                start_bit = starts & -starts
+                starts ^= start_bit
+                found.append((first_hour + start_bit.bit_length() - 1, room.code, room.capacity))
+        found.sort()
+        del found[limit:]
+        chunk_start = chunk_end + dt.timedelta(days=1)
+
+    time_zones = {room.code: room.tz for room in rooms}
+    return [(code, capacity, from_epoch_hour(start_hour, time_zones[code])) for start_hour, code, capacity in found]
@@ -0,0 +1,118 @@
+"""
+Usage of the rooms over ranges of days, computed from the daily rollups of the storage (see Storage.day_bitmaps), so
+that months of bookings are summed up without reading any of them.
+
+The available hours of a room are all the hours of its local days (23 or 25 of them when the offset of the time zone
+changes), and its booked hours are those of the bookings and of the occurrences of the recurring bookings.
+"""
+from dataclasses import dataclass
+import datetime as dt
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from lib.catalog import RoomInfo
+from lib.hours import day_hours, from_epoch_hour
+from lib.instrumentation import instrumented
+from lib.storage import AuthorUsageRow, current_storage
+
+
+# The levels at which the usage is grouped:
+BY_ROOM = "room"
+BY_FLOOR = "floor"
+BY_BUILDING = "building"
+
+
+@dataclass(frozen=True)
+class Utilization:
+    """The usage of a group of rooms: a room, a floor of a building, or a building (the finer keys being None)."""
+    building_id: int
+    floor: Optional[int]
+    room_code: Optional[str]
+    rooms: int
+    available_hours: int
+    booked_hours: int
+
+    @property
+    def utilization_rate(self) -> float:
+        return self.booked_hours / self.available_hours if self.available_hours else 0.
+
+
+@dataclass(frozen=True)
+class HourOccupancy:
+    """The usage of the rooms at a local hour of the day, over all the days of a range."""
+    hour: int
+    available_hours: int
+    booked_hours: int
+
+    @property
+    def occupancy_rate(self) -> float:
+        return self.booked_hours / self.available_hours if self.available_hours else 0.
+
+
+def _available_hours(tz: dt.tzinfo, first_day: dt.date, last_day: dt.date) -> int:
+    return day_hours(tz, last_day)[1] - day_hours(tz, first_day)[0]
+
+
+def _group_key(room: RoomInfo, group_by: str) -> Tuple[int, Optional[int], Optional[str]]:
+    if group_by == BY_BUILDING:
+        return room.building_id, None, None
+    if group_by == BY_FLOOR:
+        return room.building_id, room.floor, None
+    return room.building_id, room.floor, room.code
+
+
+@instrumented("algorithm")
+def utilization(rooms: List[RoomInfo], first_day: dt.date, last_day: dt.date, group_by: str) -> List[Utilization]:
+    """The usage of the rooms from first_day to last_day (both included), per group, in the order of their keys."""
+    booked_hours = current_storage().booked_hours_per_room([room.code for room in rooms], first_day, last_day)
+    totals: Dict[Tuple[int, Optional[int], Optional[str]], List[int]] = {}
+    for room in rooms:
+        total = totals.setdefault(_group_key(room, group_by), [0, 0, 0])
+        total[0] += 1
+        total[1] += _available_hours(room.tz, first_day, last_day)
+        total[2] += booked_hours.get(room.code, 0)
+    return [Utilization(*key, *total) for key, total in sorted(totals.items())]
+
+
+@lru_cache(maxsize=4096)
+def _local_hours(tz: dt.tzinfo, day: dt.date) -> Tuple[int, ...]:
+    """The local hour of the day of each of its hours, counted from its first one (see lib.hours.split_per_day)."""
+    first_hour, next_first_hour = day_hours(tz, day)
+    if next_first_hour - first_hour == 24:
+        return tuple(range(24))
+    return tuple(from_epoch_hour(hour, tz).hour for hour in range(first_hour, next_first_hour))
+
+
+@instrumented("algorithm")
+def hourly_occupancy(rooms: List[RoomInfo], first_day: dt.date, last_day: dt.date) -> List[HourOccupancy]:
+    """
+    The usage of the rooms at each local hour of the day, from first_day to last_day (both included), the busiest
+    hours first. An hour repeated by a change of offset counts twice, and an hour skipped by it does not count.
+    """
+    days = [first_day + dt.timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    rooms_per_time_zone: Dict[dt.tzinfo, int] = {}
+    for room in rooms:
+        rooms_per_time_zone[room.tz] = rooms_per_time_zone.get(room.tz, 0) + 1
+    available = [0] * 24
+    for tz, room_count in rooms_per_time_zone.items():
+        for day in days:
+            for hour in _local_hours(tz, day):
+                available[hour] += room_count
+
+    time_zones = {room.code: room.tz for room in rooms}
+    booked = [0] * 24
+    for room_code, day, bitmap in current_storage().day_bitmaps(list(time_zones), first_day, last_day):
+        local_hours = _local_hours(time_zones[room_code], day)
+        while bitmap:
+            bit = bitmap & -bitmap
+            booked[local_hours[bit.bit_length() - 1]] += 1
+            bitmap ^= bit
+
+    occupancies = [HourOccupancy(hour, available[hour], booked[hour]) for hour in range(24)]
+    return sorted(occupancies, key=lambda occupancy: (-occupancy.occupancy_rate, occupancy.hour))
+
+
+@instrumented("algorithm")
+def top_authors(rooms: List[RoomInfo], first_day: dt.date, last_day: dt.date, limit: int) -> List[AuthorUsageRow]:
+    """The authors having booked the most hours of the rooms from first_day to last_day (both included)."""
+    return current_storage().top_authors([room.code for room in rooms], first_day, last_day, limit)
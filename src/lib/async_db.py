@@ -0,0 +1,68 @@
+"""
+Asynchronous access to the SQLite database, for the requests served by the event loop (see asgi.py).
+
+The connections are configured like those of the SQLAlchemy engine, and shared between the coroutines through a pool.
+SQL queries are written by hand, with datetimes formatted as SQLAlchemy stores them.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import datetime as dt
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+import aiosqlite
+
+from configs import config
+
+
+# The format in which SQLAlchemy stores datetimes in SQLite:
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def format_datetime(value: dt.datetime) -> str:
+    return value.strftime(DATETIME_FORMAT)
+
+
+def parse_datetime(value: str) -> dt.datetime:
+    return dt.datetime.fromisoformat(value)
+
+
+class AsyncConnectionPool:
+    """A fixed number of connections, opened at once and lent to one coroutine at a time."""
+
+    def __init__(self, database: str, size: int):
+        self._database = database
+        self._size = size
+        self._connections: Optional[asyncio.Queue] = None
+
+    async def open(self) -> None:
+        self._connections = asyncio.Queue()
+        for _ in range(self._size):
+            connection = await aiosqlite.connect(self._database, timeout=config.DATABASE_BUSY_TIMEOUT_IN_SECONDS)
+            await connection.execute("PRAGMA journal_mode = WAL;")
+            await connection.execute("PRAGMA synchronous = NORMAL;")
+            await connection.execute(f"PRAGMA busy_timeout = {int(config.DATABASE_BUSY_TIMEOUT_IN_SECONDS * 1000)};")
+            self._connections.put_nowait(connection)
+
+    async def close(self) -> None:
+        for _ in range(self._size):
+            connection = await self._connections.get()
+            await connection.close()
+        self._connections = None
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Wait for a free connection, and give it back when the block ends."""
+        connection = await self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put_nowait(connection)
+
+    async def fetch_all(self, sql: str, parameters: Sequence[Any] = ()) -> List[tuple]:
+        async with self.connection() as connection:
+            async with connection.execute(sql, parameters) as cursor:
+                return list(await cursor.fetchall())
+
+
+# The pool shared by the whole process, opened and closed along with the ASGI application:
+async_pool = AsyncConnectionPool(config.DATABASE_URI.replace("sqlite:///", ""), config.DATABASE_POOL_SIZE)
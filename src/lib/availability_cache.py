@@ -0,0 +1,129 @@
+"""
+Cache of the computed availabilities, as they are returned by the API, along with their ETag.
+
+The same computations are requested again and again (e.g. today's availabilities of a whole floor, by kiosks and
+dashboards). Each one is cached per range of days and set of rooms, until any booking of one of these rooms is inserted
+or deleted during one of these days: the cache listens to the changes of the occupancy index. Entries also expire after
+a while, and the least recently used ones are evicted when the cache is full.
+"""
+from collections import OrderedDict
+import datetime as dt
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Set, Tuple
+
+from configs import config
+from lib.occupancy import occupancy_index
+
+
+# The range of days (both included) and the codes of the rooms of a computation:
+CacheKey = Tuple[dt.date, dt.date, Tuple[str, ...]]
+
+
+class CachedAvailabilities(NamedTuple):
+    data: Any
+    etag: str
+    expires_at: float
+
+
+def compute_etag(data: Any) -> str:
+    """The (unquoted) ETag of the data returned by the API."""
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()[:20]
+
+
+class AvailabilityCache:
+    """
+    The least recently used computations, by key, with their rooms indexed to invalidate them precisely.
+    To never store outdated data, a computation is only stored if no invalidation happened since its generation was
+    read, before it started.
+    """
+
+    def __init__(self, max_entries: int, ttl_in_seconds: float):
+        self._max_entries = max_entries
+        self._ttl_in_seconds = ttl_in_seconds
+        self._entries: "OrderedDict[CacheKey, CachedAvailabilities]" = OrderedDict()
+        self._keys_per_room: Dict[str, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._max_entries > 0
+
+    def get(self, key: CacheKey) -> Optional[CachedAvailabilities]:
+        """Return the cached computation, unless it is missing or expired."""
+        # (the changes made by the other processes invalidate the cache too)
+        occupancy_index.sync()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: CacheKey, data: Any, generation: int) -> CachedAvailabilities:
+        """Store the computation made since the generation, unless it may be outdated, and return it with its ETag."""
+        entry = CachedAvailabilities(data, compute_etag(data), time.monotonic() + self._ttl_in_seconds)
+        with self._lock:
+            if not self.is_enabled or generation != self.generation:
+                return entry
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            for room_code in key[2]:
+                self._keys_per_room.setdefault(room_code, set()).add(key)
+            while len(self._entries) > self._max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key: CacheKey) -> None:
+        del self._entries[key]
+        for room_code in key[2]:
+            room_keys = self._keys_per_room.get(room_code)
+            if room_keys is not None:
+                room_keys.discard(key)
+                if not room_keys:
+                    del self._keys_per_room[room_code]
+
+    def invalidate(self, room_code: Optional[str], day: Optional[dt.date]) -> None:
+        """Drop the computations covering the room during the day (any room or any day if None)."""
+        with self._lock:
+            self.generation += 1
+            if room_code is None:
+                keys = list(self._entries)
+            else:
+                keys = [
+                    key for key in self._keys_per_room.get(room_code, ())
+                    if day is None or key[0] <= day <= key[1]
+                ]
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+
+    def clear(self) -> None:
+        self.invalidate(None, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+# The cache shared by the whole process, kept consistent with the index:
+availability_cache = AvailabilityCache(config.AVAILABILITY_CACHE_SIZE, config.AVAILABILITY_CACHE_TTL_IN_SECONDS)
+occupancy_index.add_listener(availability_cache.invalidate)
@@ -0,0 +1,79 @@
+"""
+Atomic writes of bookings in the storage, keeping the in-process indexes consistent with it.
+"""
+from typing import List
+
+from lib.change_feed import BOOKING_CREATED, BOOKING_DELETED, change_feed
+from lib.occupancy import occupancy_index
+from lib.sqlalchemy.models import RecurringBooking
+from lib.storage import AnyBooking, current_storage
+
+
+# Number of times a bulk insertion is tried again when concurrent transactions keep taking the same hours:
+_MAX_BULK_INSERTION_ATTEMPTS = 3
+
+
+def insert_booking(booking: AnyBooking) -> bool:
+    """
+    Insert the booking, unless any of its hours was taken in the meantime (e.g. by a concurrent request), in which case
+    False is returned. Bookings of different rooms never conflict with each other.
+    """
+    room_code, start_hour, duration = booking.room_code, booking.start_hour, booking.duration
+    if not current_storage().insert_bookings([booking]):
+        # The index missed a booking made by another process, load it again:
+        occupancy_index.refresh([(room_code, start_hour, duration)])
+        return False
+
+    occupancy_index.add(room_code, start_hour, duration)
+    change_feed.publish(BOOKING_CREATED, booking.id, booking.author, room_code, start_hour, duration)
+    return True
+
+
+def insert_bookings(bookings: List[AnyBooking]) -> List[bool]:
+    """
+    Insert at once all the bookings which conflict neither with existing bookings nor with the previous bookings of the
+    list, and return whether each of them was inserted.
+    If a concurrent transaction took one of the same hours meanwhile, the selection is made again.
+    """
+    periods = [(booking.room_code, booking.start_hour, booking.duration) for booking in bookings]
+    for attempt in range(_MAX_BULK_INSERTION_ATTEMPTS):
+        selection = occupancy_index.select_free(periods)
+        inserted_bookings = [booking for booking, is_selected in zip(bookings, selection) if is_selected]
+        if not current_storage().insert_bookings(inserted_bookings):
+            if attempt == _MAX_BULK_INSERTION_ATTEMPTS - 1:
+                raise RuntimeError("Concurrent transactions kept booking the same hours.")
+            occupancy_index.refresh(periods)
+            continue
+
+        inserted_periods = [period for period, is_selected in zip(periods, selection) if is_selected]
+        for booking, period in zip(inserted_bookings, inserted_periods):
+            occupancy_index.add(*period)
+            change_feed.publish(BOOKING_CREATED, booking.id, booking.author, *period)
+        return selection
+
+
+def delete_booking(booking: AnyBooking) -> None:
+    """Delete the booking, and release its hours."""
+    room_code, start_hour, duration = booking.room_code, booking.start_hour, booking.duration
+    booking_id, author = booking.id, booking.author
+    current_storage().delete_booking(booking)
+    occupancy_index.remove(room_code, start_hour, duration)
+    change_feed.publish(BOOKING_DELETED, booking_id, author, room_code, start_hour, duration)
+
+
+def insert_recurring_booking(recurring_booking: RecurringBooking) -> bool:
+    """
+    Insert the recurring booking, unless any of its occurrences overlaps a booking or an occurrence of another
+    recurring booking, in which case False is returned.
+    """
+    if not current_storage().insert_recurring_booking(recurring_booking):
+        return False
+    occupancy_index.add_recurrence(recurring_booking)
+    return True
+
+
+def delete_recurring_booking(recurring_booking: RecurringBooking) -> None:
+    """Delete the recurring booking, and release the hours of all its occurrences."""
+    room_code, recurring_booking_id = recurring_booking.room_code, recurring_booking.id
+    current_storage().delete_recurring_booking(recurring_booking)
+    occupancy_index.remove_recurrence(room_code, recurring_booking_id)
@@ -0,0 +1,125 @@
+"""
+In-memory catalog of the rooms, along with the resolved time zone of their building, and indexed for searches.
+
+Rooms and buildings are only changed by the storage management scripts, so the catalog is loaded at once on first use,
+and kept until it is explicitly invalidated or expires: it is then loaded again, along with its search index, so that
+the changes of the rooms are picked up without restarting the API.
+"""
+from dataclasses import dataclass
+import datetime as dt
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pytz import timezone
+
+from configs import config
+
+
+@dataclass(frozen=True)
+class RoomInfo:
+    __slots__ = ("code", "name", "floor", "capacity", "building_id", "tz")
+    code: str
+    name: str
+    floor: int
+    capacity: Optional[int]
+    building_id: int
+    tz: dt.tzinfo
+
+
+class RoomCatalog:
+    """
+    All the rooms, by code (in the order of their codes), along with their search index.
+    Every lookup counts as a hit if the catalog was already loaded, or as a miss if it had to be loaded.
+    """
+
+    def __init__(self, ttl_in_seconds: float):
+        self._ttl_in_seconds = ttl_in_seconds
+        self._rooms: Optional[Dict[str, RoomInfo]] = None
+        self._search_index: Optional["RoomSearchIndex"] = None
+        self._expires_at = 0.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self) -> None:
+        """Forget all rooms: they will be loaded again on the next lookup."""
+        with self._lock:
+            self._rooms = None
+            self._search_index = None
+
+    def _load(self) -> Dict[str, RoomInfo]:
+        from lib.storage import current_storage  # (not at the top: the storage depends on this catalog)
+        rows = current_storage().room_rows()
+
+        # Resolve each time zone only once:
+        time_zones: Dict[str, dt.tzinfo] = {}
+        rooms = {}
+        for code, name, floor, capacity, building_id, tz_name in rows:
+            if tz_name not in time_zones:
+                time_zones[tz_name] = timezone(tz_name)
+            rooms[code] = RoomInfo(code, name, floor, capacity, building_id, time_zones[tz_name])
+        return rooms
+
+    def _ensure_loaded(self) -> None:
+        from lib.room_search import RoomSearchIndex  # (not at the top: the index depends on this catalog)
+        if self._rooms is None or time.monotonic() >= self._expires_at:
+            self.misses += 1
+            self._rooms = self._load()
+            self._search_index = RoomSearchIndex(list(self._rooms.values()))
+            self._expires_at = time.monotonic() + self._ttl_in_seconds
+        else:
+            self.hits += 1
+
+    def _get_rooms(self) -> Dict[str, RoomInfo]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._rooms
+
+    def _get_search_index(self) -> "RoomSearchIndex":
+        with self._lock:
+            self._ensure_loaded()
+            return self._search_index
+
+    def get(self, code: str) -> Optional[RoomInfo]:
+        """Return the room bearing this code, or None if there is none."""
+        return self._get_rooms().get(code)
+
+    def all(self) -> List[RoomInfo]:
+        return list(self._get_rooms().values())
+
+    def on_floor(self, floor: int) -> List[RoomInfo]:
+        return self._get_search_index().on_floor(floor)
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        floor: Optional[int] = None,
+        min_capacity: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[RoomInfo]:
+        """Return the rooms matching all the given filters, ranked (see RoomSearchIndex.search)."""
+        return self._get_search_index().search(text, floor, min_capacity, limit)
+
+    def time_zone(self, code: str) -> dt.tzinfo:
+        """Return the time zone of an existing room."""
+        return self._get_rooms()[code].tz
+
+    def time_zones(self) -> Dict[str, dt.tzinfo]:
+        """Return the time zones of all the rooms by code (to look many of them up at once)."""
+        return {code: room.tz for code, room in self._get_rooms().items()}
+
+    def codes_per_time_zone(self, code: Optional[str] = None) -> Dict[dt.tzinfo, List[str]]:
+        """Return the codes of all the rooms (or of the given room only, if it exists) per time zone."""
+        codes_per_time_zone: Dict[dt.tzinfo, List[str]] = {}
+        for room in self._get_rooms().values():
+            if code is None or room.code == code:
+                codes_per_time_zone.setdefault(room.tz, []).append(room.code)
+        return codes_per_time_zone
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._rooms or {}), "hits": self.hits, "misses": self.misses}
+
+
+# The catalog shared by the whole process:
+room_catalog = RoomCatalog(config.ROOM_CATALOG_TTL_IN_SECONDS)
@@ -0,0 +1,121 @@
+"""
+Log of the latest changes of the bookings, that clients can follow instead of polling (see GET /booking/events).
+
+Each event gets an id greater than all the previous ones, so that a client can resume from the last event it got, as
+long as it is still in the log. When the storage journals its changes for the processes sharing it (see
+SYNC_INDEXES_BETWEEN_PROCESSES), the events are read from this journal, whose ids are shared by all the processes, so
+that a client may resume from any of them. Otherwise the log only holds the changes made by this process.
+"""
+from collections import deque
+import threading
+import time
+from typing import TYPE_CHECKING, Deque, List, NamedTuple, Optional
+
+from configs import config
+
+if TYPE_CHECKING:
+    from lib.storage import Storage
+
+
+BOOKING_CREATED = "booking_created"
+BOOKING_DELETED = "booking_deleted"
+
+
+class BookingEvent(NamedTuple):
+    id: int
+    kind: str
+    booking_id: int
+    author: str
+    room_code: str
+    start_hour: int  # (see lib.hours)
+    duration: int
+
+
+def _journaling_storage() -> Optional["Storage"]:
+    """The storage, if it journals the events for all the processes sharing it."""
+    from lib.storage import current_storage  # (not at the top: the storage journals the kinds of events defined here)
+    storage = current_storage()
+    return storage if storage.journals_changes else None
+
+
+class ChangeFeed:
+    """The latest events, waited for by the threads following them."""
+
+    def __init__(self, max_events: int):
+        self._max_events = max_events
+        self._events: Deque[BookingEvent] = deque(maxlen=max_events)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self._streams = 0
+
+    @property
+    def last_id(self) -> int:
+        storage = _journaling_storage()
+        return storage.last_change_id() if storage else self._last_id
+
+    def publish(self, kind: str, booking_id: int, author: str, room_code: str, start_hour: int, duration: int) -> None:
+        with self._condition:
+            if _journaling_storage():
+                # (the event was journaled along with the booking: the followers of this process just read it sooner)
+                self._condition.notify_all()
+                return
+            self._last_id += 1
+            self._events.append(BookingEvent(self._last_id, kind, booking_id, author, room_code, start_hour, duration))
+            self._condition.notify_all()
+
+    def can_resume_after(self, event_id: int) -> bool:
+        """Whether all the events following this one are still in the log."""
+        storage = _journaling_storage()
+        if storage:
+            # (the journal is never pruned)
+            return 0 <= event_id <= storage.last_change_id()
+        with self._condition:
+            first_id = self._events[0].id if self._events else self._last_id + 1
+            return first_id - 1 <= event_id <= self._last_id
+
+    def wait_after(self, event_id: int, timeout: Optional[float]) -> List[BookingEvent]:
+        """Return the events following this one, waiting for the next one until the timeout if there is none yet."""
+        storage = _journaling_storage()
+        if storage:
+            return self._poll_journal(storage, event_id, timeout)
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > event_id, timeout)
+            if self._last_id <= event_id:
+                return []
+            # (the events are sorted by id, without gap)
+            first_index = max(len(self._events) - (self._last_id - event_id), 0)
+            return [self._events[i] for i in range(first_index, len(self._events))]
+
+    def _poll_journal(self, storage: "Storage", event_id: int, timeout: Optional[float]) -> List[BookingEvent]:
+        """
+        Read the events following this one from the journal, every CHANGE_FEED_POLL_INTERVAL_IN_SECONDS until the
+        timeout, or as soon as this process publishes one.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = [BookingEvent(*row) for row in storage.booking_events_after(event_id, self._max_events)]
+            remaining_seconds = None if deadline is None else deadline - time.monotonic()
+            if events or (remaining_seconds is not None and remaining_seconds <= 0):
+                return events
+            poll_interval = config.CHANGE_FEED_POLL_INTERVAL_IN_SECONDS
+            with self._condition:
+                self._condition.wait(poll_interval if deadline is None else min(poll_interval, remaining_seconds))
+
+    def open_stream(self, max_streams: int) -> bool:
+        """
+        Count a new follower, unless this maximum number already follow the feed in this process (see
+        CHANGE_FEED_MAX_STREAMS and CHANGE_FEED_MAX_ASYNC_STREAMS).
+        """
+        with self._condition:
+            if self._streams >= max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self) -> None:
+        with self._condition:
+            self._streams -= 1
+
+
+# The feed shared by the whole process:
+change_feed = ChangeFeed(config.CHANGE_FEED_SIZE)
@@ -0,0 +1,97 @@
+"""
+Hours as integers: the number of hours elapsed since the Unix epoch, in which the periods of bookings are stored.
+
+Unlike local datetimes, they are unambiguous and unaffected by the changes of offset of the time zones (DST): a period
+is the range of integers [start, end), and two periods overlap if and only if each one starts before the end of the
+other. They are only converted from and to local datetimes at the edges (inputs and outputs of the API), in the time
+zone of each room, whose offsets must then be entire hours.
+A local day is the range of the hours starting during this day, which may be 23 or 25 of them when the offset changes.
+"""
+import datetime as dt
+from functools import lru_cache
+from typing import Iterator, Tuple
+
+
+_SECONDS_PER_HOUR = 3600
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
+def to_epoch_hour(value: dt.datetime) -> int:
+    """The hour of an aware datetime, which is expected to be an hour start."""
+    return int(value.timestamp()) // _SECONDS_PER_HOUR
+
+
+def from_epoch_hour(hour: int, tz: dt.tzinfo) -> dt.datetime:
+    """The datetime of an hour, in the time zone."""
+    return dt.datetime.fromtimestamp(hour * _SECONDS_PER_HOUR, tz)
+
+
+def local_epoch_hour(local_datetime: dt.datetime, tz) -> int:
+    """The hour of a naive datetime of the (pytz) time zone."""
+    return to_epoch_hour(tz.localize(local_datetime))
+
+
+def _localized_day(hour: int, tz: dt.tzinfo) -> dt.date:
+    return from_epoch_hour(hour, tz).date()
+
+
+def local_day(hour: int, tz: dt.tzinfo) -> dt.date:
+    """
+    The local day during which the hour starts: the day of the hour in UTC, or the day before or after it (the offsets
+    of the time zones being less than a day), without localizing any datetime once the hours of these days are cached.
+    """
+    day = dt.date.fromordinal(_EPOCH_ORDINAL + hour // 24)
+    first_hour, next_first_hour = day_hours(tz, day)
+    if hour < first_hour:
+        return day - dt.timedelta(days=1)
+    if hour >= next_first_hour:
+        return day + dt.timedelta(days=1)
+    return day
+
+
+def _day_start(tz, day: dt.date) -> int:
+    hour = local_epoch_hour(dt.datetime.combine(day, dt.time()), tz)
+    # (midnight itself may be skipped or repeated by a change of offset)
+    while _localized_day(hour - 1, tz) >= day:
+        hour -= 1
+    while _localized_day(hour, tz) < day:
+        hour += 1
+    return hour
+
+
+@lru_cache(maxsize=65536)
+def day_hours(tz: dt.tzinfo, day: dt.date) -> Tuple[int, int]:
+    """The first hour of the local day, and the first hour of the next one."""
+    return _day_start(tz, day), _day_start(tz, day + dt.timedelta(days=1))
+
+
+def day_length(tz: dt.tzinfo, day: dt.date) -> int:
+    """The number of hours of the local day."""
+    first_hour, next_first_hour = day_hours(tz, day)
+    return next_first_hour - first_hour
+
+
+def hours_mask(start_hour: int, duration_in_hours: int) -> int:
+    """Return the bitmap of the period, relative to the start of its day."""
+    return ((1 << duration_in_hours) - 1) << start_hour
+
+
+def split_per_day(tz: dt.tzinfo, start_hour: int, duration_in_hours: int) -> Iterator[Tuple[dt.date, int]]:
+    """
+    Yield the (local date, day bitmap) pairs covered by a period, which may overflow on the next day(s): bit h of the
+    bitmap of a day is set when the h-th hour of the day is covered.
+    """
+    end_hour = start_hour + duration_in_hours
+    day = local_day(start_hour, tz)
+    while True:
+        first_hour, next_first_hour = day_hours(tz, day)
+        start = max(start_hour, first_hour)
+        yield day, hours_mask(start - first_hour, min(end_hour, next_first_hour) - start)
+        if end_hour <= next_first_hour:
+            return
+        day += dt.timedelta(days=1)
+
+
+def is_whole_hour_offset(value: dt.datetime) -> bool:
+    """Whether the offset of the aware datetime is made of entire hours, as required to store its hour."""
+    return value.utcoffset() % dt.timedelta(hours=1) == dt.timedelta()
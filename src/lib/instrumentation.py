@@ -0,0 +1,201 @@
+"""
+Opt-in instrumentation of the requests: where their time goes, per endpoint.
+
+The time of each request is split into phases (parsing of the inputs, database queries, algorithms and marshalling
+of the outputs), measured in the thread serving the request, then aggregated per endpoint and exposed in the text
+format of Prometheus. Slow requests can also be profiled with cProfile, on a sample of them.
+The statistics of the in-process caches are exposed along with the measures.
+When the instrumentation is not installed, measuring a phase costs a single attribute lookup.
+"""
+import cProfile
+from contextlib import contextmanager
+from functools import wraps
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+PHASES = ("parse", "db", "algorithm", "marshal")
+
+# Upper bounds of the buckets of the histograms of durations, in seconds:
+_DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _EndpointStats:
+    """The aggregated measures of the requests of an endpoint."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(_DURATION_BUCKETS)
+        self.count = 0
+        self.total_seconds = 0.
+        self.phase_seconds = dict.fromkeys(PHASES, 0.)
+        self.db_queries = 0
+
+    def record(self, seconds: float, phase_seconds: Dict[str, float], db_queries: int) -> None:
+        for i, bound in enumerate(_DURATION_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        for phase, phase_duration in phase_seconds.items():
+            self.phase_seconds[phase] += phase_duration
+        self.db_queries += db_queries
+
+
+class Instrumentation:
+    """
+    Measures of the phases of the requests, per endpoint (i.e. method and URL rule).
+    The measures of the request being served are kept per thread, and only aggregated when it ends.
+    """
+
+    def __init__(self):
+        self.is_installed = False
+        self._local = threading.local()
+        self._stats: Dict[Tuple[str, str], _EndpointStats] = {}
+        self._lock = threading.Lock()
+        self._profile_sample_rate = 0.
+        self._profile_min_seconds = 0.
+        self._profile_dir: Optional[str] = None
+        self._stats_sources: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+    def install(self, app: Flask, engine: Engine) -> None:
+        """Measure all the requests of the app and the queries of the engine, and serve the metrics at /metrics."""
+        self.is_installed = True
+        self._profile_sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+        self._profile_min_seconds = app.config["PROFILE_SLOW_REQUESTS_IN_SECONDS"]
+        self._profile_dir = app.config["PROFILE_DIR"]
+        app.before_request(self._start_request)
+        app.teardown_request(self._end_request)
+        app.add_url_rule("/metrics", "metrics", lambda: Response(self.render(), mimetype="text/plain; version=0.0.4"))
+        event.listen(engine, "before_cursor_execute", self._start_query)
+        event.listen(engine, "after_cursor_execute", self._end_query)
+
+    def add_stats_source(self, name: str, stats: Callable[[], Dict[str, int]]) -> None:
+        """Expose the statistics returned by the function (e.g. of a cache) as gauges named after it."""
+        self._stats_sources[name] = stats
+
+    #
+    # Measures of the current request:
+    #
+    def _start_request(self) -> None:
+        self._local.phase_seconds = dict.fromkeys(PHASES, 0.)
+        self._local.current_phases = []
+        self._local.db_queries = 0
+        self._local.profile = None
+        if self._profile_sample_rate and random.random() < self._profile_sample_rate:
+            self._local.profile = cProfile.Profile()
+            self._local.profile.enable()
+        self._local.start = time.perf_counter()
+
+    def _end_request(self, _exception: Optional[BaseException] = None) -> None:
+        if getattr(self._local, "phase_seconds", None) is None:
+            return
+        seconds = time.perf_counter() - self._local.start
+        endpoint = (request.method, request.url_rule.rule if request.url_rule else "<unmatched>")
+        if self._local.profile:
+            self._local.profile.disable()
+            if seconds >= self._profile_min_seconds:
+                self._dump_profile(self._local.profile, endpoint, seconds)
+        with self._lock:
+            self._stats.setdefault(endpoint, _EndpointStats()) \
+                .record(seconds, self._local.phase_seconds, self._local.db_queries)
+        self._local.phase_seconds = None
+        self._local.current_phases = None
+
+    def _dump_profile(self, profile: cProfile.Profile, endpoint: Tuple[str, str], seconds: float) -> None:
+        os.makedirs(self._profile_dir, exist_ok=True)
+        method, rule = endpoint
+        name = f"{method}{rule}".replace("/", "_").replace("<", "").replace(">", "").replace(":", "_")
+        profile.dump_stats(os.path.join(self._profile_dir, f"{name}-{time.time():.0f}-{seconds * 1000:.0f}ms.prof"))
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        """
+        Add the time spent in the block to the phase of the current request, if it is measured.
+        Nested blocks of the same phase are only counted once.
+        """
+        current_phases: Optional[List[str]] = getattr(self._local, "current_phases", None)
+        if not self.is_installed or current_phases is None or phase in current_phases:
+            yield
+            return
+        current_phases.append(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.phase_seconds[phase] += time.perf_counter() - start
+            current_phases.remove(phase)
+
+    def instrumented(self, phase: str) -> Callable[[Callable], Callable]:
+        """Decorator adding the time spent in the function to the phase of the current request."""
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timed(phase):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _start_query(self, _conn, _cursor, _statement, _parameters, context, _executemany) -> None:
+        context._query_start = time.perf_counter()
+
+    def _end_query(self, _conn, _cursor, _statement, _parameters, context, _executemany) -> None:
+        if getattr(self._local, "phase_seconds", None) is not None:
+            self._local.phase_seconds["db"] += time.perf_counter() - context._query_start
+            self._local.db_queries += 1
+
+    #
+    # Exposition:
+    #
+    def render(self) -> str:
+        """The aggregated measures, in the text format of Prometheus."""
+        with self._lock:
+            stats = sorted(self._stats.items())
+        lines = [
+            "# HELP workrooms_request_duration_seconds Duration of the requests.",
+            "# TYPE workrooms_request_duration_seconds histogram",
+        ]
+        for (method, rule), endpoint_stats in stats:
+            labels = f'method="{method}",endpoint="{rule}"'
+            for bound, count in zip(_DURATION_BUCKETS, endpoint_stats.bucket_counts):
+                lines.append(f'workrooms_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'workrooms_request_duration_seconds_bucket{{{labels},le="+Inf"}} {endpoint_stats.count}')
+            lines.append(f"workrooms_request_duration_seconds_sum{{{labels}}} {endpoint_stats.total_seconds:.6f}")
+            lines.append(f"workrooms_request_duration_seconds_count{{{labels}}} {endpoint_stats.count}")
+        lines += [
+            "# HELP workrooms_request_phase_seconds_total Time spent in each phase of the requests.",
+            "# TYPE workrooms_request_phase_seconds_total counter",
+        ]
+        for (method, rule), endpoint_stats in stats:
+            for phase, seconds in endpoint_stats.phase_seconds.items():
+                lines.append(
+                    f'workrooms_request_phase_seconds_total{{method="{method}",endpoint="{rule}",phase="{phase}"}} '
+                    f"{seconds:.6f}"
+                )
+        lines += [
+            "# HELP workrooms_db_queries_total Number of database queries made by the requests.",
+            "# TYPE workrooms_db_queries_total counter",
+        ]
+        for (method, rule), endpoint_stats in stats:
+            labels = f'method="{method}",endpoint="{rule}"'
+            lines.append(f"workrooms_db_queries_total{{{labels}}} {endpoint_stats.db_queries}")
+        for name, source in sorted(self._stats_sources.items()):
+            for key, value in source().items():
+                lines += [f"# TYPE workrooms_{name}_{key} gauge", f"workrooms_{name}_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {}
+
+
+# The instrumentation shared by the whole process:
+instrumentation = Instrumentation()
+timed = instrumentation.timed
+instrumented = instrumentation.instrumented
@@ -0,0 +1,472 @@
+"""
+In-process index of the booked hours of each room, day by day.
+
+Each (room_code, local date) key maps to an integer in which bit h is set when the h-th hour of the day (in the local
+time zone of the room) is already booked. Checking the availability of a period then boils down to a bitwise AND.
+Most days have 24 hours, but the days when the offset of the time zone changes (DST) have 23 or 25 of them: the hours
+are counted from the first one starting during the day (see lib.hours).
+"""
+import datetime as dt
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from configs import config
+from lib.catalog import room_catalog
+from lib.hours import day_hours, day_length, local_epoch_hour, split_per_day
+from lib.sqlalchemy.models import RecurringBooking, expand_recurrence
+from lib.storage import current_storage
+
+
+def keys_hours_range(keys: Set[Tuple[str, dt.date]]) -> Tuple[int, int]:
+    """
+    The range of hours (end excluded) during which start all the bookings that may cover the (room, day) keys, i.e.
+    from the day before their first day to their last day, in the time zones of their rooms.
+    """
+    first_hours, end_hours = [], []
+    for room_code, day in keys:
+        tz = room_catalog.time_zone(room_code)
+        first_hours.append(day_hours(tz, day - dt.timedelta(days=1))[0])
+        end_hours.append(day_hours(tz, day)[1])
+    return min(first_hours), max(end_hours)
+
+
+def free_periods(bitmap: int, hours_in_day: int) -> List[Tuple[int, int]]:
+    """Return the (start hour, duration in hours) of each maximal run of free hours of a day bitmap."""
+    free = ~bitmap & ((1 << hours_in_day) - 1)
+    starts = free & ~(free << 1)
+    ends = free & ~(free >> 1)
+    periods = []
+    while starts:
+        start_bit = starts & -starts
+        end_bit = ends & -ends
+        periods.append((start_bit.bit_length() - 1, end_bit.bit_length() - start_bit.bit_length() + 1))
+        starts ^= start_bit
+        ends ^= end_bit
+    return periods
+
+
+# A function called with the (room_code, local day) whose booked hours changed, None meaning any room or any day:
+ChangeListener = Callable[[Optional[str], Optional[dt.date]], None]
+
+# The free periods of a day, as sorted and disjoint (start hour, duration in hours) pairs, relative to its first hour:
+FreePeriods = Tuple[Tuple[int, int], ...]
+
+
+def _hours_range(mask: int) -> Tuple[int, int]:
+    """The first hour and the end hour (excluded) of a contiguous day bitmap."""
+    return (mask & -mask).bit_length() - 1, mask.bit_length()
+
+
+def _without_hours(periods: FreePeriods, start: int, end: int) -> FreePeriods:
+    """Split the free periods around the hours from start to end (excluded), which are booked."""
+    patched = []
+    for period_start, duration in periods:
+        period_end = period_start + duration
+        if period_end <= start or end <= period_start:
+            patched.append((period_start, duration))
+            continue
+        if period_start < start:
+            patched.append((period_start, start - period_start))
+        if end < period_end:
+            patched.append((end, period_end - end))
+    return tuple(patched)
+
+
+def _with_hours(periods: FreePeriods, start: int, end: int) -> FreePeriods:
+    """Merge the hours from start to end (excluded), which are released, with the free periods they touch."""
+    patched = []
+    for period_start, duration in periods:
+        period_end = period_start + duration
+        if period_end < start or end < period_start:
+            patched.append((period_start, duration))
+        else:
+            start, end = min(start, period_start), max(end, period_end)
+    patched.append((start, end - start))
+    return tuple(sorted(patched))
+
+
+def fitting_run_starts(free: int, length: int) -> int:
+    """
+    Return the bits starting the runs of set bits of the free bitmap (of any number of days) which are at least
+    length bits long.
+    """
+    # Keep the bits followed by length - 1 set bits, doubling the checked span at each step:
+    fitting, span = free, 1
+    while span < length:
+        shift = min(span, length - span)
+        fitting &= fitting >> shift
+        span += shift
+    return fitting & ~(free << 1)
+
+
+def _bitmaps_of(keys: Set[Tuple[str, dt.date]], rows: List[Tuple[str, int, int]]) -> Dict[Tuple[str, dt.date], int]:
+    """The bitmaps of the keys, given the (room_code, start_hour, duration) rows of the bookings of their rooms."""
+    time_zones = room_catalog.time_zones()
+    bitmaps = dict.fromkeys(keys, 0)
+    for room_code, start_hour, duration in rows:
+        for day, mask in split_per_day(time_zones[room_code], start_hour, duration):
+            if (room_code, day) in bitmaps:
+                bitmaps[(room_code, day)] |= mask
+    return bitmaps
+
+
+class _Recurrence(NamedTuple):
+    id: int
+    start_datetime: dt.datetime  # (naive, in the local time of the room, at which all the occurrences start)
+    duration: int
+    step_in_days: int
+    until: dt.date
+
+    @classmethod
+    def from_model(cls, recurring_booking: RecurringBooking) -> "_Recurrence":
+        return cls(
+            recurring_booking.id,
+            recurring_booking.local_start_datetime,
+            recurring_booking.duration,
+            recurring_booking.step_in_days,
+            recurring_booking.until,
+        )
+
+
+class OccupancyIndex:
+    """
+    Bitmaps of the booked hours, per room and per local day.
+
+    The bitmaps of the (single) bookings are either fully rebuilt from the bookings table (then any missing key means a
+    free day), or lazily filled, key by key, the first time a room and day are requested.
+    The recurring bookings, which are few, are all kept in memory: their occurrences are only expanded over the
+    requested days, on top of the bitmaps of the bookings.
+    In all cases, the index must be kept up-to-date whenever a booking or a recurring booking is inserted or deleted.
+    The free periods of the keys which were read are materialized too: they are split or merged in place when a
+    booking is inserted or deleted, and only computed again when the whole bitmap of their key changes.
+    Listeners can be notified of all the changes of the booked hours (e.g. to invalidate what was computed from them).
+    When several processes share the database, each of them also applies the changes journaled by the others before
+    the lookups, at most every SYNC_INDEXES_INTERVAL_IN_SECONDS (see SYNC_INDEXES_BETWEEN_PROCESSES).
+    The storage is always queried out of the lock, the rows being applied under it: the lookups of the other threads
+    never wait for the database. (A booking of another process seen late by the index is still refused by the storage,
+    then the index is refreshed.)
+    Bookings never overlap each other, so that each booked hour is owned by a single booking.
+    """
+
+    def __init__(self):
+        self._bitmaps: Dict[Tuple[str, dt.date], int] = {}
+        self._free_periods: Dict[Tuple[str, dt.date], FreePeriods] = {}
+        self._complete = False
+        self._recurrences: Optional[Dict[str, List[_Recurrence]]] = None
+        self._last_change_id: Optional[int] = None
+        self._next_sync_at = 0.
+        self._listeners: List[ChangeListener] = []
+        self._lock = threading.RLock()
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, room_code: Optional[str], day: Optional[dt.date]) -> None:
+        for listener in self._listeners:
+            listener(room_code, day)
+
+    def clear(self) -> None:
+        """Forget everything: the next lookups will be loaded from the database."""
+        with self._lock:
+            self._bitmaps = {}
+            self._free_periods = {}
+            self._complete = False
+            self._recurrences = None
+            self._last_change_id = None
+            self._next_sync_at = 0.
+            self._notify(None, None)
+
+    def rebuild(self) -> None:
+        """Load all the bookings in the index, as they are streamed by the storage."""
+        storage = current_storage()
+        # (the changes journaled from now on may not be loaded below, they will be applied again)
+        last_change_id = storage.last_change_id() if config.SYNC_INDEXES_BETWEEN_PROCESSES else None
+
+        time_zones = room_catalog.time_zones()
+        bitmaps: Dict[Tuple[str, dt.date], int] = {}
+        for room_code, start_hour, duration in storage.all_booking_periods():
+            for day, mask in split_per_day(time_zones[room_code], start_hour, duration):
+                bitmaps[(room_code, day)] = bitmaps.get((room_code, day), 0) | mask
+        with self._lock:
+            self._bitmaps = bitmaps
+            self._free_periods = {}
+            self._complete = True
+            self._recurrences = None
+            self._last_change_id = last_change_id
+            self._notify(None, None)
+
+    def sync(self) -> None:
+        """
+        Apply the changes journaled by the other processes since the last call, when they share the database (at most
+        every SYNC_INDEXES_INTERVAL_IN_SECONDS), notifying the listeners.
+        """
+        if not config.SYNC_INDEXES_BETWEEN_PROCESSES:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_sync_at:
+                return
+            self._next_sync_at = now + config.SYNC_INDEXES_INTERVAL_IN_SECONDS
+            last_change_id, is_complete = self._last_change_id, self._complete
+        storage = current_storage()
+        if last_change_id is None:
+            # (nothing was loaded yet, only the changes from now on matter)
+            last_change_id = storage.last_change_id()
+            with self._lock:
+                if self._last_change_id is None:
+                    self._last_change_id = last_change_id
+            return
+        changes = storage.changes_after(last_change_id)
+        if not changes:
+            return
+        changed_keys = {(room_code, day) for _, room_code, day in changes if day is not None}
+        bitmaps = None
+        if is_complete and changed_keys:
+            rows = storage.booking_periods({code for code, _ in changed_keys}, *keys_hours_range(changed_keys))
+            bitmaps = _bitmaps_of(changed_keys, rows)
+
+        with self._lock:
+            if self._last_change_id != last_change_id or self._complete != is_complete:
+                # (another thread applied them meanwhile, or the index was cleared or rebuilt)
+                return
+            self._last_change_id = changes[-1][0]
+            if any(day is None for _, _, day in changes):
+                self._forget_recurrences()
+            for room_code, day in {(room_code, day) for _, room_code, day in changes}:
+                self._notify(room_code, day)
+            if bitmaps is not None:
+                self._store_bitmaps(bitmaps)
+            else:
+                for key in changed_keys:
+                    self._bitmaps.pop(key, None)
+                    self._free_periods.pop(key, None)
+
+    def _prefetch(self, keys: Set[Tuple[str, dt.date]]) -> None:
+        """
+        Apply the changes of the other processes, then load the keys and the recurring bookings missing from the index,
+        out of the lock: the lookups then only hold it to read the index.
+        """
+        self.sync()
+        if self._recurrences is None:
+            self.store_recurrences(current_storage().all_recurring_bookings())
+        missing = self.missing_keys(keys)
+        if missing:
+            self._load_many(missing)
+
+    def missing_keys(self, keys: Set[Tuple[str, dt.date]]) -> Set[Tuple[str, dt.date]]:
+        """The (room, day) keys which must be loaded before being looked up."""
+        with self._lock:
+            if self._complete:
+                return set()
+            return {key for key in keys if key not in self._bitmaps}
+
+    def _ensure_loaded(self, keys: Set[Tuple[str, dt.date]]) -> None:
+        """
+        Load with a single query all the keys which are missing from the index (under the lock: only those forgotten
+        since they were prefetched).
+        """
+        if not self._complete:
+            missing = {key for key in keys if key not in self._bitmaps}
+            if missing:
+                self._load_many(missing)
+
+    def _load_many(self, keys: Set[Tuple[str, dt.date]]) -> None:
+        """Compute and store the bitmaps of many (room, day) keys from the bookings of their rooms."""
+        room_codes = {code for code, _ in keys}
+        first_hour, end_hour = keys_hours_range(keys)
+        self.store(keys, current_storage().booking_periods(room_codes, first_hour, end_hour))
+
+    def store(self, keys: Set[Tuple[str, dt.date]], rows: List[Tuple[str, int, int]]) -> None:
+        """
+        Compute and store the bitmaps of the (room, day) keys, given the (room_code, start_hour, duration) rows of all
+        the bookings of their rooms starting during their keys_hours_range.
+        """
+        bitmaps = _bitmaps_of(keys, rows)
+        with self._lock:
+            self._store_bitmaps(bitmaps)
+
+    def _store_bitmaps(self, bitmaps: Dict[Tuple[str, dt.date], int]) -> None:
+        self._bitmaps.update(bitmaps)
+        for key in bitmaps:
+            self._free_periods.pop(key, None)
+
+    def store_recurrences(self, recurring_bookings: List[RecurringBooking]) -> None:
+        """Load the recurring bookings (e.g. fetched by another mean than the ORM session)."""
+        recurrences: Dict[str, List[_Recurrence]] = {}
+        for recurring_booking in recurring_bookings:
+            recurrences.setdefault(recurring_booking.room_code, []).append(_Recurrence.from_model(recurring_booking))
+        with self._lock:
+            self._recurrences = recurrences
+            self._free_periods = {}
+
+    def _forget_recurrences(self) -> None:
+        """Load the recurring bookings again on next use, along with the free periods depending on them."""
+        self._recurrences = None
+        self._free_periods = {}
+
+    def _forget_free_periods(self, room_code: str) -> None:
+        self._free_periods = {key: periods for key, periods in self._free_periods.items() if key[0] != room_code}
+
+    def _get_recurrences(self) -> Dict[str, List[_Recurrence]]:
+        """The recurring bookings per room, all loaded on first use."""
+        if self._recurrences is None:
+            self.store_recurrences(current_storage().all_recurring_bookings())
+        return self._recurrences
+
+    def _recurring_bitmap(self, room_code: str, day: dt.date) -> int:
+        """The hours of the day booked by the occurrences starting this day or overflowing from the day before."""
+        bitmap = 0
+        tz = room_catalog.time_zone(room_code)
+        for recurrence in self._get_recurrences().get(room_code, ()):
+            for start_datetime in expand_recurrence(
+                recurrence.start_datetime, recurrence.step_in_days, recurrence.until, day - dt.timedelta(days=1), day
+            ):
+                for occurrence_day, mask in split_per_day(
+                    tz, local_epoch_hour(start_datetime, tz), recurrence.duration
+                ):
+                    if occurrence_day == day:
+                        bitmap |= mask
+        return bitmap
+
+    def _booked(self, key: Tuple[str, dt.date]) -> int:
+        """The bitmap of an already loaded key, including the occurrences of the recurring bookings."""
+        return self._bitmaps.get(key, 0) | self._recurring_bitmap(*key)
+
+    def day_bitmap(self, room_code: str, day: dt.date) -> int:
+        """Return the bitmap of the booked hours of the room during this local day."""
+        self._prefetch({(room_code, day)})
+        with self._lock:
+            self._ensure_loaded({(room_code, day)})
+            return self._booked((room_code, day))
+
+    def matrix(self, room_codes: List[str], days: List[dt.date]) -> List[List[int]]:
+        """
+        Return the bitmaps of the rooms (rows) for the days (columns).
+        All the keys missing from the index are loaded with a single query.
+        """
+        keys = {(code, day) for code in room_codes for day in days}
+        self._prefetch(keys)
+        with self._lock:
+            self._ensure_loaded(keys)
+            return [[self._booked((code, day)) for day in days] for code in room_codes]
+
+    def free_periods_matrix(self, room_codes: List[str], days: List[dt.date]) -> List[List[FreePeriods]]:
+        """
+        Return the free periods of the rooms (rows) for the days (columns), as (start hour, duration in hours) pairs.
+        Only the keys which were never read (or whose bitmap was loaded again) are computed from their bitmap.
+        """
+        self._prefetch({(code, day) for code in room_codes for day in days})
+        with self._lock:
+            self._get_recurrences()  # (loading them forgets the free periods)
+            missing = {(code, day) for code in room_codes for day in days} - self._free_periods.keys()
+            if missing:
+                self._ensure_loaded(missing)
+                for code, day in missing:
+                    self._free_periods[(code, day)] = tuple(
+                        free_periods(self._booked((code, day)), day_length(room_catalog.time_zone(code), day))
+                    )
+            return [[self._free_periods[(code, day)] for day in days] for code in room_codes]
+
+    def select_free(self, periods: List[Tuple[str, int, int]]) -> List[bool]:
+        """
+        Return, for each (room_code, start_hour, duration_in_hours) period, whether it is free and does not overlap any
+        of the previous free periods of the list, as if they were booked one after the other.
+        """
+        periods_per_day = [
+            list(split_per_day(room_catalog.time_zone(room_code), start_hour, duration))
+            for room_code, start_hour, duration in periods
+        ]
+        keys = {
+            (room_code, day)
+            for (room_code, _, _), period_per_day in zip(periods, periods_per_day)
+            for day, _ in period_per_day
+        }
+        self._prefetch(keys)
+        with self._lock:
+            self._ensure_loaded(keys)
+            # The hours of the selected periods are reserved in a copy of the bitmaps they cover:
+            reserved: Dict[Tuple[str, dt.date], int] = {}
+            selection = []
+            for (room_code, _, _), period_per_day in zip(periods, periods_per_day):
+                keys = [(room_code, day) for day, _ in period_per_day]
+                for key in keys:
+                    if key not in reserved:
+                        reserved[key] = self._booked(key)
+                is_free = all(not reserved[key] & mask for key, (_, mask) in zip(keys, period_per_day))
+                if is_free:
+                    for key, (_, mask) in zip(keys, period_per_day):
+                        reserved[key] |= mask
+                selection.append(is_free)
+        return selection
+
+    def is_free(self, room_code: str, start_hour: int, duration_in_hours: int) -> bool:
+        """Return True if none of the hours of the period is booked."""
+        return all(
+            not self.day_bitmap(room_code, day) & mask
+            for day, mask in split_per_day(room_catalog.time_zone(room_code), start_hour, duration_in_hours)
+        )
+
+    def add(self, room_code: str, start_hour: int, duration_in_hours: int) -> None:
+        """Mark the hours of a newly inserted booking as booked."""
+        periods_per_day = list(split_per_day(room_catalog.time_zone(room_code), start_hour, duration_in_hours))
+        self._prefetch({(room_code, day) for day, _ in periods_per_day})
+        with self._lock:
+            for day, mask in periods_per_day:
+                key = (room_code, day)
+                self._ensure_loaded({key})
+                self._bitmaps[key] = self._bitmaps.get(key, 0) | mask
+                if key in self._free_periods:
+                    self._free_periods[key] = _without_hours(self._free_periods[key], *_hours_range(mask))
+                self._notify(room_code, day)
+
+    def remove(self, room_code: str, start_hour: int, duration_in_hours: int) -> None:
+        """Release the hours of a deleted booking."""
+        periods_per_day = list(split_per_day(room_catalog.time_zone(room_code), start_hour, duration_in_hours))
+        self._prefetch({(room_code, day) for day, _ in periods_per_day})
+        with self._lock:
+            for day, mask in periods_per_day:
+                key = (room_code, day)
+                self._ensure_loaded({key})
+                self._bitmaps[key] = self._bitmaps.get(key, 0) & ~mask
+                if key in self._free_periods:
+                    self._free_periods[key] = _with_hours(self._free_periods[key], *_hours_range(mask))
+                self._notify(room_code, day)
+
+    def add_recurrence(self, recurring_booking: RecurringBooking) -> None:
+        """Take the occurrences of a newly inserted recurring booking into account."""
+        self._prefetch(set())
+        with self._lock:
+            self._get_recurrences().setdefault(recurring_booking.room_code, []) \
+                .append(_Recurrence.from_model(recurring_booking))
+            self._forget_free_periods(recurring_booking.room_code)
+            self._notify(recurring_booking.room_code, None)
+
+    def remove_recurrence(self, room_code: str, recurring_booking_id: int) -> None:
+        """Release the hours of all the occurrences of a deleted recurring booking."""
+        self._prefetch(set())
+        with self._lock:
+            room_recurrences = self._get_recurrences().get(room_code, [])
+            room_recurrences[:] = [
+                recurrence for recurrence in room_recurrences if recurrence.id != recurring_booking_id
+            ]
+            self._forget_free_periods(room_code)
+            self._notify(room_code, None)
+
+    def refresh(self, periods: List[Tuple[str, int, int]]) -> None:
+        """
+        Load again from the database the days covered by the (room_code, start_hour, duration_in_hours) periods, along
+        with the recurring bookings, which may have been changed by another process.
+        """
+        self._load_many({
+            (room_code, day)
+            for room_code, start_hour, duration in periods
+            for day, _ in split_per_day(room_catalog.time_zone(room_code), start_hour, duration)
+        })
+        with self._lock:
+            self._forget_recurrences()
+            self._notify(None, None)
+
+
+# The index shared by the whole process:
+occupancy_index = OccupancyIndex()
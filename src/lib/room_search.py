@@ -0,0 +1,104 @@
+"""
+In-memory index of the rooms, to search them by name, floor and capacity (e.g. for the autocompletion of room pickers).
+
+The names are normalized (case and accents folded), and each room is indexed under all the 1, 2 and 3 characters long
+grams of its name: the rooms whose name contains a text are found by intersecting the rooms of the grams of the text,
+then checked. The floors map to their rooms, and the capacities are sorted, so that every filter yields its candidates
+without scanning all the rooms. Combined filters intersect their candidates, starting from the fewest.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+import unicodedata
+
+from lib.catalog import RoomInfo
+
+
+# Length of the longest grams indexed (longer texts are searched by all their grams of this length):
+_GRAM_LENGTH = 3
+
+
+def normalize(text: str) -> str:
+    """The text without case nor accents, as compared by the search."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _grams(text: str, length: int) -> Set[str]:
+    return {text[i:i + length] for i in range(len(text) - length + 1)}
+
+
+class RoomSearchIndex:
+    """
+    The rooms (in the order of their codes), indexed by the grams of their name, by floor and by capacity.
+    Rooms are referred to by their position, so that candidates are intersected as sets of integers.
+    """
+
+    def __init__(self, rooms: List[RoomInfo]):
+        self._rooms = rooms
+        self._names = [normalize(room.name) for room in rooms]
+        self._positions_per_gram: Dict[str, Set[int]] = {}
+        for position, name in enumerate(self._names):
+            for length in range(1, _GRAM_LENGTH + 1):
+                for gram in _grams(name, length):
+                    self._positions_per_gram.setdefault(gram, set()).add(position)
+        self._positions_per_floor: Dict[int, List[int]] = {}
+        for position, room in enumerate(rooms):
+            self._positions_per_floor.setdefault(room.floor, []).append(position)
+        # (the rooms of unknown capacity never match a minimal capacity)
+        self._capacities: List[Tuple[int, int]] = sorted(
+            (room.capacity, position) for position, room in enumerate(rooms) if room.capacity is not None
+        )
+
+    def _with_name_containing(self, text: str) -> Set[int]:
+        grams = _grams(text, min(len(text), _GRAM_LENGTH))
+        candidates = set.intersection(*(self._positions_per_gram.get(gram, set()) for gram in grams))
+        if len(text) <= _GRAM_LENGTH:
+            return candidates
+        return {position for position in candidates if text in self._names[position]}
+
+    def _with_capacity_of_at_least(self, min_capacity: int) -> Set[int]:
+        return {position for _, position in self._capacities[bisect_left(self._capacities, (min_capacity,)):]}
+
+    def _rank(self, position: int, text: str) -> Tuple[int, int, int]:
+        """
+        The rank of a room whose name contains the text: first those whose name starts with it, then those having a
+        word starting with it, then the others, each by position of the text in the name (then by code).
+        """
+        name = self._names[position]
+        index = name.find(text)
+        if index == 0:
+            return 0, index, position
+        if f" {text}" in name or f"-{text}" in name:
+            return 1, index, position
+        return 2, index, position
+
+    def on_floor(self, floor: int) -> List[RoomInfo]:
+        return [self._rooms[position] for position in self._positions_per_floor.get(floor, [])]
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        floor: Optional[int] = None,
+        min_capacity: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[RoomInfo]:
+        """
+        The rooms matching all the given filters: the rooms whose name contains the text (whatever the case and the
+        accents) ranked by relevance, or else all the matching rooms in the order of their codes.
+        """
+        text = normalize(text) if text else None
+        candidate_sets = []
+        if text:
+            candidate_sets.append(self._with_name_containing(text))
+        if floor is not None:
+            candidate_sets.append(set(self._positions_per_floor.get(floor, [])))
+        if min_capacity:
+            candidate_sets.append(self._with_capacity_of_at_least(min_capacity))
+
+        if candidate_sets:
+            candidate_sets.sort(key=len)
+            positions = candidate_sets[0].intersection(*candidate_sets[1:])
+        else:
+            positions = range(len(self._rooms))
+        ordered = sorted(positions, key=lambda position: self._rank(position, text)) if text else sorted(positions)
+        return [self._rooms[position] for position in ordered[:limit]]
@@ -1,9 +1,15 @@
-from pytz import timezone
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from dataclasses import dataclass
+import datetime as dt
+from typing import List, Optional
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, String, and_, false, or_
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 
+from lib.hours import day_hours, from_epoch_hour, to_epoch_hour
+
 from .base import Base
+from .types import EpochHour
 
 
 class Building(Base):
@@ -26,24 +32,83 @@ class Room(Base):
     building = relationship(Building, backref="rooms", lazy="joined")
 
 
-class Booking(Base):
-    __tablename__ = "bookings"
+class BookingSlot(Base):
+    """
+    One hour booked in a room, identified by its hour since the epoch (see lib.hours).
+    The primary key makes double-bookings impossible at the database level, even between concurrent transactions.
+    """
+    __tablename__ = "booking_slots"
+
+    room_code = Column(String, ForeignKey('rooms.code'), primary_key=True)
+    hour = Column("slot_hour", EpochHour, primary_key=True)
+    booking_id = Column(Integer, ForeignKey('bookings.id'), nullable=False)
+
+
+class BookingChange(Base):
+    """
+    A room and local day whose bookings changed, or a room whose recurring bookings changed (without any day).
+    Each process of the API reads the changes made by the others, to keep its in-memory indexes up-to-date.
+
+    The change of the first day of a booking also holds the event followed by the clients of every process (see
+    lib.change_feed): its kind, and the booking as it was.
+    """
+    __tablename__ = "booking_changes"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    author = Column(String, nullable=False)
+    room_code = Column(String, ForeignKey('rooms.code'), nullable=False)
+    day = Column(Date)
+    kind = Column(String)
+    booking_id = Column(Integer)
+    author = Column(String)
+    start_hour = Column(EpochHour)
+    duration = Column(Integer)
+
+
+class RoomDayUsage(Base):
+    """
+    The hours of a room booked during a local day, by the bookings and by the occurrences of the recurring bookings:
+    their number, and their bitmap (bit h being set when the h-th hour of the day is booked, see lib.occupancy).
+    Kept up-to-date in the same transactions as the bookings, for the analytics never to read the bookings themselves.
+    """
+    __tablename__ = "room_day_usage"
+
+    room_code = Column(String, ForeignKey('rooms.code'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    booked_hours = Column(Integer, nullable=False)
+    hours_bitmap = Column(Integer, nullable=False)
+
+
+class AuthorDayUsage(Base):
+    """
+    The hours of a room booked by an author during a local day, along with the number of bookings (and occurrences)
+    starting this day. Kept up-to-date like the RoomDayUsage.
+    """
+    __tablename__ = "author_day_usage"
+
+    room_code = Column(String, ForeignKey('rooms.code'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    author = Column(String, primary_key=True)
+    bookings = Column(Integer, nullable=False)
+    booked_hours = Column(Integer, nullable=False)
+
+
+class _LocalPeriodMixin:
+    """
+    A period of entire hours in a room, starting at a datetime stored in the local time zone of the room.
+    Only the recurring bookings are stored this way: their occurrences repeat at the same local time, whatever the
+    changes of offset of the time zone.
+    """
     _start_datetime = Column("start_datetime", DateTime, nullable=False)
     duration = Column(Integer, nullable=False)
-    room_code = Column(String, ForeignKey('rooms.code'))
-
-    room = relationship(Room, backref="bookings", lazy="joined")
 
     @hybrid_property
     def start_datetime(self):
         """
         The start_datetime is assumed to have been stored in the local time zone of the room
-        (SQLite loses this information).
+        (SQLite loses this information), which is resolved once and for all in the catalog of rooms.
         """
-        return timezone(self.room.building.tz_name).localize(self._start_datetime)
+        from lib.catalog import room_catalog  # (not at the top: the catalog depends on these models)
+        return room_catalog.time_zone(self.room_code).localize(self._start_datetime)
 
     @start_datetime.setter
     def start_datetime(self, value):
@@ -57,3 +122,149 @@ class Booking(Base):
             since it seems that SQLite in itself can handle datetimes with time zones.
         """
         return self._start_datetime
+
+    @property
+    def local_start_datetime(self) -> dt.datetime:
+        """The start datetime, naive but in the local time zone of the room (which does not need to be resolved)."""
+        return self._start_datetime.replace(tzinfo=None)
+
+
+class Booking(Base):
+    """A period of entire hours in a room, stored as the range of its hours since the epoch (see lib.hours)."""
+    __tablename__ = "bookings"
+    __table_args__ = (
+        Index("ix_bookings_room_code_start_hour", "room_code", "start_hour"),
+        Index("ix_bookings_author_start_hour", "author", "start_hour"),
+        Index("ix_bookings_start_hour_id", "start_hour", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    author = Column(String, nullable=False)
+    start_hour = Column(EpochHour, nullable=False)
+    end_hour = Column(EpochHour, nullable=False)
+    room_code = Column(String, ForeignKey('rooms.code'))
+
+    room = relationship(Room, backref="bookings")
+    slots = relationship(BookingSlot, cascade="all, delete-orphan")
+
+    @hybrid_property
+    def duration(self) -> int:
+        return self.end_hour - self.start_hour
+
+    @property
+    def start_datetime(self) -> dt.datetime:
+        """The start datetime, in the time zone of the room (resolved once and for all in the catalog of rooms)."""
+        from lib.catalog import room_catalog  # (not at the top: the catalog depends on these models)
+        return from_epoch_hour(self.start_hour, room_catalog.time_zone(self.room_code))
+
+    @classmethod
+    def starts_between(cls, first_day: dt.date, last_day: dt.date, room_code: Optional[str] = None):
+        """
+        SQL filter on the bookings starting from first_day to last_day (both included), in the local time zone of their
+        room (or of the given room, if they are already filtered on it). It is written as a range of hours per time
+        zone, so that the indexes on start_hour can be used.
+        """
+        from lib.catalog import room_catalog  # (not at the top: the catalog depends on these models)
+        codes_per_time_zone = room_catalog.codes_per_time_zone(room_code)
+        conditions = []
+        for tz, room_codes in codes_per_time_zone.items():
+            condition = and_(
+                cls.start_hour >= day_hours(tz, first_day)[0], cls.start_hour < day_hours(tz, last_day)[1]
+            )
+            if len(codes_per_time_zone) > 1:
+                condition = and_(cls.room_code.in_(room_codes), condition)
+            conditions.append(condition)
+        if not conditions:
+            return false()
+        return or_(*conditions) if len(conditions) > 1 else conditions[0]
+
+    def hours(self) -> List[int]:
+        """Each booked hour."""
+        return list(range(self.start_hour, self.end_hour))
+
+
+# Number of days between two occurrences of a recurring booking, per frequency (to multiply by its interval):
+FREQUENCIES_IN_DAYS = {"daily": 1, "weekly": 7}
+
+
+def expand_recurrence(
+    start_datetime: dt.datetime,
+    step_in_days: int,
+    until: dt.date,
+    first_day: dt.date,
+    last_day: dt.date,
+) -> List[dt.datetime]:
+    """
+    Return the start datetimes of the occurrences of a recurrence (first starting at start_datetime, then every
+    step_in_days days until the day `until`) which start from first_day to last_day (both days included).
+    """
+    days_before_first_day = (first_day - start_datetime.date()).days
+    first_index = max(0, -(-days_before_first_day // step_in_days))
+    step = dt.timedelta(days=step_in_days)
+    last_day = min(last_day, until)
+
+    occurrences = []
+    occurrence = start_datetime + first_index * step
+    while occurrence.date() <= last_day:
+        occurrences.append(occurrence)
+        occurrence += step
+    return occurrences
+
+
+class RecurringBooking(_LocalPeriodMixin, Base):
+    """
+    A booking repeated every `interval` days or weeks from its start, until a given day (included).
+    Its occurrences are never stored: they are expanded on demand, over the requested period only.
+    """
+    __tablename__ = "recurring_bookings"
+    __table_args__ = (
+        Index("ix_recurring_bookings_room_code_until", "room_code", "until"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    author = Column(String, nullable=False)
+    room_code = Column(String, ForeignKey('rooms.code'), nullable=False)
+    frequency = Column(String, nullable=False)
+    interval = Column(Integer, nullable=False, default=1)
+    until = Column(Date, nullable=False)
+
+    @property
+    def step_in_days(self) -> int:
+        return FREQUENCIES_IN_DAYS[self.frequency] * self.interval
+
+    @classmethod
+    def occurs_between(cls, first_day: dt.date, last_day: dt.date):
+        """SQL filter on the recurring bookings which may have occurrences from first_day to last_day (included)."""
+        return and_(
+            cls._start_datetime < dt.datetime.combine(last_day + dt.timedelta(days=1), dt.time()),
+            cls.until >= first_day,
+        )
+
+    def occurrences_between(self, first_day: dt.date, last_day: dt.date) -> List[dt.datetime]:
+        """The local (naive) start datetimes of the occurrences starting from first_day to last_day (included)."""
+        return expand_recurrence(self.local_start_datetime, self.step_in_days, self.until, first_day, last_day)
+
+    def occurrence(self, local_start_datetime: dt.datetime) -> "Occurrence":
+        from lib.catalog import room_catalog  # (not at the top: the catalog depends on these models)
+        return Occurrence(
+            recurring_booking_id=self.id,
+            author=self.author,
+            start_datetime=room_catalog.time_zone(self.room_code).localize(local_start_datetime),
+            duration=self.duration,
+            room_code=self.room_code,
+        )
+
+
+@dataclass
+class Occurrence:
+    """A single occurrence of a recurring booking, presented like a booking (but without any identifier)."""
+    recurring_booking_id: int
+    author: str
+    start_datetime: dt.datetime
+    duration: int
+    room_code: str
+    id: Optional[int] = None
+
+    @property
+    def start_hour(self) -> int:
+        return to_epoch_hour(self.start_datetime)
@@ -1,23 +1,70 @@
 """
 Configuration and preparation of SQLAlchemy tools.
 """
-from typing import Type
+from typing import Optional, Type
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from configs import config
 
 
-# Private factory:
+# Private factories:
+def _set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+    """
+    Configure each new SQLite connection: the write-ahead log lets readers work while a booking is written,
+    and only needs to be synced at checkpoints, which is durable enough for our purpose.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL;")
+    cursor.execute("PRAGMA synchronous = NORMAL;")
+    cursor.execute(f"PRAGMA busy_timeout = {int(config.DATABASE_BUSY_TIMEOUT_IN_SECONDS * 1000)};")
+    cursor.close()
+
+
+def _make_engine() -> Engine:
+    _engine = create_engine(
+        config.DATABASE_URI,
+        poolclass=QueuePool,
+        pool_size=config.DATABASE_POOL_SIZE,
+        max_overflow=config.DATABASE_POOL_MAX_OVERFLOW,
+        # Pooled connections are shared between the threads serving requests, but never at the same time:
+        connect_args={"check_same_thread": False, "timeout": config.DATABASE_BUSY_TIMEOUT_IN_SECONDS},
+    )
+    event.listen(_engine, "connect", _set_sqlite_pragmas)
+    return _engine
+
+
 def _make_session_class() -> Type[Session]:
-    engine = create_engine(config.DATABASE_URI)
     return sessionmaker(bind=engine)
 
 
+engine = _make_engine()
 _session_class = _make_session_class()
+_scoped_session = scoped_session(_session_class)
 
 
 # Public tools:
 def new_session() -> Session:
+    """A new session, that must be closed by the caller (to use outside of requests)."""
     return _session_class()
+
+
+def current_session() -> Session:
+    """
+    The session of the current request (or more generally, of the current thread).
+    It is created on first use, and closed when the application context is torn down.
+    """
+    return _scoped_session()
+
+
+def remove_current_session(_exception: Optional[BaseException] = None) -> None:
+    """Close the session of the current request, if any, and give its connection back to the pool."""
+    _scoped_session.remove()
+
+
+def dispose_engine() -> None:
+    """Close all the pooled connections (e.g. before deleting the database file, or after forking)."""
+    engine.dispose()
@@ -0,0 +1,27 @@
+"""
+Custom column types.
+"""
+import datetime as dt
+from typing import Optional, Union
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+from lib.hours import to_epoch_hour
+
+
+class EpochHour(TypeDecorator):
+    """
+    An hour stored as the number of hours since the Unix epoch (see lib.hours), so that periods are compared as integer
+    ranges, in indexes too. Aware datetimes can be bound directly (e.g. in filters), while the results are left as
+    integers: they are only converted to local datetimes at the edges, in the time zone of each room.
+    """
+    impl = Integer
+
+    def process_bind_param(self, value: Optional[Union[int, dt.datetime]], dialect) -> Optional[int]:
+        if isinstance(value, dt.datetime):
+            return to_epoch_hour(value)
+        return value
+
+    def process_result_value(self, value: Optional[int], dialect) -> Optional[int]:
+        return value
@@ -0,0 +1,66 @@
+"""
+The storage of the bookings, in the engine selected by the STORAGE_ENGINE configuration.
+"""
+import atexit
+import threading
+from typing import Dict
+
+from configs import config
+
+from .base import (
+    BOOKING_ROW_COLUMNS,
+    AnyBooking,
+    AuthorUsageRow,
+    BookingChangeRow,
+    BookingEventRow,
+    BookingPeriod,
+    BookingRecord,
+    BookingRow,
+    DayUsage,
+    Period,
+    RoomDayBitmap,
+    RoomRow,
+    Storage,
+    day_usages,
+    occurrence_periods,
+    overlap,
+)
+
+
+_storages: Dict[str, Storage] = {}
+_lock = threading.Lock()
+
+
+def _make_storage(engine_name: str) -> Storage:
+    if engine_name == "sqlite":
+        from .sql import SqlStorage
+        return SqlStorage()
+    if engine_name == "memory":
+        from .memory import MemoryStorage
+        return MemoryStorage(
+            config.MEMORY_STORAGE_DIR, config.MEMORY_SNAPSHOT_INTERVAL_IN_SECONDS, config.MEMORY_JOURNAL_SYNC
+        )
+    raise ValueError(f"Unknown STORAGE_ENGINE: {engine_name}")
+
+
+def current_storage() -> Storage:
+    """The storage of the configured engine, created on first use (loading its state, for an in-memory engine)."""
+    engine_name = config.STORAGE_ENGINE
+    storage = _storages.get(engine_name)
+    if storage is None:
+        with _lock:
+            storage = _storages.get(engine_name)
+            if storage is None:
+                storage = _storages[engine_name] = _make_storage(engine_name)
+    return storage
+
+
+def close_storages() -> None:
+    """Close the storages created so far (persisting the in-memory ones): they will be created again on next use."""
+    with _lock:
+        for storage in _storages.values():
+            storage.close()
+        _storages.clear()
+
+
+atexit.register(close_storages)
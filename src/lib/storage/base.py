@@ -0,0 +1,261 @@
+"""
+The interface of the storage engines, along with the helpers they share.
+"""
+from abc import ABC, abstractmethod
+import datetime as dt
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from lib.catalog import room_catalog
+from lib.hours import from_epoch_hour, local_epoch_hour, split_per_day
+from lib.sqlalchemy.models import Booking, RecurringBooking
+
+
+# A room along with its building: (code, name, floor, capacity, building_id, tz_name):
+RoomRow = Tuple[str, str, int, Optional[int], int, str]
+
+# A booking as a plain row, made of these columns (the last one being always None, for the rows of the occurrences of
+# the recurring bookings to have the same shape):
+BOOKING_ROW_COLUMNS = ("id", "author", "start_hour", "duration", "room_code", "recurring_booking_id")
+BookingRow = Tuple[int, str, int, int, str, None]
+
+# The booked hours of a room: (room_code, start_hour, duration):
+BookingPeriod = Tuple[str, int, int]
+
+# A room and local day whose bookings changed, or a room whose recurring bookings changed: (id, room_code, day):
+BookingChangeRow = Tuple[int, str, Optional[dt.date]]
+
+# The event of a journaled change of a booking (see lib.change_feed):
+# (id, kind, booking_id, author, room_code, start_hour, duration):
+BookingEventRow = Tuple[int, str, int, str, str, int, int]
+
+# A period as its start and end hours (see lib.hours), the end being excluded:
+Period = Tuple[int, int]
+
+# The usage of a room during a local day by a period: (day, booked hours, day bitmap, bookings), the period counting as
+# a booking on the day it starts only:
+DayUsage = Tuple[dt.date, int, int, int]
+
+# The hours of a room booked during a local day, as a bitmap: (room_code, day, hours_bitmap):
+RoomDayBitmap = Tuple[str, dt.date, int]
+
+# The usage of rooms by an author: (author, bookings, booked_hours):
+AuthorUsageRow = Tuple[str, int, int]
+
+
+class BookingRecord:
+    """A booking held in memory, with the same attributes as the Booking model (but without any session)."""
+    __slots__ = ("id", "author", "start_hour", "end_hour", "room_code")
+
+    def __init__(self, id: Optional[int], author: str, start_hour: int, end_hour: int, room_code: str):
+        self.id = id
+        self.author = author
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.room_code = room_code
+
+    @property
+    def duration(self) -> int:
+        return self.end_hour - self.start_hour
+
+    @property
+    def start_datetime(self) -> dt.datetime:
+        return from_epoch_hour(self.start_hour, room_catalog.time_zone(self.room_code))
+
+    @property
+    def room(self):
+        """The room, as found in the catalog (with the same attributes as the Room model)."""
+        return room_catalog.get(self.room_code)
+
+    def hours(self) -> List[int]:
+        return list(range(self.start_hour, self.end_hour))
+
+    def row(self) -> BookingRow:
+        return self.id, self.author, self.start_hour, self.end_hour - self.start_hour, self.room_code, None
+
+
+# Either kind of booking, depending on the engine:
+AnyBooking = Union[Booking, BookingRecord]
+
+
+def overlap(periods: List[Period], other_periods: List[Period]) -> bool:
+    """Return True if any period of the first list overlaps any period of the second (each made of disjoint periods)."""
+    periods, other_periods = sorted(periods), sorted(other_periods)
+    i = j = 0
+    while i < len(periods) and j < len(other_periods):
+        if periods[i][0] < other_periods[j][1] and other_periods[j][0] < periods[i][1]:
+            return True
+        if periods[i][1] <= other_periods[j][1]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def occurrence_periods(recurring_booking: RecurringBooking, first_day: dt.date, last_day: dt.date) -> List[Period]:
+    """The periods of the occurrences starting from first_day to last_day (included)."""
+    tz = room_catalog.time_zone(recurring_booking.room_code)
+    start_hours = [
+        local_epoch_hour(start_datetime, tz)
+        for start_datetime in recurring_booking.occurrences_between(first_day, last_day)
+    ]
+    return [(start_hour, start_hour + recurring_booking.duration) for start_hour in start_hours]
+
+
+def day_usages(tz: dt.tzinfo, periods: Iterable[Period]) -> List[DayUsage]:
+    """The usage of a room of the time zone by each period, on each local day it covers."""
+    return [
+        (day, bin(mask).count("1"), mask, int(i == 0))
+        for start_hour, end_hour in periods
+        for i, (day, mask) in enumerate(split_per_day(tz, start_hour, end_hour - start_hour))
+    ]
+
+
+class Storage(ABC):
+    """
+    The repository of the rooms, buildings, bookings and recurring bookings, whatever the engine holding them.
+
+    Writes are atomic: either all the given bookings are stored, or none of them is when any of them would overlap
+    another booking or an occurrence of a recurring booking (checked by the engine itself, since the in-process indexes
+    may miss the writes of other processes). The indexes are kept up-to-date by the callers (see lib.bookings).
+    """
+
+    # Whether the reads wait for I/O (then the coroutines of the ASGI application must not call the engine directly):
+    is_blocking = True
+
+    # Whether the changes, and the events of the bookings, are journaled for the other processes sharing the storage:
+    journals_changes = False
+
+    #
+    # Rooms and buildings:
+    #
+    @abstractmethod
+    def room_rows(self) -> List[RoomRow]:
+        """All the rooms along with the time zone of their building, in the order of their codes."""
+
+    #
+    # Bookings:
+    #
+    @abstractmethod
+    def new_booking(self, author: str, start_hour: int, end_hour: int, room_code: str) -> AnyBooking:
+        """A booking to insert, of the kind stored by the engine."""
+
+    @abstractmethod
+    def get_booking(self, id: int) -> Optional[AnyBooking]:
+        """The booking along with its room, or None if there is none with this id."""
+
+    @abstractmethod
+    def get_booking_row(self, id: int) -> Optional[BookingRow]:
+        """The booking as a row, or None if there is none with this id."""
+
+    @abstractmethod
+    def bookings_between(
+        self,
+        first_day: Optional[dt.date],
+        last_day: Optional[dt.date],
+        *,
+        author: Optional[str] = None,
+        room_code: Optional[str] = None,
+        after: Optional[Tuple[int, Optional[int]]] = None,
+        limit: Optional[int] = None,
+        as_rows: bool = False,
+        batch_size: int = 1000,
+    ) -> Iterable[Union[AnyBooking, BookingRow]]:
+        """
+        The bookings starting from first_day to last_day (both included, in the local time zone of their room, or
+        whenever if None), in the order of their start hour then of their id.
+
+        :param after: The (start_hour, id) after which the bookings start, all those of the start_hour coming before
+            it if the id is None.
+        :param limit: The maximum number of bookings, or None to iterate over all of them.
+        :param as_rows: Whether to return rows instead of bookings.
+        :param batch_size: When there is no limit, the number of bookings fetched at once.
+        """
+
+    @abstractmethod
+    def all_booking_periods(self) -> Iterable[BookingPeriod]:
+        """The periods of all the bookings, which may be streamed (to be iterated over only once)."""
+
+    @abstractmethod
+    def booking_periods(self, room_codes: Iterable[str], first_hour: int, end_hour: int) -> List[BookingPeriod]:
+        """The periods of the bookings of the rooms starting from first_hour to end_hour (excluded)."""
+
+    @abstractmethod
+    def insert_bookings(self, bookings: List[AnyBooking]) -> bool:
+        """Insert all the bookings (assigning their id), unless any of them overlaps a booking or an occurrence."""
+
+    @abstractmethod
+    def delete_booking(self, booking: AnyBooking) -> None:
+        """Delete the booking, releasing its hours."""
+
+    #
+    # Recurring bookings (which are few, and whose occurrences are never stored):
+    #
+    @abstractmethod
+    def get_recurring_booking(self, id: int) -> Optional[RecurringBooking]:
+        """The recurring booking, or None if there is none with this id."""
+
+    @abstractmethod
+    def all_recurring_bookings(self) -> List[RecurringBooking]:
+        """All the recurring bookings."""
+
+    @abstractmethod
+    def recurring_bookings_between(
+        self,
+        first_day: dt.date,
+        last_day: dt.date,
+        *,
+        author: Optional[str] = None,
+        room_code: Optional[str] = None,
+    ) -> List[RecurringBooking]:
+        """The recurring bookings which may have occurrences from first_day to last_day (both included)."""
+
+    @abstractmethod
+    def insert_recurring_booking(self, recurring_booking: RecurringBooking) -> bool:
+        """Insert the recurring booking, unless any of its occurrences overlaps a booking or another occurrence."""
+
+    @abstractmethod
+    def delete_recurring_booking(self, recurring_booking: RecurringBooking) -> None:
+        """Delete the recurring booking, releasing the hours of all its occurrences."""
+
+    #
+    # Daily usage of the rooms, by the bookings and the occurrences of the recurring bookings (rolled up on each write,
+    # so that reading a range of days never reads the bookings themselves):
+    #
+    @abstractmethod
+    def booked_hours_per_room(self, room_codes: List[str], first_day: dt.date, last_day: dt.date) -> Dict[str, int]:
+        """The number of hours of each room booked from first_day to last_day (included), if any."""
+
+    @abstractmethod
+    def day_bitmaps(self, room_codes: List[str], first_day: dt.date, last_day: dt.date) -> List[RoomDayBitmap]:
+        """The booked hours of the rooms during each day from first_day to last_day (included), if any."""
+
+    @abstractmethod
+    def top_authors(
+        self, room_codes: List[str], first_day: dt.date, last_day: dt.date, limit: int
+    ) -> List[AuthorUsageRow]:
+        """
+        The authors having booked the most hours of the rooms from first_day to last_day (included), along with the
+        number of their bookings starting during these days, by decreasing number of hours (then by author).
+        """
+
+    #
+    # Changes made by the other processes sharing the storage (see SYNC_INDEXES_BETWEEN_PROCESSES):
+    #
+    def last_change_id(self) -> int:
+        """The id of the last journaled change."""
+        return 0
+
+    def changes_after(self, change_id: int) -> List[BookingChangeRow]:
+        """The changes journaled after this one, in order."""
+        return []
+
+    def booking_events_after(self, event_id: int, limit: int) -> List[BookingEventRow]:
+        """The first events of the bookings journaled after this change (or event), in order."""
+        return []
+
+    def stats(self) -> Dict[str, int]:
+        """The counters of the engine, served at /metrics."""
+        return {}
+
+    def close(self) -> None:
+        """Release the resources of the engine (e.g. before deleting its files)."""
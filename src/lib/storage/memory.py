@@ -0,0 +1,626 @@
+"""
+Storage in memory, persisted in files: the bookings of each room are kept in arrays of integers (start hours, end hours
+and ids) sorted by start hour, so that checking an overlap or reading a range of hours only takes a binary search,
+without any I/O nor allocating anything per booking.
+
+Each write is appended to a journal (a JSON line per write, flushed, and synced if MEMORY_JOURNAL_SYNC) before it is
+applied and confirmed. The whole state is written to a snapshot periodically, in the background, after which the
+journals it covers are deleted. On restart, the snapshot is loaded, then the writes journaled since are replayed.
+When there is neither snapshot nor journal yet, the bookings are imported from the SQLite database, once.
+The daily usage of the rooms is rolled up along with the bookings, as they are loaded or written.
+
+The rooms and buildings, which are only changed by the storage management scripts, are still read from the database.
+An in-memory storage belongs to a single process: it cannot be shared between the workers of the production server.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+import datetime as dt
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple, Union
+
+from pytz import timezone
+
+from lib.catalog import room_catalog
+from lib.hours import day_hours, local_day, local_epoch_hour
+from lib.sqlalchemy.models import Booking, RecurringBooking
+from lib.sqlalchemy.session import new_session
+
+from .base import (
+    AuthorUsageRow,
+    BookingPeriod,
+    BookingRecord,
+    BookingRow,
+    Period,
+    RoomDayBitmap,
+    RoomRow,
+    Storage,
+    day_usages,
+    occurrence_periods,
+    overlap,
+)
+from .sql import load_room_rows
+
+
+_SNAPSHOT_FILE_NAME = "snapshot.json"
+
+# The journals are numbered by the sequence number of their first write:
+_JOURNAL_FILE_NAME = "journal-{:012d}.jsonl"
+_JOURNAL_FILE_PATTERN = re.compile(r"^journal-(\d{12})\.jsonl$")
+
+# The operations of the journal:
+_INSERT_BOOKINGS = "insert_bookings"
+_DELETE_BOOKING = "delete_booking"
+_INSERT_RECURRING_BOOKING = "insert_recurring_booking"
+_DELETE_RECURRING_BOOKING = "delete_recurring_booking"
+
+
+def _key_position(start_hours: "array[int]", ids: "array[int]", start_hour: int, id: int) -> int:
+    """The position of the (start_hour, id) key in parallel arrays sorted by start hour, then by id."""
+    lo = bisect_left(start_hours, start_hour)
+    return bisect_left(ids, id, lo, bisect_right(start_hours, start_hour, lo))
+
+
+class _RoomBookings:
+    """The bookings of a room as parallel arrays, sorted by start hour (and by end hour too, as they never overlap)."""
+    __slots__ = ("starts", "ends", "ids")
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.ids = array("q")
+
+    def overlaps(self, start_hour: int, end_hour: int) -> bool:
+        # (only the last booking starting before the end hour may overlap the period)
+        i = bisect_left(self.starts, end_hour)
+        return i > 0 and self.ends[i - 1] > start_hour
+
+    def periods_between(self, first_hour: int, end_hour: int) -> List[Period]:
+        """The periods of the bookings covering any hour from first_hour to end_hour (excluded)."""
+        i, j = bisect_right(self.ends, first_hour), bisect_left(self.starts, end_hour)
+        return list(zip(self.starts[i:j], self.ends[i:j]))
+
+    def insert(self, start_hour: int, end_hour: int, id: int) -> None:
+        i = bisect_left(self.starts, start_hour)
+        self.starts.insert(i, start_hour)
+        self.ends.insert(i, end_hour)
+        self.ids.insert(i, id)
+
+    def remove(self, start_hour: int) -> None:
+        i = bisect_left(self.starts, start_hour)
+        del self.starts[i], self.ends[i], self.ids[i]
+
+
+def _recurring_booking_row(recurring_booking: RecurringBooking) -> List[Any]:
+    return [
+        recurring_booking.id,
+        recurring_booking.author,
+        recurring_booking.local_start_datetime.isoformat(),
+        recurring_booking.duration,
+        recurring_booking.room_code,
+        recurring_booking.frequency,
+        recurring_booking.interval,
+        recurring_booking.until.isoformat(),
+    ]
+
+
+def _recurring_booking_from_row(row: List[Any]) -> RecurringBooking:
+    id, author, start_datetime, duration, room_code, frequency, interval, until = row
+    return RecurringBooking(
+        id=id,
+        author=author,
+        start_datetime=dt.datetime.fromisoformat(start_datetime),
+        duration=duration,
+        room_code=room_code,
+        frequency=frequency,
+        interval=interval,
+        until=dt.date.fromisoformat(until),
+    )
+
+
+class MemoryStorage(Storage):
+    """
+    The bookings by id, per room, and all together in the order of the lists of bookings, along with the recurring
+    bookings (as objects never attached to a session), persisted in a directory.
+    """
+    is_blocking = False
+
+    def __init__(self, directory: str, snapshot_interval_in_seconds: float, sync_journal: bool):
+        self._directory = directory
+        self._snapshot_interval_in_seconds = snapshot_interval_in_seconds
+        self._sync_journal = sync_journal
+        self._lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._bookings: Dict[int, BookingRecord] = {}
+        self._room_bookings: Dict[str, _RoomBookings] = {}
+        # (the start hours and ids of all the bookings, sorted by start hour then by id)
+        self._start_hours = array("q")
+        self._ids = array("q")
+        self._recurring_bookings: Dict[int, RecurringBooking] = {}
+        # (the [booked hours, hours bitmap] of each room per day, and the [bookings, booked hours] of each author too)
+        self._room_day_usage: Dict[str, Dict[dt.date, List[int]]] = {}
+        self._author_day_usage: Dict[str, Dict[dt.date, Dict[str, List[int]]]] = {}
+        # (resolved without the catalog, which loads its rooms through this storage)
+        self._time_zones = {code: timezone(tz_name) for code, _, _, _, _, tz_name in load_room_rows()}
+        self._last_booking_id = 0
+        self._last_recurring_booking_id = 0
+        self._sequence = 0  # (the sequence number of the last write)
+        self._snapshot_sequence: Optional[int] = None
+        self._journal: Optional[TextIO] = None
+        self.journal_writes = 0
+        self.snapshots = 0
+        self.snapshot_failures = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._stopped = threading.Event()
+        self._snapshotter = threading.Thread(target=self._snapshot_periodically, name="snapshots", daemon=True)
+        self._snapshotter.start()
+
+    #
+    # State:
+    #
+    def _time_zone(self, room_code: str) -> dt.tzinfo:
+        tz = self._time_zones.get(room_code)
+        return tz if tz is not None else room_catalog.time_zone(room_code)
+
+    def _roll_up(self, room_code: str, author: str, periods: List[Period], is_removed: bool = False) -> None:
+        """Add the usage of the room by the periods of the author to the daily rollups (or remove it)."""
+        sign = -1 if is_removed else 1
+        room_days = self._room_day_usage.setdefault(room_code, {})
+        author_days = self._author_day_usage.setdefault(room_code, {})
+        for day, hours, mask, bookings in day_usages(self._time_zone(room_code), periods):
+            usage = room_days.setdefault(day, [0, 0])
+            usage[0] += sign * hours
+            usage[1] = usage[1] & ~mask if is_removed else usage[1] | mask
+            if usage[0] <= 0:
+                del room_days[day]
+            authors = author_days.setdefault(day, {})
+            author_usage = authors.setdefault(author, [0, 0])
+            author_usage[0] += sign * bookings
+            author_usage[1] += sign * hours
+            if author_usage[1] <= 0:
+                del authors[author]
+                if not authors:
+                    del author_days[day]
+
+    def _all_occurrence_periods(self, recurring_booking: RecurringBooking) -> List[Period]:
+        tz = self._time_zone(recurring_booking.room_code)
+        return [
+            (start_hour, start_hour + recurring_booking.duration)
+            for start_hour in (
+                local_epoch_hour(start_datetime, tz)
+                for start_datetime in recurring_booking.occurrences_between(
+                    recurring_booking.local_start_datetime.date(), recurring_booking.until
+                )
+            )
+        ]
+
+    def _add_booking(self, booking: BookingRecord) -> None:
+        self._bookings[booking.id] = booking
+        self._room_bookings.setdefault(booking.room_code, _RoomBookings()) \
+            .insert(booking.start_hour, booking.end_hour, booking.id)
+        i = _key_position(self._start_hours, self._ids, booking.start_hour, booking.id)
+        self._start_hours.insert(i, booking.start_hour)
+        self._ids.insert(i, booking.id)
+        self._last_booking_id = max(self._last_booking_id, booking.id)
+        self._roll_up(booking.room_code, booking.author, [(booking.start_hour, booking.end_hour)])
+
+    def _remove_booking(self, id: int) -> None:
+        booking = self._bookings.pop(id)
+        self._room_bookings[booking.room_code].remove(booking.start_hour)
+        i = _key_position(self._start_hours, self._ids, booking.start_hour, id)
+        del self._start_hours[i], self._ids[i]
+        self._roll_up(booking.room_code, booking.author, [(booking.start_hour, booking.end_hour)], is_removed=True)
+
+    def _add_recurring_booking(self, recurring_booking: RecurringBooking) -> None:
+        self._recurring_bookings[recurring_booking.id] = recurring_booking
+        self._last_recurring_booking_id = max(self._last_recurring_booking_id, recurring_booking.id)
+        self._roll_up(
+            recurring_booking.room_code, recurring_booking.author, self._all_occurrence_periods(recurring_booking)
+        )
+
+    def _remove_recurring_booking(self, id: int) -> None:
+        recurring_booking = self._recurring_bookings.pop(id)
+        self._roll_up(
+            recurring_booking.room_code,
+            recurring_booking.author,
+            self._all_occurrence_periods(recurring_booking),
+            is_removed=True,
+        )
+
+    def _replay(self, operation: str, payload: Any) -> None:
+        """Apply a journaled write."""
+        if operation == _INSERT_BOOKINGS:
+            for row in payload:
+                self._add_booking(BookingRecord(*row))
+        elif operation == _DELETE_BOOKING:
+            self._remove_booking(payload)
+        elif operation == _INSERT_RECURRING_BOOKING:
+            self._add_recurring_booking(_recurring_booking_from_row(payload))
+        elif operation == _DELETE_RECURRING_BOOKING:
+            self._remove_recurring_booking(payload)
+        else:
+            raise ValueError(f"Unknown operation in the journal: {operation}.")
+
+    def _dump(self) -> Dict[str, Any]:
+        return {
+            "sequence": self._sequence,
+            "last_booking_id": self._last_booking_id,
+            "last_recurring_booking_id": self._last_recurring_booking_id,
+            "bookings": [
+                [booking.id, booking.author, booking.start_hour, booking.end_hour, booking.room_code]
+                for booking in self._bookings.values()
+            ],
+            "recurring_bookings": [
+                _recurring_booking_row(recurring_booking) for recurring_booking in self._recurring_bookings.values()
+            ],
+        }
+
+    def _load(self, state: Dict[str, Any]) -> None:
+        for row in state["bookings"]:
+            self._add_booking(BookingRecord(*row))
+        for row in state["recurring_bookings"]:
+            self._add_recurring_booking(_recurring_booking_from_row(row))
+        self._sequence = state["sequence"]
+        self._last_booking_id = max(self._last_booking_id, state["last_booking_id"])
+        self._last_recurring_booking_id = max(self._last_recurring_booking_id, state["last_recurring_booking_id"])
+
+    #
+    # Persistence:
+    #
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self._directory, file_name)
+
+    def _journal_files(self) -> List[Tuple[int, str]]:
+        """The (first sequence number, path) of the journals, in order."""
+        journals = []
+        for file_name in os.listdir(self._directory):
+            match = _JOURNAL_FILE_PATTERN.match(file_name)
+            if match:
+                journals.append((int(match.group(1)), self._path(file_name)))
+        return sorted(journals)
+
+    def _recover(self) -> None:
+        """Load the snapshot and replay the journals, or import the bookings of the database the first time."""
+        journals = self._journal_files()
+        if os.path.exists(self._path(_SNAPSHOT_FILE_NAME)):
+            with open(self._path(_SNAPSHOT_FILE_NAME)) as snapshot:
+                self._load(json.load(snapshot))
+            self._snapshot_sequence = self._sequence
+        elif not journals:
+            self._import_database()
+            self._write_snapshot(self._dump())
+            self._snapshot_sequence = self._sequence
+
+        for _, path in journals:
+            with open(path) as journal:
+                for line in journal:
+                    try:
+                        sequence, operation, payload = json.loads(line)
+                    except ValueError:
+                        # (the last write was interrupted, so it was never confirmed)
+                        break
+                    if sequence > self._sequence:
+                        self._replay(operation, payload)
+                        self._sequence = sequence
+        self._open_journal()
+
+    def _import_database(self) -> None:
+        db_session = new_session()
+        try:
+            for row in db_session.query(
+                Booking.id, Booking.author, Booking.start_hour, Booking.end_hour, Booking.room_code
+            ):
+                self._add_booking(BookingRecord(*row))
+            for recurring_booking in db_session.query(RecurringBooking).all():
+                db_session.expunge(recurring_booking)
+                self._add_recurring_booking(recurring_booking)
+        finally:
+            db_session.close()
+
+    def _open_journal(self) -> None:
+        """Journal the next writes in a new file (any file of the same name only holding an interrupted write)."""
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self._path(_JOURNAL_FILE_NAME.format(self._sequence + 1)), "w")
+
+    def _write(self, operation: str, payload: Any) -> None:
+        """Journal a write, before it is applied."""
+        self._journal.write(json.dumps([self._sequence + 1, operation, payload]) + "\n")
+        self._journal.flush()
+        if self._sync_journal:
+            os.fsync(self._journal.fileno())
+        self._sequence += 1
+        self.journal_writes += 1
+
+    def _write_snapshot(self, state: Dict[str, Any]) -> None:
+        # (written aside, then renamed at once, so that a snapshot is never partially written)
+        temporary_path = self._path(_SNAPSHOT_FILE_NAME + ".tmp")
+        with open(temporary_path, "w") as snapshot:
+            json.dump(state, snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary_path, self._path(_SNAPSHOT_FILE_NAME))
+
+    def snapshot(self) -> None:
+        """Write the whole state in the snapshot, if it changed, then delete the journals it covers."""
+        with self._snapshot_lock:
+            with self._lock:
+                if self._sequence == self._snapshot_sequence:
+                    return
+                state = self._dump()
+                self._open_journal()
+            self._write_snapshot(state)
+            self._snapshot_sequence = state["sequence"]
+            for first_sequence, path in self._journal_files():
+                if first_sequence <= state["sequence"]:
+                    os.remove(path)
+            self.snapshots += 1
+
+    def _snapshot_periodically(self) -> None:
+        while not self._stopped.wait(self._snapshot_interval_in_seconds):
+            try:
+                self.snapshot()
+            except OSError:
+                # (the journals are kept until a snapshot succeeds)
+                self.snapshot_failures += 1
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._snapshotter.join()
+        self.snapshot()
+        with self._lock:
+            self._journal.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "bookings": len(self._bookings),
+            "journal_writes": self.journal_writes,
+            "snapshots": self.snapshots,
+            "snapshot_failures": self.snapshot_failures,
+        }
+
+    #
+    # Rooms and buildings:
+    #
+    def room_rows(self) -> List[RoomRow]:
+        return load_room_rows()
+
+    #
+    # Bookings:
+    #
+    def new_booking(self, author: str, start_hour: int, end_hour: int, room_code: str) -> BookingRecord:
+        return BookingRecord(None, author, start_hour, end_hour, room_code)
+
+    def get_booking(self, id: int) -> Optional[BookingRecord]:
+        return self._bookings.get(id)
+
+    def get_booking_row(self, id: int) -> Optional[BookingRow]:
+        booking = self._bookings.get(id)
+        return booking.row() if booking else None
+
+    def bookings_between(
+        self,
+        first_day: Optional[dt.date],
+        last_day: Optional[dt.date],
+        *,
+        author: Optional[str] = None,
+        room_code: Optional[str] = None,
+        after: Optional[Tuple[int, Optional[int]]] = None,
+        limit: Optional[int] = None,
+        as_rows: bool = False,
+        batch_size: int = 1000,
+    ) -> List[Union[BookingRecord, BookingRow]]:
+        # Get the range of hours of the days, in the time zone of each room:
+        hours_per_room: Optional[Dict[str, Tuple[int, int]]] = None
+        first_hour, end_hour = float("-inf"), float("inf")
+        if first_day:
+            hours_per_room = {}
+            for tz, room_codes in room_catalog.codes_per_time_zone(room_code).items():
+                hours = day_hours(tz, first_day)[0], day_hours(tz, last_day)[1]
+                hours_per_room.update(dict.fromkeys(room_codes, hours))
+            if not hours_per_room:
+                return []
+            first_hour = min(first for first, _ in hours_per_room.values())
+            end_hour = max(end for _, end in hours_per_room.values())
+
+        bookings = []
+        with self._lock:
+            # Read the start hours and ids of all the bookings, or those of the room (in the same order):
+            if room_code is None:
+                start_hours, ids = self._start_hours, self._ids
+            else:
+                room_bookings = self._room_bookings.get(room_code, _RoomBookings())
+                start_hours, ids = room_bookings.starts, room_bookings.ids
+            i, j = bisect_left(start_hours, first_hour), bisect_left(start_hours, end_hour)
+            if after:
+                after_start_hour, after_id = after
+                i = max(i, bisect_right(start_hours, after_start_hour) if after_id is None else
+                        _key_position(start_hours, ids, after_start_hour, after_id + 1))
+
+            for index in range(i, j):
+                booking = self._bookings[ids[index]]
+                if author is not None and booking.author != author:
+                    continue
+                if hours_per_room is not None:
+                    room_hours = hours_per_room.get(booking.room_code)
+                    if room_hours is None or not room_hours[0] <= booking.start_hour < room_hours[1]:
+                        continue
+                bookings.append(booking.row() if as_rows else booking)
+                if limit is not None and len(bookings) >= limit:
+                    break
+        return bookings
+
+    def all_booking_periods(self) -> List[BookingPeriod]:
+        with self._lock:
+            return [
+                (room_code, start, end - start)
+                for room_code, room_bookings in self._room_bookings.items()
+                for start, end in zip(room_bookings.starts, room_bookings.ends)
+            ]
+
+    def booking_periods(self, room_codes: Iterable[str], first_hour: int, end_hour: int) -> List[BookingPeriod]:
+        periods = []
+        with self._lock:
+            for room_code in room_codes:
+                room_bookings = self._room_bookings.get(room_code)
+                if room_bookings is None:
+                    continue
+                i, j = bisect_left(room_bookings.starts, first_hour), bisect_left(room_bookings.starts, end_hour)
+                periods.extend(
+                    (room_code, start, end - start)
+                    for start, end in zip(room_bookings.starts[i:j], room_bookings.ends[i:j])
+                )
+        return periods
+
+    def _occurrences(self, room_code: str, first_day: dt.date, last_day: dt.date, excluded_id: Optional[int] = None):
+        """The occurrences of the recurring bookings of the room starting from first_day to last_day (included)."""
+        return [
+            period
+            for recurring_booking in self._recurring_bookings.values()
+            if recurring_booking.room_code == room_code and recurring_booking.id != excluded_id
+            for period in occurrence_periods(recurring_booking, first_day, last_day)
+        ]
+
+    def insert_bookings(self, bookings: List[BookingRecord]) -> bool:
+        with self._lock:
+            # Check the bookings against the others, and against the previous ones of the list:
+            periods_per_room: Dict[str, List[Period]] = {}
+            for booking in bookings:
+                room_periods = periods_per_room.setdefault(booking.room_code, [])
+                room_bookings = self._room_bookings.get(booking.room_code)
+                if (room_bookings and room_bookings.overlaps(booking.start_hour, booking.end_hour)) or \
+                        overlap([(booking.start_hour, booking.end_hour)], room_periods):
+                    return False
+                room_periods.append((booking.start_hour, booking.end_hour))
+
+            # Check them against the occurrences of the recurring bookings (which may overflow from the day before):
+            for room_code, periods in periods_per_room.items():
+                tz = room_catalog.time_zone(room_code)
+                first_day = local_day(min(start for start, _ in periods), tz) - dt.timedelta(days=1)
+                last_day = local_day(max(end for _, end in periods) - 1, tz)
+                if overlap(periods, self._occurrences(room_code, first_day, last_day)):
+                    return False
+
+            for i, booking in enumerate(bookings):
+                booking.id = self._last_booking_id + i + 1
+            self._write(_INSERT_BOOKINGS, [
+                [booking.id, booking.author, booking.start_hour, booking.end_hour, booking.room_code]
+                for booking in bookings
+            ])
+            for booking in bookings:
+                self._add_booking(booking)
+        return True
+
+    def delete_booking(self, booking: BookingRecord) -> None:
+        with self._lock:
+            if booking.id in self._bookings:
+                self._write(_DELETE_BOOKING, booking.id)
+                self._remove_booking(booking.id)
+
+    #
+    # Recurring bookings:
+    #
+    def get_recurring_booking(self, id: int) -> Optional[RecurringBooking]:
+        return self._recurring_bookings.get(id)
+
+    def all_recurring_bookings(self) -> List[RecurringBooking]:
+        with self._lock:
+            return list(self._recurring_bookings.values())
+
+    def recurring_bookings_between(
+        self,
+        first_day: dt.date,
+        last_day: dt.date,
+        *,
+        author: Optional[str] = None,
+        room_code: Optional[str] = None,
+    ) -> List[RecurringBooking]:
+        end = dt.datetime.combine(last_day + dt.timedelta(days=1), dt.time())
+        with self._lock:
+            return [
+                recurring_booking for recurring_booking in self._recurring_bookings.values()
+                if recurring_booking.local_start_datetime < end and recurring_booking.until >= first_day
+                and (author is None or recurring_booking.author == author)
+                and (room_code is None or recurring_booking.room_code == room_code)
+            ]
+
+    def insert_recurring_booking(self, recurring_booking: RecurringBooking) -> bool:
+        # (stored like the database would, in the local time of the room, with the default interval)
+        recurring_booking.start_datetime = recurring_booking.local_start_datetime
+        if recurring_booking.interval is None:
+            recurring_booking.interval = 1
+
+        # Get the periods of the occurrences, and all the periods already booked in the room during their whole range:
+        room_code, tz = recurring_booking.room_code, room_catalog.time_zone(recurring_booking.room_code)
+        first_day, last_day = recurring_booking.local_start_datetime.date(), recurring_booking.until
+        occurrences = occurrence_periods(recurring_booking, first_day, last_day)
+        with self._lock:
+            room_bookings = self._room_bookings.get(room_code, _RoomBookings())
+            booked_periods = room_bookings.periods_between(
+                day_hours(tz, first_day)[0], day_hours(tz, last_day + dt.timedelta(days=1))[1]
+            )
+            other_occurrences = self._occurrences(
+                room_code, first_day - dt.timedelta(days=1), last_day + dt.timedelta(days=1)
+            )
+
+            # Insert it only if there is no overlap:
+            if overlap(occurrences, booked_periods) or overlap(occurrences, other_occurrences):
+                return False
+            recurring_booking.id = self._last_recurring_booking_id + 1
+            self._write(_INSERT_RECURRING_BOOKING, _recurring_booking_row(recurring_booking))
+            self._add_recurring_booking(recurring_booking)
+        return True
+
+    def delete_recurring_booking(self, recurring_booking: RecurringBooking) -> None:
+        with self._lock:
+            if recurring_booking.id in self._recurring_bookings:
+                self._write(_DELETE_RECURRING_BOOKING, recurring_booking.id)
+                self._remove_recurring_booking(recurring_booking.id)
+
+    #
+    # Daily usage of the rooms:
+    #
+    def _days(self, usage_per_day: Dict[dt.date, Any], first_day: dt.date, last_day: dt.date) -> Iterable[dt.date]:
+        """The days of the range having a usage, read from whichever of the range or the usage is the shortest."""
+        days_in_range = (last_day - first_day).days + 1
+        if len(usage_per_day) <= days_in_range:
+            return [day for day in usage_per_day if first_day <= day <= last_day]
+        days = (first_day + dt.timedelta(days=i) for i in range(days_in_range))
+        return [day for day in days if day in usage_per_day]
+
+    def booked_hours_per_room(self, room_codes: List[str], first_day: dt.date, last_day: dt.date) -> Dict[str, int]:
+        booked_hours = {}
+        with self._lock:
+            for room_code in room_codes:
+                room_days = self._room_day_usage.get(room_code, {})
+                days = self._days(room_days, first_day, last_day)
+                if days:
+                    booked_hours[room_code] = sum(room_days[day][0] for day in days)
+        return booked_hours
+
+    def day_bitmaps(self, room_codes: List[str], first_day: dt.date, last_day: dt.date) -> List[RoomDayBitmap]:
+        with self._lock:
+            return [
+                (room_code, day, room_days[day][1])
+                for room_code, room_days in ((code, self._room_day_usage.get(code, {})) for code in room_codes)
+                for day in self._days(room_days, first_day, last_day)
+            ]
+
+    def top_authors(
+        self, room_codes: List[str], first_day: dt.date, last_day: dt.date, limit: int
+    ) -> List[AuthorUsageRow]:
+        totals: Dict[str, List[int]] = {}
+        with self._lock:
+            for room_code in room_codes:
+                author_days = self._author_day_usage.get(room_code, {})
+                for day in self._days(author_days, first_day, last_day):
+                    for author, (bookings, booked_hours) in author_days[day].items():
+                        total = totals.setdefault(author, [0, 0])
+                        total[0] += bookings
+                        total[1] += booked_hours
+        ranked = sorted(totals.items(), key=lambda item: (-item[1][1], item[0]))
+        return [(author, bookings, booked_hours) for author, (bookings, booked_hours) in ranked[:limit]]
@@ -0,0 +1,424 @@
+"""
+Storage in the SQLite database, through the SQLAlchemy models.
+
+The requests work in the session of their thread. Double-bookings are prevented by the primary key of the
+booking_slots table, even between the transactions of concurrent processes.
+"""
+import datetime as dt
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import Date, and_, bindparam, func, literal_column, or_, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from configs import config
+from lib.catalog import room_catalog
+from lib.change_feed import BOOKING_CREATED, BOOKING_DELETED
+from lib.hours import day_hours, local_day
+from lib.sqlalchemy.models import (
+    AuthorDayUsage,
+    Booking,
+    BookingChange,
+    BookingSlot,
+    Building,
+    RecurringBooking,
+    Room,
+    RoomDayUsage,
+)
+from lib.sqlalchemy.session import current_session, new_session
+
+from .base import (
+    AuthorUsageRow,
+    BookingChangeRow,
+    BookingEventRow,
+    BookingPeriod,
+    BookingRow,
+    Period,
+    RoomDayBitmap,
+    RoomRow,
+    Storage,
+    day_usages,
+    occurrence_periods,
+    overlap,
+)
+
+
+_BOOKING_ROW_ENTITIES = (
+    Booking.id,
+    Booking.author,
+    Booking.start_hour,
+    Booking.duration.label("duration"),
+    Booking.room_code,
+    literal_column("NULL").label("recurring_booking_id"),
+)
+
+
+# The statements adding a usage to the daily rollups, then those removing one (along with the rows left empty), each
+# executed with the parameters of all the days at once:
+_ADD_USAGE = tuple(
+    text(statement).bindparams(bindparam("day", type_=Date)) for statement in (
+        """
+        INSERT INTO room_day_usage (room_code, day, booked_hours, hours_bitmap)
+        VALUES (:room_code, :day, :hours, :mask)
+        ON CONFLICT (room_code, day) DO UPDATE
+        SET booked_hours = booked_hours + excluded.booked_hours, hours_bitmap = hours_bitmap | excluded.hours_bitmap
+        """,
+        """
+        INSERT INTO author_day_usage (room_code, day, author, bookings, booked_hours)
+        VALUES (:room_code, :day, :author, :bookings, :hours)
+        ON CONFLICT (room_code, day, author) DO UPDATE
+        SET bookings = bookings + excluded.bookings, booked_hours = booked_hours + excluded.booked_hours
+        """,
+    )
+)
+_REMOVE_USAGE = tuple(
+    text(statement).bindparams(bindparam("day", type_=Date)) for statement in (
+        """
+        UPDATE room_day_usage SET booked_hours = booked_hours - :hours, hours_bitmap = hours_bitmap & ~:mask
+        WHERE room_code = :room_code AND day = :day
+        """,
+        "DELETE FROM room_day_usage WHERE room_code = :room_code AND day = :day AND booked_hours <= 0",
+        """
+        UPDATE author_day_usage SET bookings = bookings - :bookings, booked_hours = booked_hours - :hours
+        WHERE room_code = :room_code AND day = :day AND author = :author
+        """,
+        """
+        DELETE FROM author_day_usage
+        WHERE room_code = :room_code AND day = :day AND author = :author AND booked_hours <= 0
+        """,
+    )
+)
+
+
+def _roll_up(
+    db_session: Session, room_code: str, author: str, periods: List[Period], is_removed: bool = False
+) -> None:
+    """Add the usage of the room by the periods of the author to the rollups (or remove it), in the transaction."""
+    tz = room_catalog.time_zone(room_code)
+    parameters = [
+        {"room_code": room_code, "day": day, "author": author, "hours": hours, "mask": mask, "bookings": bookings}
+        for day, hours, mask, bookings in day_usages(tz, periods)
+    ]
+    if not parameters:
+        return
+    for statement in _REMOVE_USAGE if is_removed else _ADD_USAGE:
+        db_session.execute(statement, parameters)
+
+
+def _occurrences_per_room(
+    db_session: Session,
+    room_codes: List[str],
+    first_day: dt.date,
+    last_day: dt.date,
+    excluded_id: Optional[int] = None,
+) -> Dict[str, List[Period]]:
+    """The occurrences of the recurring bookings of the rooms starting from first_day to last_day (included)."""
+    recurring_bookings = db_session.query(RecurringBooking) \
+        .filter(RecurringBooking.room_code.in_(room_codes), RecurringBooking.occurs_between(first_day, last_day)) \
+        .filter(RecurringBooking.id != excluded_id) \
+        .all()
+    occurrences: Dict[str, List[Period]] = {}
+    for recurring_booking in recurring_bookings:
+        occurrences.setdefault(recurring_booking.room_code, []).extend(
+            occurrence_periods(recurring_booking, first_day, last_day)
+        )
+    return occurrences
+
+
+def _overlap_recurring_bookings(db_session: Session, bookings: List[Booking]) -> bool:
+    """
+    Return True if any of the bookings overlaps an occurrence of a recurring booking.
+    This must be checked in the writing transaction, after the bookings were flushed: the database is then locked, so
+    that no recurring booking can be created concurrently.
+    """
+    if not bookings:
+        return False
+    periods_per_room: Dict[str, List[Period]] = {}
+    for booking in bookings:
+        periods_per_room.setdefault(booking.room_code, []).append((booking.start_hour, booking.end_hour))
+    # (occurrences may overflow from the day before)
+    first_day = min(
+        local_day(start, room_catalog.time_zone(room_code))
+        for room_code, periods in periods_per_room.items() for start, _ in periods
+    )
+    last_day = max(
+        local_day(end - 1, room_catalog.time_zone(room_code))
+        for room_code, periods in periods_per_room.items() for _, end in periods
+    )
+    occurrences = _occurrences_per_room(
+        db_session, list(periods_per_room), first_day - dt.timedelta(days=1), last_day
+    )
+    return any(overlap(periods, occurrences.get(room_code, [])) for room_code, periods in periods_per_room.items())
+
+
+def _journal_change(
+    db_session: Session, room_code: str, booking: Optional[Booking] = None, kind: Optional[str] = None
+) -> None:
+    """
+    Journal, in the current transaction, the days of the room whose occupancy changes, for the indexes of the other
+    processes sharing the database, the first one along with the event followed by their clients (see
+    lib.change_feed). Without a booking, the change is about recurring bookings, i.e. about any day.
+    """
+    if not config.SYNC_INDEXES_BETWEEN_PROCESSES:
+        return
+    if booking is None:
+        db_session.add(BookingChange(room_code=room_code, day=None))
+        return
+    tz = room_catalog.time_zone(room_code)
+    first_day = local_day(booking.start_hour, tz)
+    last_day = local_day(booking.end_hour - 1, tz)
+    db_session.add(BookingChange(
+        room_code=room_code,
+        day=first_day,
+        kind=kind,
+        booking_id=booking.id,
+        author=booking.author,
+        start_hour=booking.start_hour,
+        duration=booking.duration,
+    ))
+    db_session.add_all(
+        BookingChange(room_code=room_code, day=first_day + dt.timedelta(days=i))
+        for i in range(1, (last_day - first_day).days + 1)
+    )
+
+
+def load_room_rows() -> List[RoomRow]:
+    """All the rooms of the database, along with the time zone of their building, in the order of their codes."""
+    db_session = new_session()
+    try:
+        return db_session \
+            .query(Room.code, Room.name, Room.floor, Room.capacity, Room.building_id, Building.tz_name) \
+            .join(Room.building) \
+            .order_by(Room.code) \
+            .all()
+    finally:
+        db_session.close()
+
+
+class SqlStorage(Storage):
+    """The tables of the SQLite database of the configured DATABASE_URI."""
+
+    @property
+    def journals_changes(self) -> bool:
+        return config.SYNC_INDEXES_BETWEEN_PROCESSES
+
+    def room_rows(self) -> List[RoomRow]:
+        return load_room_rows()
+
+    def new_booking(self, author: str, start_hour: int, end_hour: int, room_code: str) -> Booking:
+        return Booking(author=author, start_hour=start_hour, end_hour=end_hour, room_code=room_code)
+
+    def get_booking(self, id: int) -> Optional[Booking]:
+        return current_session().query(Booking).options(joinedload(Booking.room)).get(id)
+
+    def get_booking_row(self, id: int) -> Optional[BookingRow]:
+        return current_session().query(*_BOOKING_ROW_ENTITIES).filter(Booking.id == id).first()
+
+    def bookings_between(
+        self,
+        first_day: Optional[dt.date],
+        last_day: Optional[dt.date],
+        *,
+        author: Optional[str] = None,
+        room_code: Optional[str] = None,
+        after: Optional[Tuple[int, Optional[int]]] = None,
+        limit: Optional[int] = None,
+        as_rows: bool = False,
+        batch_size: int = 1000,
+    ) -> Iterable[Union[Booking, BookingRow]]:
+        query = current_session().query(*(_BOOKING_ROW_ENTITIES if as_rows else (Booking,)))
+        if author is not None:
+            query = query.filter(Booking.author == author)
+        if room_code is not None:
+            query = query.filter(Booking.room_code == room_code)
+        if first_day:
+            query = query.filter(Booking.starts_between(first_day, last_day, room_code))
+        if after:
+            start_hour, id = after
+            query = query.filter(
+                Booking.start_hour > start_hour if id is None else
+                or_(Booking.start_hour > start_hour, and_(Booking.start_hour == start_hour, Booking.id > id))
+            )
+        query = query.order_by(Booking.start_hour, Booking.id)
+        if limit is None:
+            return query.yield_per(batch_size)
+        return query.limit(limit).all()
+
+    def all_booking_periods(self, batch_size: int = 10000) -> Iterator[BookingPeriod]:
+        db_session = new_session()
+        try:
+            yield from db_session.query(Booking.room_code, Booking.start_hour, Booking.duration).yield_per(batch_size)
+        finally:
+            db_session.close()
+
+    def booking_periods(self, room_codes: Iterable[str], first_hour: int, end_hour: int) -> List[BookingPeriod]:
+        return current_session().query(Booking.room_code, Booking.start_hour, Booking.duration) \
+            .filter(Booking.room_code.in_(list(room_codes))) \
+            .filter(Booking.start_hour >= first_hour, Booking.start_hour < end_hour) \
+            .all()
+
+    def insert_bookings(self, bookings: List[Booking]) -> bool:
+        """
+        Insert the bookings along with one slot per booked hour, in a single transaction.
+
+        The check and the insertion are made atomic by the primary key of the booking_slots table: if any of the hours
+        was taken in the meantime (e.g. by a concurrent request), the whole transaction is rolled back. Bookings of
+        different rooms never conflict with each other.
+        """
+        db_session = current_session()
+        for booking in bookings:
+            booking.id = None  # (in case it was assigned during a rolled back attempt)
+            booking.slots = [BookingSlot(room_code=booking.room_code, hour=hour) for hour in booking.hours()]
+        db_session.add_all(bookings)
+        try:
+            db_session.flush()
+            is_conflicting = _overlap_recurring_bookings(db_session, bookings)
+        except IntegrityError:
+            is_conflicting = True
+        if is_conflicting:
+            db_session.rollback()
+            return False
+
+        for booking in bookings:
+            _journal_change(db_session, booking.room_code, booking, BOOKING_CREATED)
+            _roll_up(db_session, booking.room_code, booking.author, [(booking.start_hour, booking.end_hour)])
+        inserted_ids = [booking.id for booking in bookings]
+        db_session.commit()
+        # Reload the committed bookings with a single query, instead of one per booking on their next access:
+        db_session.query(Booking).options(joinedload(Booking.room)).filter(Booking.id.in_(inserted_ids)).all()
+        return True
+
+    def delete_booking(self, booking: Booking) -> None:
+        db_session = current_session()
+        db_session.delete(booking)
+        _journal_change(db_session, booking.room_code, booking, BOOKING_DELETED)
+        _roll_up(
+            db_session, booking.room_code, booking.author, [(booking.start_hour, booking.end_hour)], is_removed=True
+        )
+        db_session.commit()
+
+    def get_recurring_booking(self, id: int) -> Optional[RecurringBooking]:
+        return current_session().query(RecurringBooking).get(id)
+
+    def all_recurring_bookings(self) -> List[RecurringBooking]:
+        db_session = new_session()
+        try:
+            return db_session.query(RecurringBooking).all()
+        finally:
+            db_session.close()
+
+    def recurring_bookings_between(
+        self,
+        first_day: dt.date,
+        last_day: dt.date,
+        *,
+        author: Optional[str] = None,
+        room_code: Optional[str] = None,
+    ) -> List[RecurringBooking]:
+        query = current_session().query(RecurringBooking).filter(RecurringBooking.occurs_between(first_day, last_day))
+        if author is not None:
+            query = query.filter(RecurringBooking.author == author)
+        if room_code is not None:
+            query = query.filter(RecurringBooking.room_code == room_code)
+        return query.all()
+
+    def insert_recurring_booking(self, recurring_booking: RecurringBooking) -> bool:
+        """The occurrences are only expanded here, to be checked in the same transaction as the insertion."""
+        db_session = current_session()
+        db_session.add(recurring_booking)
+        db_session.flush()
+
+        # Get the periods of the occurrences, and all the periods already booked in the room during their whole range:
+        room_code, tz = recurring_booking.room_code, room_catalog.time_zone(recurring_booking.room_code)
+        first_day, last_day = recurring_booking.local_start_datetime.date(), recurring_booking.until
+        occurrences = occurrence_periods(recurring_booking, first_day, last_day)
+        booked_hours = db_session.query(BookingSlot.hour) \
+            .filter(BookingSlot.room_code == room_code) \
+            .filter(BookingSlot.hour >= day_hours(tz, first_day)[0]) \
+            .filter(BookingSlot.hour < day_hours(tz, last_day + dt.timedelta(days=1))[1]) \
+            .all()
+        other_occurrences = _occurrences_per_room(
+            db_session,
+            [room_code],
+            first_day - dt.timedelta(days=1),
+            last_day + dt.timedelta(days=1),
+            excluded_id=recurring_booking.id,
+        ).get(room_code, [])
+
+        # Insert it only if there is no overlap:
+        if overlap(occurrences, [(hour, hour + 1) for hour, in booked_hours]) or \
+                overlap(occurrences, other_occurrences):
+            db_session.rollback()
+            return False
+        _journal_change(db_session, room_code)
+        _roll_up(db_session, room_code, recurring_booking.author, occurrences)
+        db_session.commit()
+        return True
+
+    def delete_recurring_booking(self, recurring_booking: RecurringBooking) -> None:
+        db_session = current_session()
+        db_session.delete(recurring_booking)
+        _journal_change(db_session, recurring_booking.room_code)
+        occurrences = occurrence_periods(
+            recurring_booking, recurring_booking.local_start_datetime.date(), recurring_booking.until
+        )
+        _roll_up(db_session, recurring_booking.room_code, recurring_booking.author, occurrences, is_removed=True)
+        db_session.commit()
+
+    def booked_hours_per_room(self, room_codes: List[str], first_day: dt.date, last_day: dt.date) -> Dict[str, int]:
+        return dict(
+            current_session().query(RoomDayUsage.room_code, func.sum(RoomDayUsage.booked_hours))
+            .filter(RoomDayUsage.room_code.in_(room_codes), RoomDayUsage.day.between(first_day, last_day))
+            .group_by(RoomDayUsage.room_code)
+            .all()
+        )
+
+    def day_bitmaps(self, room_codes: List[str], first_day: dt.date, last_day: dt.date) -> List[RoomDayBitmap]:
+        return current_session().query(RoomDayUsage.room_code, RoomDayUsage.day, RoomDayUsage.hours_bitmap) \
+            .filter(RoomDayUsage.room_code.in_(room_codes), RoomDayUsage.day.between(first_day, last_day)) \
+            .all()
+
+    def top_authors(
+        self, room_codes: List[str], first_day: dt.date, last_day: dt.date, limit: int
+    ) -> List[AuthorUsageRow]:
+        booked_hours = func.sum(AuthorDayUsage.booked_hours)
+        return current_session().query(AuthorDayUsage.author, func.sum(AuthorDayUsage.bookings), booked_hours) \
+            .filter(AuthorDayUsage.room_code.in_(room_codes), AuthorDayUsage.day.between(first_day, last_day)) \
+            .group_by(AuthorDayUsage.author) \
+            .order_by(booked_hours.desc(), AuthorDayUsage.author) \
+            .limit(limit) \
+            .all()
+
+    def last_change_id(self) -> int:
+        db_session = new_session()
+        try:
+            return db_session.query(func.max(BookingChange.id)).scalar() or 0
+        finally:
+            db_session.close()
+
+    def changes_after(self, change_id: int) -> List[BookingChangeRow]:
+        return current_session().query(BookingChange.id, BookingChange.room_code, BookingChange.day) \
+            .filter(BookingChange.id > change_id) \
+            .order_by(BookingChange.id) \
+            .all()
+
+    def booking_events_after(self, event_id: int, limit: int) -> List[BookingEventRow]:
+        # (in a session of its own, not to keep reading the snapshot of the transaction of the polling thread)
+        db_session = new_session()
+        try:
+            return db_session.query(
+                BookingChange.id,
+                BookingChange.kind,
+                BookingChange.booking_id,
+                BookingChange.author,
+                BookingChange.room_code,
+                BookingChange.start_hour,
+                BookingChange.duration,
+            ) \
+                .filter(BookingChange.id > event_id) \
+                .filter(BookingChange.kind.isnot(None)) \
+                .order_by(BookingChange.id) \
+                .limit(limit) \
+                .all()
+        finally:
+            db_session.close()
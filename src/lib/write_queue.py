@@ -0,0 +1,104 @@
+"""
+Group commit of the bookings: a single writer thread drains the queue of the bookings to insert, and inserts them by
+batches, each one in a single transaction (a single journal write, with the in-memory storage engine).
+
+Under bursts of bookings, the requests then share the cost of the commits instead of each waiting for its own one in
+turn. The conflicts are checked like for the bookings in bulk: against the existing bookings, and against the previous
+bookings of the batch. Each request waits for the result of its own booking, once its batch is committed.
+"""
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from configs import config
+from lib.bookings import insert_booking, insert_bookings
+from lib.sqlalchemy.session import remove_current_session
+from lib.storage import AnyBooking
+
+
+class _PendingBooking:
+    """A booking waiting for its batch to be committed, then holding its result."""
+    __slots__ = ("booking", "is_inserted", "error", "done")
+
+    def __init__(self, booking: AnyBooking):
+        self.booking = booking
+        self.is_inserted = False
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class WriteQueue:
+    """
+    The queue of the bookings to insert, along with its writer thread (started on first use, e.g. after the fork of a
+    worker). Once it got a booking, the writer waits for the following ones during max_wait_in_seconds at most.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_in_seconds: float):
+        self._max_batch_size = max_batch_size
+        self._max_wait_in_seconds = max_wait_in_seconds
+        self._queue: "queue.Queue[_PendingBooking]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.bookings = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_forever, name="writer", daemon=True)
+                self._writer.start()
+
+    def insert(self, booking: AnyBooking) -> bool:
+        """Insert the booking in the next batch, and return whether it was inserted, once the batch is committed."""
+        self._ensure_started()
+        pending = _PendingBooking(booking)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.is_inserted
+
+    def _next_batch(self) -> List[_PendingBooking]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait_in_seconds
+        while len(batch) < self._max_batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_forever(self) -> None:
+        while True:
+            self._write(self._next_batch())
+
+    def _write(self, batch: List[_PendingBooking]) -> None:
+        try:
+            bookings = [pending.booking for pending in batch]
+            try:
+                insertions = insert_bookings(bookings)
+            except RuntimeError:
+                # (concurrent processes kept taking the same hours: give each booking its own chance)
+                insertions = [insert_booking(booking) for booking in bookings]
+            for pending, is_inserted in zip(batch, insertions):
+                pending.is_inserted = is_inserted
+        except Exception as error:
+            for pending in batch:
+                pending.error = error
+        finally:
+            # (the inserted bookings were loaded along with their room, and can be read once detached)
+            remove_current_session()
+            self.batches += 1
+            self.bookings += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {"batches": self.batches, "bookings": self.bookings, "largest_batch": self.largest_batch}
+
+
+# The queue shared by the whole process:
+write_queue = WriteQueue(config.WRITE_BATCH_MAX_SIZE, config.WRITE_BATCH_MAX_WAIT_IN_SECONDS)
@@ -0,0 +1,56 @@
+"""
+Serve the API in production: a pre-forked process per worker, each serving requests in threads (gunicorn).
+
+The application is only created in the workers, after the fork, so that each of them opens its own connections to
+the database and fills its own indexes. The writes of each worker are journaled in the database, and the other
+workers apply them to their indexes before any lookup (see SYNC_INDEXES_BETWEEN_PROCESSES).
+An in-memory storage engine (see STORAGE_ENGINE) belongs to a single process, so it is only served by one worker.
+Sending SIGHUP to the master process replaces the workers gracefully, e.g. to load a new version of the code.
+"""
+from typing import Any, Callable, Dict
+
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+
+from configs import config
+
+
+class PreForkServer(BaseApplication):
+    """A gunicorn server loading the application in each of its workers."""
+
+    def __init__(self, create_app: Callable[[], Flask], options: Dict[str, Any]):
+        self._create_app = create_app
+        self._options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self._options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> Flask:
+        return self._create_app()
+
+
+def _create_app() -> Flask:
+    # (imported in the worker, so that the engine of the database is not shared between processes)
+    from app import create_app
+
+    return create_app()
+
+
+def serve(workers: int) -> None:
+    """Serve the API with the given number of workers, until the master process is stopped."""
+    if config.STORAGE_ENGINE == "memory" and workers > 1:
+        raise ValueError("The in-memory storage engine cannot be shared between workers: serve it with a single one.")
+    PreForkServer(
+        _create_app,
+        {
+            "bind": config.BIND,
+            "workers": workers,
+            "worker_class": "gthread",
+            # (the streams of events hold their threads as long as they last: they get threads of their own)
+            "threads": config.WORKER_THREADS + config.CHANGE_FEED_MAX_STREAMS,
+            "graceful_timeout": config.GRACEFUL_TIMEOUT_IN_SECONDS,
+            "preload_app": False,
+        },
+    ).run()